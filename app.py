@@ -3,24 +3,27 @@ import streamlit as st
 st.set_page_config(page_title="CAIA Module 2 Chatbot", layout="wide")
 
 import os
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from langchain_community.vectorstores import FAISS
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain.chains.retrieval import create_retrieval_chain
-from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.chat_history import InMemoryChatMessageHistory
+from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, AIMessage
-
+from utils.backend_client import BACKEND_URL, BackendClient, new_session_id
+from utils.conversation_memory import SummaryBufferHistory
+from utils.module_registry import load_registry, routed_retriever
+from utils.qa_chain import MODULE_2_INDEX, capabilities_answer, create_qa_bot
+from utils.query_embeddings import query_embeddings
+from utils.semantic_cache import ANSWER_CACHE_FILE, SemanticCache
+from utils.single_flight import SingleFlight, flight_key
+from utils.tracing import METRICS_PORT, serve_metrics, tracer
 
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
 
-if not OPENAI_API_KEY:
+# With a backend the API key lives there; this script only renders
+if not OPENAI_API_KEY and not BACKEND_URL:
     st.warning("Surabhi has run out of credits.Please enter Your OpenAI API Key to continue.")
     OPENAI_API_KEY = st.text_input("OpenAI API Key:", type="password")
     if not OPENAI_API_KEY:
@@ -30,67 +33,90 @@ CURRENT_DIR = Path(__file__).parent
 DB_DIR = Path("db/vectorstore")
 
 @st.cache_resource
-def load_vector_db():
-    if not DB_DIR.exists():
+def load_modules():
+    """Every module in db/modules.json (or just DB_DIR); their stores open lazily on first use"""
+    return load_registry(db_dir=DB_DIR)
+
+@st.cache_resource
+def load_query_embeddings(version):
+    """
+    One cached query embedder for the answer cache, the module router and the
+    retrievers, so the question a turn looks up in the answer cache is not embedded again
+    """
+    return query_embeddings(load_modules().modules[0].db_path, OPENAI_API_KEY)
+
+@st.cache_resource
+def load_module_retriever(version):
+    modules = load_modules()
+    if not len(modules):
         st.error("❌ Error: Vector database not found! Please preprocess your files first.")
         st.stop()
-    
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-    return FAISS.load_local(str(DB_DIR), embeddings, allow_dangerous_deserialization=True)
-
-MODULE_2_INDEX = """
-📖 **Module 2: Advanced AI Applications and Ethics**
-- **Chapter 7**: Learning Recommender Systems
-- **Chapter 8**: Principles of Computer Vision
-- **Chapter 9**: Responsible and Ethical AI
-- **Chapter 10**: Data Strategies in Machine Learning
-"""
-
-def create_qa_bot(vectorstore):
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=OPENAI_API_KEY)
-    retriever = vectorstore.as_retriever(
-        search_type="mmr",
-        search_kwargs={"k": 5}
-    )
-
-    # Create history-aware retriever prompt
-    contextualize_q_prompt = ChatPromptTemplate.from_messages([
-        ("system", "Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language."),
-        MessagesPlaceholder("chat_history"),
-        ("human", "{input}")
-    ])
-    
-
-    history_aware_retriever = create_history_aware_retriever(
-        llm, retriever, contextualize_q_prompt
-    )
-
-    # Create the QA prompt template
-    qa_prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an AI tutor specializing in CAIA(Certified Artificial Intelligence Accelerator) Module 2: Advanced AI Applications and Ethics. 
-        You are NOT related to finance, investments, or portfolio management. 
-        Your goal is to help users understand AI concepts, machine learning strategies, recommender systems, 
-        computer vision, responsible AI, and data strategies.
-        
-        Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise."""),
-        MessagesPlaceholder("chat_history"),
-        ("human", "Context: {context}\n\nQuestion: {input}")
-    ])
-
-    # Create the question answering chain
-    question_answer_chain = create_stuff_documents_chain(llm, qa_prompt)
-    
-    # Create the retrieval chain
-    qa_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
-
-    return qa_chain
-
-vectorstore = load_vector_db()
-qa_bot = create_qa_bot(vectorstore)
-
-# Initialize chat history
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = InMemoryChatMessageHistory()
+
+    return routed_retriever(modules, load_query_embeddings(version))
+
+@st.cache_resource
+def load_answer_cache(version):
+    """Shared by every session; a rebuilt vectorstore has a new version and gets a fresh cache"""
+    answer_cache = SemanticCache(load_query_embeddings(version).embed_query, version)
+    # Answers precomputed offline with utils/batch_qa.py --fill-cache
+    answer_cache.load(ANSWER_CACHE_FILE, load_modules().fingerprint())
+    return answer_cache
+
+@st.cache_resource
+def load_qa_bot(version):
+    """One chain per vectorstore version, so the rewrite cache is shared by every session"""
+    return create_qa_bot(None, OPENAI_API_KEY, retriever=load_module_retriever(version))
+
+@st.cache_resource
+def load_answer_flights(version):
+    """Identical questions asked at the same time by different sessions share one chain call"""
+    return SingleFlight()
+
+@st.cache_resource
+def load_backend_client():
+    return BackendClient()
+
+@st.cache_resource
+def load_metrics_server():
+    """Per-stage latency, token and cache metrics for this process on CAIA_METRICS_PORT"""
+    return serve_metrics(METRICS_PORT)
+
+if METRICS_PORT:
+    load_metrics_server()
+
+def stream_answer(inputs):
+    """Yield answer tokens from the QA chain, logging time to first token and total time"""
+    started = time.perf_counter()
+    first_token_at = None
+    for chunk in qa_bot.stream(inputs):
+        if chunk.get("answer"):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            yield chunk["answer"]
+    finished = time.perf_counter()
+    ttft = (first_token_at or finished) - started
+    print(f"⏱️ Time to first token: {ttft:.2f}s, total generation: {finished - started:.2f}s")
+
+if BACKEND_URL:
+    # The backend owns the index, the chains, the caches and this session's history
+    backend = load_backend_client()
+else:
+    DB_VERSION = load_modules().version()
+    qa_bot, query_rewriter = load_qa_bot(DB_VERSION)
+    answer_cache = load_answer_cache(DB_VERSION)
+    answer_flights = load_answer_flights(DB_VERSION)
+
+if "session_id" not in st.session_state:
+    st.session_state.session_id = new_session_id()
+
+def new_chat_history():
+    """Last few turns verbatim, older ones summarised in the background to keep prompts bounded"""
+    summary_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=OPENAI_API_KEY)
+    return SummaryBufferHistory(summary_llm)
+
+# Initialize chat history (with a backend, it keeps the history by session id)
+if "chat_history" not in st.session_state and not BACKEND_URL:
+    st.session_state.chat_history = new_chat_history()
 
 #Streamlit Starts here
 
@@ -105,7 +131,10 @@ with st.sidebar:
 
     if st.button("🗑️ Clear Chat History"):
         st.session_state.messages = []
-        st.session_state.chat_history = InMemoryChatMessageHistory()
+        if BACKEND_URL:
+            backend.clear(st.session_state.session_id)
+        else:
+            st.session_state.chat_history = new_chat_history()
         st.rerun()  
 
 if "messages" not in st.session_state:
@@ -121,24 +150,44 @@ if prompt := st.chat_input("Ask me anything about CAIA Module 2!"):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    if any(keyword in prompt.lower() for keyword in [ "what can you do"]):
-        response = f"I can help you with \n{MODULE_2_INDEX}"
-        # Update chat history for special case too
+    with st.chat_message("assistant"):
+        if BACKEND_URL:
+            response = st.write_stream(backend.stream("/caia/chat", {
+                "session_id": st.session_state.session_id,
+                "message": prompt
+            }))
+        elif (response := capabilities_answer(prompt)) is not None:
+            st.markdown(response)
+        else:
+            # One trace per turn: rewrite, answer cache, embedding, retrieval, prompt stuffing and LLM spans
+            with tracer.trace("caia.turn") as turn:
+                history = st.session_state.chat_history.messages
+                # Follow-ups are rephrased once; the standalone question keys the answer cache and drives retrieval
+                standalone = query_rewriter.rewrite(prompt, history)
+                response = answer_cache.lookup(standalone)
+                turn.set(cached=response is not None)
+                if response is not None:
+                    st.markdown(response)
+                else:
+                    # Stream the chain's answer with chat history as it is generated, joining
+                    # an identical question already in flight instead of starting another call
+                    inputs = {
+                        "input": prompt,
+                        "standalone_input": standalone,
+                        "chat_history": history
+                    }
+                    response = st.write_stream(answer_flights.stream(
+                        flight_key(standalone, history), lambda: stream_answer(inputs)
+                    ))
+                    # A turn that joined another session's call has no answer LLM span of its own
+                    turn.set(coalesced=not any(span.name == "answer_llm" for span in turn.trace.spans))
+                    # Answers to follow-ups were shaped by this session's history, so only first turns are shared
+                    if not history:
+                        answer_cache.store(standalone, response)
+
+    # Update chat history with proper message types, including the special case
+    if not BACKEND_URL:
         st.session_state.chat_history.add_message(HumanMessage(content=prompt))
         st.session_state.chat_history.add_message(AIMessage(content=response))
-    else:
-        # Invoke the chain with chat history
-        result = qa_bot.invoke({
-            "input": prompt,
-            "chat_history": st.session_state.chat_history.messages
-        })
-        response = result["answer"]
-        
-        # Update chat history with proper message types
-        st.session_state.chat_history.add_message(HumanMessage(content=prompt))
-        st.session_state.chat_history.add_message(AIMessage(content=response)) 
 
-    with st.chat_message("assistant"):
-        st.markdown(response)
-    
-    st.session_state.messages.append({"role": "assistant", "content": response})
\ No newline at end of file
+    st.session_state.messages.append({"role": "assistant", "content": response})
@@ -1,9 +1,15 @@
 import streamlit as st
-from langchain.chat_models import ChatOpenAI
-from langchain.schema import SystemMessage, HumanMessage
-from langchain.memory import ConversationBufferMemory
+from langchain_openai import ChatOpenAI
+from langchain_core.messages import SystemMessage, HumanMessage
 import os
+import time
 from dotenv import load_dotenv
+from utils.backend_client import BACKEND_URL, BackendClient, new_session_id
+from utils.conversation_memory import SummaryBufferHistory
+from utils.prompt_usage import PromptUsage
+from utils.itinerary_cache import ItineraryCache, form_key, normalize_form, prompt_for
+from utils.travel_prompts import TRAVEL_PREFERENCES, TRAVEL_SYSTEM_PROMPT
+from utils.tracing import METRICS_PORT, callback_handler, serve_metrics, span, tracer
 
 # Load environment variables from .env file
 load_dotenv()
@@ -11,12 +17,34 @@ load_dotenv()
 # Load your OpenAI API key from environment variables or Streamlit secrets
 openai_api_key = os.getenv("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
 
-# Initialize Chat Model
-chat = ChatOpenAI(
-    temperature=0.7,
-    openai_api_key=openai_api_key,
-    model="gpt-4o-mini"  # or gpt-3.5-turbo
-)
+# Initialize Chat Model once per process rather than on every rerun
+@st.cache_resource
+def load_chat_model():
+    return ChatOpenAI(
+        temperature=0.7,
+        openai_api_key=openai_api_key,
+        model="gpt-4o-mini",  # or gpt-3.5-turbo
+        stream_usage=True,  # Report token usage, including cached prompt tokens, at the end of each stream
+        callbacks=[callback_handler]  # Each call becomes an "llm" span of the turn's trace
+    )
+
+@st.cache_resource
+def load_backend_client():
+    return BackendClient()
+
+@st.cache_resource
+def load_metrics_server():
+    """Per-stage latency, token and cache metrics for this process on CAIA_METRICS_PORT"""
+    return serve_metrics(METRICS_PORT)
+
+if METRICS_PORT:
+    load_metrics_server()
+
+if BACKEND_URL:
+    # The backend owns the LLM client, the caches and this session's history
+    backend = load_backend_client()
+else:
+    chat = load_chat_model()
 
 # App Configuration
 st.set_page_config(
@@ -102,12 +130,27 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = new_session_id()
+
 # Initialize conversation memory
-if "memory" not in st.session_state:
-    st.session_state.memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+if "memory" not in st.session_state and not BACKEND_URL:
+    # Recent turns verbatim, older ones summarised in the background so long planning sessions stay within budget
+    st.session_state.memory = SummaryBufferHistory(chat, max_tokens=6000)
+
+if "prompt_usage" not in st.session_state:
+    st.session_state.prompt_usage = PromptUsage()
+
+@st.cache_resource
+def load_itinerary_cache():
+    """Shared by every session and persisted across restarts"""
+    return ItineraryCache()
 
-# # Malaysia Travel Sidebar
-# with st.sidebar:
+if not BACKEND_URL:
+    itinerary_cache = load_itinerary_cache()
+
+# Malaysia Travel Sidebar
+with st.sidebar:
 #     st.markdown("""
 #     <div style="background: linear-gradient(45deg, #CC0001, #010066); padding: 15px; border-radius: 10px; margin-bottom: 20px;">
 #         <h3 style="color: white; margin: 0;">🇲🇾 Malaysia Travel Planner</h3>
@@ -181,9 +224,7 @@ if "memory" not in st.session_state:
         
         travel_preferences = st.multiselect(
             "🎯 Travel Preferences:",
-            ["Coastal/Beach", "Cultural/Heritage", "Nature/Wildlife", 
-             "Food Tour", "Kids Friendly", "Adventure Sports", 
-             "Shopping", "Nightlife", "Photography", "Budget Travel"]
+            TRAVEL_PREFERENCES
         )
         
         additional_notes = st.text_area(
@@ -202,40 +243,28 @@ if "memory" not in st.session_state:
                 'additional_notes': additional_notes
             }
             
-            # Create structured prompt for Malaysia itinerary
-            structured_prompt = f"""
-Create detailed Malaysia travel itineraries with these requirements:
-
-**Trip Details:**
-- Starting from: {starting_destination}
-- Budget per person: MYR {budget_per_pax}
-- Duration: {duration} days
-- Preferences: {', '.join(travel_preferences) if travel_preferences else 'General sightseeing'}
-- Additional notes: {additional_notes if additional_notes else 'None'}
-
-**Provide AT LEAST 2 different itinerary options** with complete details including:
-1. Day-by-day breakdown
-2. Transportation costs within Malaysia
-3. Accommodation recommendations
-4. Food suggestions
-5. Activity costs
-6. Total budget breakdown
-
-Focus only on destinations within Malaysia (Peninsular Malaysia and East Malaysia/Borneo).
-"""
+            # Normalised fields key the itinerary cache, so the prompt is built from them too
+            fields = normalize_form(starting_destination, budget_per_pax, duration, travel_preferences,
+                                    additional_notes)
+            structured_prompt = prompt_for(fields)
             
             # Add to chat
             if 'messages' not in st.session_state:
                 st.session_state.messages = []
             
             st.session_state.messages.append({"role": "user", "content": structured_prompt})
+            # Answered below the chat history after the rerun
+            st.session_state.pending_form = (form_key(fields), fields, structured_prompt)
             st.rerun()
 
     st.markdown("---")
     
     if st.button("🗑️ Clear Chat History", use_container_width=True):
         st.session_state.messages = []
-        st.session_state.memory.clear()
+        if BACKEND_URL:
+            backend.clear(st.session_state.session_id)
+        else:
+            st.session_state.memory.clear()
         if 'form_data' in st.session_state:
             del st.session_state.form_data
         st.rerun()
@@ -254,110 +283,43 @@ Focus only on destinations within Malaysia (Peninsular Malaysia and East Malaysi
     """, unsafe_allow_html=True)
 
 
-# Malaysia-Specific Travel System Prompt
-system_prompt = SystemMessage(
-    content="""
-You are Malaysia Travel Planner, an expert travel agent specializing EXCLUSIVELY in Malaysia tourism.
-
-## Your Expertise Area:
-**ONLY MALAYSIA** - You plan trips within Malaysia only (Peninsular Malaysia and East Malaysia/Borneo).
-
-## Core Mission:
-Create detailed Malaysia travel itineraries that showcase the country's diversity - from bustling KL to pristine Borneo rainforests.
-
-## MANDATORY Requirements:
-1. **Always provide AT LEAST 2 different itinerary options** for any request
-2. **Focus ONLY on destinations within Malaysia**
-3. **Include costs in Malaysian Ringgit (MYR)**
-4. **Consider domestic transportation** (flights, buses, trains, ferries within Malaysia)
-
-## For Malaysia Itineraries, Use This Structure:
-
-### **ITINERARY OPTION 1: [Theme Name]**
-1. ** Overview**: Theme, highlights, total cost per person
-2. ** Getting There**: From starting point to first Malaysian destination
-3. ** Accommodation**: Specific hotel/hostel recommendations with prices
-4. ** Day-by-Day Plan**: 
-   - Day 1: Location, activities, meals, costs
-   - Day 2: Location, activities, meals, costs
-   - [Continue for all days]
-5. ** Transportation**: Domestic travel costs (flights, buses, trains)
-6. ** Food Highlights**: Must-try Malaysian dishes and where to find them
-7. ** Total Budget**: Complete breakdown per person
-
-### **ITINERARY OPTION 2: [Alternative Theme Name]**
-[Same structure as Option 1]
+# Malaysia-Specific Travel System Prompt, kept byte-identical across requests for prompt caching
+system_prompt = SystemMessage(content=TRAVEL_SYSTEM_PROMPT)
 
-## Malaysia Regions to Consider:
-
-**Peninsular Malaysia:**
-- Kuala Lumpur & Selangor (KLCC, Batu Caves, Putrajaya)
-- Penang (Georgetown, food scene)
-- Malacca (Historical sites)
-- Cameron Highlands (Tea plantations, cool weather)
-- Langkawi (Beaches, duty-free)
-- Johor (Legoland, city attractions)
-- Pahang (Tioman Island, Genting Highlands)
-- Kelantan, Terengganu (East Coast beaches, culture)
-- Perak (Ipoh, heritage towns)
-- Kedah (Alor Setar, rice fields)
-
-**East Malaysia (Borneo):**
-- Sabah (Kota Kinabalu, Mount Kinabalu, Semporna)
-- Sarawak (Kuching, Miri, longhouses)
-- Labuan (Duty-free island)
-
-## Travel Themes to Offer:
--  **Coastal/Beach**: Langkawi, Tioman, Perhentian, Redang
--  **Cultural/Heritage**: KL, Penang, Malacca, Sarawak longhouses
--  **Nature/Wildlife**: Borneo, Taman Negara, Cameron Highlands
--  **Food Tour**: Penang, KL, Ipoh, Kuching
--  **Kids Friendly**: Legoland, Sunway Lagoon, Zoo Negara, Aquaria KLCC
--  **Adventure**: Mount Kinabalu, white water rafting, jungle trekking
-
-## Budget Considerations (MYR per person per day):
-- **Budget**: RM 80-150 (hostels, street food, public transport)
-- **Mid-range**: RM 150-300 (hotels, mix of local/restaurant food)
-- **Luxury**: RM 300+ (high-end hotels, fine dining)
-
-## Key Guidelines:
-- **Malaysia Only**: Never suggest destinations outside Malaysia
-- **Multiple Options**: Always provide at least 2 different itineraries
-- **Practical Details**: Include specific costs, transport schedules, booking tips
-- **Cultural Sensitivity**: Respect Malaysia's multicultural society (Malay, Chinese, Indian, indigenous)
-- **Seasonal Awareness**: Consider monsoons, festivals (CNY, Hari Raya, Deepavali)
-- **Local Experiences**: Street food, night markets, cultural festivals
-
-## Currency & Costs:
-- All prices in Malaysian Ringgit (MYR)
-- Include domestic flight costs (KL-Kota Kinabalu ~RM 200-400)
-- Bus costs (KL-Penang ~RM 35-50)
-- Accommodation ranges clearly stated
-
-## Safety & Cultural Notes:
-- Malaysia is generally safe for tourists
-- Respect religious customs (mosque visits, Ramadan)
-- Halal food considerations
-- Language: Bahasa Malaysia, English widely spoken
-- Tipping: Not mandatory but appreciated
-"""
-)
-
-def create_conversational_response(user_input, memory):
+def create_conversational_response(user_input, memory, prompt_usage, with_history=True):
+    """
+    Yields the reply token by token and stores the full exchange in memory once it is done.
+    Without history the reply depends on user_input alone, so it can be cached for every user.
+    """
     # Get conversation history
-    chat_history = memory.chat_memory.messages
+    chat_history = memory.messages if with_history else []
     
-    # Build messages for the API call
+    # Build messages for the API call: the unchanging system prompt and append-only history
+    # come first so they form a cacheable prefix, and only the new question varies
     messages = [system_prompt] + chat_history + [HumanMessage(content=user_input)]
     
-    # Get response from OpenAI
-    response = chat(messages)
+    # Stream response from OpenAI
+    started = time.perf_counter()
+    first_token_at = None
+    parts = []
+    usage = None
+    with tracer.trace("travel.turn"):
+        for chunk in chat.stream(messages):
+            if chunk.usage_metadata:
+                usage = chunk.usage_metadata
+            if chunk.content:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                parts.append(chunk.content)
+                yield chunk.content
+    finished = time.perf_counter()
+    ttft = (first_token_at or finished) - started
+    print(f"⏱️ Time to first token: {ttft:.2f}s, total generation: {finished - started:.2f}s")
+    prompt_usage.record(usage)
     
     # Store in memory
-    memory.chat_memory.add_user_message(user_input)
-    memory.chat_memory.add_ai_message(response.content)
-    
-    return response.content
+    memory.add_user_message(user_input)
+    memory.add_ai_message("".join(parts))
 
 # Initialize chat messages
 if "messages" not in st.session_state:
@@ -373,7 +335,39 @@ for message in st.session_state.messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
 
-    # Chat input
+# Quick Planning Form submissions: repeat combinations come straight from the itinerary cache
+if pending_form := st.session_state.pop("pending_form", None):
+    key, fields, structured_prompt = pending_form
+    with st.chat_message("assistant"):
+        try:
+            if BACKEND_URL:
+                response = st.write_stream(backend.stream("/travel/form", {
+                    "session_id": st.session_state.session_id,
+                    "fields": fields
+                }))
+            else:
+                with tracer.trace("travel.form") as turn:
+                    with span("itinerary_cache") as lookup:
+                        response = itinerary_cache.get(key)
+                        lookup.set(cache="miss" if response is None else "hit")
+                    turn.set(cached=response is not None)
+                    if response is not None:
+                        st.markdown(response)
+                        st.session_state.memory.add_user_message(structured_prompt)
+                        st.session_state.memory.add_ai_message(response)
+                    else:
+                        # Generated from the form alone, like the warm-up command, since every user with this form gets it
+                        response = st.write_stream(create_conversational_response(
+                            structured_prompt, st.session_state.memory, st.session_state.prompt_usage, with_history=False
+                        ))
+                        itinerary_cache.put(key, fields, response)
+            st.session_state.messages.append({"role": "assistant", "content": response})
+        except Exception as e:
+            error_msg = "🚨 Oops! I encountered an issue while planning your Malaysia trip. Please make sure your OpenAI API key is configured correctly and try again!"
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+
+# Chat input
 if prompt := st.chat_input("Ask me about Malaysia travel or describe your dream Malaysian adventure... 🇲🇾"):
     # Add user message to chat history
     st.session_state.messages.append({"role": "user", "content": prompt})
@@ -384,15 +378,22 @@ if prompt := st.chat_input("Ask me about Malaysia travel or describe your dream
     
     # Generate assistant response
     with st.chat_message("assistant"):
-        with st.spinner("🌱 Planning your sustainable adventure..."):
-            try:
-                response = create_conversational_response(prompt, st.session_state.memory)
-                st.markdown(response)
-                
-                # Add assistant response to chat history
-                st.session_state.messages.append({"role": "assistant", "content": response})
-                
-            except Exception as e:
-                error_msg = "🚨 Oops! I encountered an issue while planning your Malaysia trip. Please make sure your OpenAI API key is configured correctly and try again!\n\n💡 **Tip**: You can also use the Quick Planning Form in the sidebar for structured itinerary generation."
-                st.error(error_msg)
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+        try:
+            # Render the itinerary as it is generated instead of behind a spinner
+            if BACKEND_URL:
+                response = st.write_stream(backend.stream("/travel/chat", {
+                    "session_id": st.session_state.session_id,
+                    "message": prompt
+                }))
+            else:
+                response = st.write_stream(create_conversational_response(
+                    prompt, st.session_state.memory, st.session_state.prompt_usage
+                ))
+            
+            # Add assistant response to chat history
+            st.session_state.messages.append({"role": "assistant", "content": response})
+            
+        except Exception as e:
+            error_msg = "🚨 Oops! I encountered an issue while planning your Malaysia trip. Please make sure your OpenAI API key is configured correctly and try again!\n\n💡 **Tip**: You can also use the Quick Planning Form in the sidebar for structured itinerary generation."
+            st.error(error_msg)
+            st.session_state.messages.append({"role": "assistant", "content": error_msg})
@@ -0,0 +1,270 @@
+"""
+Asyncio serving backend shared by the Streamlit apps.
+
+One process owns the LLM clients and their HTTP connection pools, the
+module vectorstores, the QA chain and every cache, and keeps each user's
+conversation by session id. The Streamlit scripts become thin clients
+that stream answers from it over server-sent events, so a rerun no longer
+rebuilds clients or reloads the index, and many sessions share one event
+loop instead of each blocking a script thread.
+
+    python backend.py --port 8800                      every module in db/modules.json
+    python backend.py --port 8800 --db db/vectorstore  just one store
+    CAIA_BACKEND_URL=http://127.0.0.1:8800 streamlit run app.py
+
+Endpoints (JSON bodies, SSE responses of {"token": ...} events followed by
+one {"done": true, "answer": ..., "cached": ...} event):
+
+    POST /caia/chat     {"session_id", "message"}
+    POST /travel/chat   {"session_id", "message"}
+    POST /travel/form   {"session_id", "fields"}   Quick Planning Form fields
+    POST /clear         {"session_id"}
+    GET  /health
+    GET  /metrics       Prometheus-style per-stage latency, token and cache metrics (utils/tracing.py)
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from aiohttp import web
+from dotenv import load_dotenv
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+from utils.conversation_memory import SummaryBufferHistory
+from utils.itinerary_cache import ItineraryCache, form_key, normalize_form, prompt_for
+from utils.module_registry import MODULES_FILE, ModuleRegistry, load_registry, routed_retriever
+from utils.prompt_usage import PromptUsage
+from utils.qa_chain import capabilities_answer, create_qa_bot
+from utils.query_embeddings import query_embeddings
+from utils.semantic_cache import ANSWER_CACHE_FILE, SemanticCache
+from utils.single_flight import AsyncSingleFlight, flight_key
+from utils.tracing import callback_handler, span, tracer
+from utils.travel_prompts import TRAVEL_SYSTEM_PROMPT
+
+DB_DIR = Path(os.getenv("CAIA_DB_DIR", "db/vectorstore"))
+MAX_CONCURRENT_GENERATIONS = 32  # LLM streams in flight; further requests queue here, not at the provider
+MAX_SESSIONS = 1000
+SESSION_IDLE_SECONDS = 2 * 3600
+
+
+class Session:
+    def __init__(self, summary_llm):
+        self.caia_history = SummaryBufferHistory(summary_llm)
+        self.travel_history = SummaryBufferHistory(summary_llm, max_tokens=6000)
+        self.prompt_usage = PromptUsage()
+        self.lock = asyncio.Lock()  # One turn at a time per session, so history stays in order
+        self.last_used = time.monotonic()
+
+
+class Backend:
+    def __init__(self, openai_api_key=None, modules=None, max_concurrent=MAX_CONCURRENT_GENERATIONS):
+        self.openai_api_key = openai_api_key
+        self.travel_chat = ChatOpenAI(temperature=0.7, model="gpt-4o-mini", openai_api_key=openai_api_key,
+                                      stream_usage=True, callbacks=[callback_handler])
+        self.summary_llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=openai_api_key)
+        self.itinerary_cache = ItineraryCache()
+        self.generation_slots = asyncio.Semaphore(max_concurrent)
+        self.sessions = OrderedDict()
+        self.answer_flights = AsyncSingleFlight()
+        self.stats = {"requests": 0, "cache_hits": 0, "errors": 0, "active": 0}
+
+        self.qa_bot = self.query_rewriter = self.answer_cache = self.embeddings = self.modules = None
+        modules = modules if modules is not None else load_registry(db_dir=DB_DIR)
+        if len(modules):
+            # Shared by the answer cache, the module router and the retrievers, so a question is embedded once per turn at most
+            self.embeddings = embeddings = query_embeddings(modules.modules[0].db_path, openai_api_key)
+            retriever = routed_retriever(modules, embeddings)
+            self.modules = retriever.indexes
+            self.qa_bot, self.query_rewriter = create_qa_bot(None, openai_api_key, retriever=retriever)
+            self.answer_cache = SemanticCache(embeddings.embed_query, modules.version())
+            self.answer_cache.load(ANSWER_CACHE_FILE, modules.fingerprint())
+        else:
+            print("⚠️ No module vectorstores; /caia/chat is disabled")
+
+    def session(self, session_id):
+        now = time.monotonic()
+        session = self.sessions.pop(session_id, None) or Session(self.summary_llm)
+        session.last_used = now
+        self.sessions[session_id] = session
+        # Oldest first, so stop at the first one that is still fresh
+        while self.sessions:
+            oldest_id, oldest = next(iter(self.sessions.items()))
+            if len(self.sessions) <= MAX_SESSIONS and now - oldest.last_used < SESSION_IDLE_SECONDS:
+                break
+            del self.sessions[oldest_id]
+        return session
+
+    async def caia_answer(self, session, message):
+        """Yields answer tokens, then a final (answer, cached) tuple"""
+        if self.qa_bot is None:
+            raise RuntimeError("Vector database not found on the backend")
+        canned = capabilities_answer(message)
+        if canned is not None:
+            yield canned, True
+            return
+        with tracer.trace("caia.turn") as turn:
+            history = session.caia_history.messages
+            standalone = await asyncio.to_thread(self.query_rewriter.rewrite, message, history)
+            cached = await asyncio.to_thread(self.answer_cache.lookup, standalone)
+            turn.set(cached=cached is not None)
+            if cached is not None:
+                yield cached, True
+                return
+            inputs = {"input": message, "standalone_input": standalone, "chat_history": history}
+
+            async def generate():
+                async with self.generation_slots:
+                    async for chunk in self.qa_bot.astream(inputs):
+                        if chunk.get("answer"):
+                            yield chunk["answer"]
+
+            # The same question with the same history from several sessions at once shares one chain call
+            parts = []
+            async for token in self.answer_flights.stream(flight_key(standalone, history), generate):
+                parts.append(token)
+                yield token
+            turn.set(coalesced=not any(span.name == "answer_llm" for span in turn.trace.spans))
+            answer = "".join(parts)
+            # Answers to follow-ups were shaped by this session's history, so only first turns are shared
+            if not history:
+                await asyncio.to_thread(self.answer_cache.store, standalone, answer)
+        yield answer, False
+
+    async def travel_answer(self, session, message, with_history=True):
+        history = session.travel_history.messages if with_history else []
+        messages = [SystemMessage(content=TRAVEL_SYSTEM_PROMPT)] + history + [HumanMessage(content=message)]
+        parts, usage = [], None
+        with tracer.trace("travel.turn"):
+            async with self.generation_slots:
+                async for chunk in self.travel_chat.astream(messages):
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                    if chunk.content:
+                        parts.append(chunk.content)
+                        yield chunk.content
+        session.prompt_usage.record(usage)
+        yield "".join(parts), False
+
+    async def form_answer(self, session, fields):
+        fields = normalize_form(**fields)
+        key = form_key(fields)
+        with tracer.trace("travel.form") as turn:
+            with span("itinerary_cache") as lookup:
+                cached = await asyncio.to_thread(self.itinerary_cache.get, key)
+                lookup.set(cache="miss" if cached is None else "hit")
+            turn.set(cached=cached is not None)
+            if cached is not None:
+                yield cached, True
+                return
+            # Generated from the form alone, like the warm-up command, since every user with this form gets it;
+            # the handler still adds the exchange to this session's history
+            async for item in self.travel_answer(session, prompt_for(fields), with_history=False):
+                if isinstance(item, tuple):
+                    await asyncio.to_thread(self.itinerary_cache.put, key, fields, item[0])
+                yield item
+
+
+async def send_event(response, payload):
+    await response.write(f"data: {json.dumps(payload)}\n\n".encode())
+
+
+def stream_handler(answer, history_of, user_text=lambda body: body["message"]):
+    """Wraps an answer generator in a JSON-in, SSE-out handler that also records the turn"""
+
+    async def handler(request):
+        backend = request.app["backend"]
+        body = await request.json()
+        session = backend.session(body["session_id"])
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        backend.stats["requests"] += 1
+        backend.stats["active"] += 1
+        try:
+            async with session.lock:
+                argument = body.get("fields") if "fields" in body else body["message"]
+                async for item in answer(backend, session, argument):
+                    if isinstance(item, tuple):
+                        text, cached = item
+                        backend.stats["cache_hits"] += cached
+                        history = history_of(session)
+                        history.add_user_message(user_text(body))
+                        history.add_ai_message(text)
+                        await send_event(response, {"done": True, "answer": text, "cached": cached})
+                    else:
+                        await send_event(response, {"token": item})
+        except Exception as e:
+            backend.stats["errors"] += 1
+            print(f"❌ {request.path} failed: {e}")
+            await send_event(response, {"error": str(e)})
+        finally:
+            backend.stats["active"] -= 1
+        await response.write_eof()
+        return response
+
+    return handler
+
+
+async def clear(request):
+    body = await request.json()
+    request.app["backend"].sessions.pop(body["session_id"], None)
+    return web.json_response({"cleared": True})
+
+
+async def health(request):
+    backend = request.app["backend"]
+    flights = backend.answer_flights
+    stats = dict(backend.stats, sessions=len(backend.sessions), caia=backend.qa_bot is not None,
+                 answer_calls=flights.calls, answers_coalesced=flights.coalesced)
+    if backend.modules is not None:
+        stats.update(modules_loaded=backend.modules.loaded, module_loads=backend.modules.loads,
+                     module_evictions=backend.modules.evictions)
+    if backend.query_rewriter is not None:
+        stats.update(backend.query_rewriter.stats())
+    if backend.embeddings is not None:
+        stats.update(query_embedding_hits=backend.embeddings.memory_hits + backend.embeddings.disk_hits,
+                     query_embedding_misses=backend.embeddings.misses)
+    return web.json_response(stats)
+
+
+async def metrics(request):
+    return web.Response(body=tracer.metrics.render().encode(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+
+def create_app(openai_api_key=None, modules=None, max_concurrent=MAX_CONCURRENT_GENERATIONS):
+    app = web.Application()
+    app["backend"] = Backend(openai_api_key, modules, max_concurrent)
+    app.add_routes([
+        web.post("/caia/chat", stream_handler(Backend.caia_answer, lambda s: s.caia_history)),
+        web.post("/travel/chat", stream_handler(Backend.travel_answer, lambda s: s.travel_history)),
+        web.post("/travel/form", stream_handler(Backend.form_answer, lambda s: s.travel_history,
+                                                lambda body: prompt_for(normalize_form(**body["fields"])))),
+        web.post("/clear", clear),
+        web.get("/health", health),
+        web.get("/metrics", metrics),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve both chat apps from one asyncio process.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--modules", type=Path, default=MODULES_FILE, help="Module registry (see utils/module_registry.py)")
+    parser.add_argument("--db", type=Path, help="Serve this one vectorstore instead of the module registry")
+    parser.add_argument("--max-concurrent", type=int, default=MAX_CONCURRENT_GENERATIONS)
+    args = parser.parse_args()
+
+    load_dotenv()
+    modules = ModuleRegistry.single(args.db) if args.db else load_registry(args.modules, DB_DIR)
+    app = create_app(os.getenv("OPENAI_API_KEY"), modules, args.max_concurrent)
+    print(f"🚀 Backend listening on http://{args.host}:{args.port}")
+    web.run_app(app, host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
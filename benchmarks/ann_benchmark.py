@@ -0,0 +1,104 @@
+"""
+Recall-vs-latency benchmark for the FAISS index types the indexer can build.
+
+For each corpus size it builds every index type on the same synthetic
+clustered vectors and reports recall@k against exact flat search, p50/p99
+single-query latency, build time and serialized index size.
+
+    python benchmarks/ann_benchmark.py --sizes 10000,100000
+    python benchmarks/ann_benchmark.py --sizes 1000000 --dim 1536 --types hnsw,ivf,ivfpq   # needs ~20 GB RAM
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from utils.faiss_index import INDEX_TYPES, new_index
+
+
+def synthetic_corpus(n_vectors, dim, n_queries, seed=0):
+    """
+    Gaussian clusters around random centres, which is closer to real text
+    embeddings than uniform noise (where every ANN index looks bad).
+    Queries are perturbed corpus vectors.
+    """
+    rng = np.random.default_rng(seed)
+    n_clusters = max(10, n_vectors // 1000)
+    centres = rng.standard_normal((n_clusters, dim), dtype=np.float32)
+    vectors = np.empty((n_vectors, dim), dtype=np.float32)
+    for start in range(0, n_vectors, 100_000):
+        end = min(start + 100_000, n_vectors)
+        labels = rng.integers(0, n_clusters, end - start)
+        vectors[start:end] = centres[labels] + 0.5 * rng.standard_normal((end - start, dim), dtype=np.float32)
+    faiss.normalize_L2(vectors)
+
+    queries = vectors[rng.choice(n_vectors, n_queries, replace=False)]
+    queries = queries + 0.05 * rng.standard_normal(queries.shape, dtype=np.float32)
+    faiss.normalize_L2(queries)
+    return vectors, queries
+
+
+def recall_at_k(found, expected):
+    k = expected.shape[1]
+    return np.mean([len(set(f) & set(e)) / k for f, e in zip(found, expected)])
+
+
+def query_latencies(index, queries, k):
+    """Per-query latency in ms, one query at a time as the app issues them"""
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return np.asarray(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FAISS index types on synthetic corpora.")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma-separated corpus sizes")
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--types", default=",".join(INDEX_TYPES), help="Comma-separated index types")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=1, help="FAISS OpenMP threads for search")
+    args = parser.parse_args()
+
+    index_types = args.types.split(",")
+    build_threads = faiss.omp_get_max_threads()  # Build with every core, search with --threads
+    print(f"{'size':>9} {'index':>6} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'build s':>8} {'size MB':>8}")
+    for n_vectors in (int(size) for size in args.sizes.split(",")):
+        vectors, queries = synthetic_corpus(n_vectors, args.dim, args.queries)
+        ids = np.arange(n_vectors, dtype=np.int64)
+
+        exact = faiss.IndexFlatL2(args.dim)
+        exact.add(vectors)
+        _, expected = exact.search(queries, args.k)
+        del exact
+
+        for index_type in index_types:
+            faiss.omp_set_num_threads(build_threads)
+            started = time.perf_counter()
+            index = new_index(args.dim, index_type, vectors)
+            index.add_with_ids(vectors, ids)
+            build_seconds = time.perf_counter() - started
+
+            faiss.omp_set_num_threads(args.threads)
+            _, found = index.search(queries, args.k)
+            latencies = query_latencies(index, queries, args.k)
+            size_mb = faiss.serialize_index(index).nbytes / 1e6
+
+            print(f"{n_vectors:>9} {index_type:>6} {recall_at_k(found, expected):>9.3f} "
+                  f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} "
+                  f"{build_seconds:>8.1f} {size_mb:>8.1f}")
+            del index
+        del vectors
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmarks the batched embedding builder against the old one-request-per-chunk path,
+using the local fake OpenAI server so no network access or API key is needed.
+
+    python benchmarks/embedding_benchmark.py --chunks 2000 --latency 0.1
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from benchmarks.fake_openai_server import start_fake_server
+from utils.embedding_builder import BatchEmbedder
+
+VOCABULARY = ("recommender collaborative filtering vision convolution ethics bias fairness data strategy "
+              "labeling augmentation privacy model training evaluation accuracy user item matrix").split()
+
+
+def synthetic_chunks(count, words_per_chunk=80, seed=0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(VOCABULARY, k=words_per_chunk)) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--chunks", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.1, help="Fake server seconds per request")
+    parser.add_argument("--requests-per-second", type=int, default=0, help="Make the fake server reply 429 above this")
+    parser.add_argument("--serial-sample", type=int, default=100,
+                        help="Chunks embedded one per request to estimate the old path (it is slow)")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(latency=args.latency, requests_per_second=args.requests_per_second)
+    chunks = synthetic_chunks(args.chunks)
+    print(f"🧪 Fake server at {base_url}, {len(chunks)} chunks, {args.latency * 1000:.0f} ms per request")
+
+    # The old path: one request per chunk, one at a time
+    serial = BatchEmbedder(api_key="fake", base_url=base_url, batch_size=1, max_concurrent=1)
+    sample = chunks[:args.serial_sample]
+    serial.embed(sample)
+    estimated = serial.stats.seconds * len(chunks) / len(sample)
+    print(f"🐢 serial, 1 per request: {serial.stats} -> ~{estimated:.1f}s for all chunks")
+
+    for batch_size, max_concurrent in [(32, 1), (128, 1), (128, 4), (256, 8)]:
+        embedder = BatchEmbedder(api_key="fake", base_url=base_url, batch_size=batch_size,
+                                 max_concurrent=max_concurrent)
+        vectors = embedder.embed(chunks)
+        assert len(vectors) == len(chunks)
+        print(f"🚀 batch {batch_size:>3}, {max_concurrent} in flight: {embedder.stats} "
+              f"({estimated / embedder.stats.seconds:.0f}x faster)")
+
+    print(f"📊 Server saw {server.stats['rate_limited']} throttled requests")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
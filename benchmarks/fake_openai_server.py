@@ -0,0 +1,314 @@
+"""
+Local stand-in for the OpenAI embeddings and chat completions APIs, for
+benchmarking without network access.
+
+Chat completions simulate the provider's prompt cache: prompts of at least
+PROMPT_CACHE_MIN_TOKENS share cached prefixes in PROMPT_CACHE_BLOCK_TOKENS
+steps, cached tokens skip the simulated prefill time, and the usage block
+reports them as prompt_tokens_details.cached_tokens.
+
+Run it on its own and point the scripts at it:
+
+    python benchmarks/fake_openai_server.py --port 8900
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=fake python utils/preprocess_v3.2.py
+"""
+import argparse
+import base64
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+WORD_PATTERN = re.compile(r"\w+")
+CHARS_PER_TOKEN = 4
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_BLOCK_TOKENS = 128
+PROMPT_CACHE_ENTRIES = 10_000
+
+
+@lru_cache(maxsize=50_000)
+def _word_vector(word):
+    seed = int.from_bytes(hashlib.sha256(word.encode()).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(EMBEDDING_DIM).astype(np.float32)
+
+
+def fake_embedding(text):
+    """
+    Deterministic bag-of-words embedding: texts sharing words get similar
+    vectors, so retrieval over fake embeddings still behaves sensibly.
+    """
+    if isinstance(text, list):  # Token ids, as sent by langchain's OpenAIEmbeddings
+        words = [str(token) for token in text]
+    else:
+        words = WORD_PATTERN.findall(text.lower())
+    vector = np.zeros(EMBEDDING_DIM, dtype=np.float32)
+    for word in words or [""]:
+        vector += _word_vector(word)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def count_tokens(text):
+    if isinstance(text, list):
+        return len(text)
+    return max(1, len(text) // 4)
+
+
+def serialize_messages(messages):
+    parts = []
+    for message in messages:
+        content = message.get("content") or ""
+        if isinstance(content, list):  # Content parts
+            content = "".join(part.get("text", "") for part in content)
+        parts.append(f"<|{message.get('role')}|>{content}")
+    return "".join(parts)
+
+
+class PromptCache:
+    """Hashes of every cacheable prefix seen, oldest evicted first"""
+
+    def __init__(self, max_entries=PROMPT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.prefixes = OrderedDict()
+
+    def _prefix_hashes(self, prompt):
+        block_chars = PROMPT_CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        first = PROMPT_CACHE_MIN_TOKENS * CHARS_PER_TOKEN
+        digest = hashlib.sha256(prompt[:first].encode())
+        for end in range(first, len(prompt) + 1, block_chars):
+            if end > first:
+                digest.update(prompt[end - block_chars:end].encode())
+            yield end // CHARS_PER_TOKEN, digest.copy().hexdigest()
+
+    def lookup_and_store(self, prompt):
+        """Tokens of prompt's longest cached prefix; every prefix of prompt is cached afterwards"""
+        cached = 0
+        with self.lock:
+            for tokens, key in self._prefix_hashes(prompt):
+                if key in self.prefixes:
+                    self.prefixes.move_to_end(key)
+                    cached = tokens
+                else:
+                    self.prefixes[key] = True
+            while len(self.prefixes) > self.max_entries:
+                self.prefixes.popitem(last=False)
+        return cached
+
+
+class RateLimiter:
+    """Fixed one-second window of `requests_per_second` requests"""
+
+    def __init__(self, requests_per_second):
+        self.requests_per_second = requests_per_second
+        self.lock = threading.Lock()
+        self.window_start = time.monotonic()
+        self.count = 0
+
+    def acquire(self):
+        """Returns 0 when the request may proceed, otherwise seconds until the window resets"""
+        if not self.requests_per_second:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start, self.count = now, 0
+            if self.count < self.requests_per_second:
+                self.count += 1
+                return 0
+            return 1 - (now - self.window_start)
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        request = self._read_json()
+        config = self.server.config
+
+        wait = self.server.rate_limiter.acquire()
+        if wait:
+            self.server.stats["rate_limited"] += 1
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}}, {
+                "retry-after-ms": str(int(wait * 1000)),
+                "x-ratelimit-reset-requests": f"{int(wait * 1000)}ms",
+            })
+            return
+
+        if self.path.rstrip("/").endswith("/embeddings"):
+            self._embeddings(request, config)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._chat_completions(request, config)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def _embeddings(self, request, config):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        tokens = sum(count_tokens(text) for text in inputs)
+        time.sleep(config["latency"] + tokens / config["embedding_tokens_per_second"])
+
+        self.server.stats["embedding_requests"] += 1
+        self.server.stats["embedding_inputs"] += len(inputs)
+        # The openai client asks for base64 by default, which is far cheaper to encode than JSON floats
+        if request.get("encoding_format") == "base64":
+            encode = lambda vector: base64.b64encode(vector.tobytes()).decode()
+        else:
+            encode = lambda vector: vector.tolist()
+        data = [
+            {"object": "embedding", "index": i, "embedding": encode(fake_embedding(text))}
+            for i, text in enumerate(inputs)
+        ]
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "text-embedding-ada-002"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+
+    def _chat_completions(self, request, config):
+        prompt = serialize_messages(request.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // CHARS_PER_TOKEN)
+        cached_tokens = self.server.prompt_cache.lookup_and_store(prompt)
+        max_tokens = request.get("max_completion_tokens") or request.get("max_tokens") or config["reply_tokens"]
+        reply_words = reply_for(request.get("messages", []), min(max_tokens, config["reply_tokens"]))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(reply_words),
+            "total_tokens": prompt_tokens + len(reply_words),
+            "prompt_tokens_details": {"cached_tokens": cached_tokens},
+            "completion_tokens_details": {"reasoning_tokens": 0},
+        }
+        with self.server.stats_lock:
+            self.server.stats["chat_requests"] += 1
+            self.server.stats["chat_prompt_tokens"] += prompt_tokens
+            self.server.stats["chat_cached_tokens"] += cached_tokens
+
+        # Prefill only pays for the tokens that missed the prompt cache
+        time.sleep(config["latency"] + (prompt_tokens - cached_tokens) / config["prefill_tokens_per_second"])
+        model = request.get("model", "gpt-4o-mini")
+        created = int(time.time())
+        token_seconds = 1 / config["output_tokens_per_second"]
+        if not request.get("stream"):
+            time.sleep(len(reply_words) * token_seconds)
+            self._send_json(200, {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": "".join(reply_words)}}],
+                "usage": usage,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send_event(payload):
+            data = f"data: {payload if isinstance(payload, str) else json.dumps(payload)}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+        send_event(chunk({"role": "assistant", "content": ""}))
+        for word in reply_words:
+            time.sleep(token_seconds)
+            send_event(chunk({"content": word}))
+        send_event(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            send_event({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                        "model": model, "choices": [], "usage": usage})
+        send_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def reply_for(messages, n_tokens):
+    """Deterministic reply built from the words of the last user message"""
+    last = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+    words = WORD_PATTERN.findall(str(last)) or ["ok"]
+    return [("" if i == 0 else " ") + words[i % len(words)] for i in range(max(1, n_tokens))]
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # socketserver's default of 5 drops connections under load tests
+
+
+def start_fake_server(host="127.0.0.1", port=0, latency=0.05, embedding_tokens_per_second=1_000_000,
+                      requests_per_second=0, prefill_tokens_per_second=20_000, output_tokens_per_second=500,
+                      reply_tokens=200):
+    """
+    Start the fake server in a background thread.
+    Returns (server, base_url); call server.shutdown() when done.
+    """
+    server = FakeOpenAIServer((host, port), FakeOpenAIHandler)
+    server.config = {
+        "latency": latency,
+        "embedding_tokens_per_second": embedding_tokens_per_second,
+        "prefill_tokens_per_second": prefill_tokens_per_second,
+        "output_tokens_per_second": output_tokens_per_second,
+        "reply_tokens": reply_tokens,
+    }
+    server.rate_limiter = RateLimiter(requests_per_second)
+    server.prompt_cache = PromptCache()
+    server.stats_lock = threading.Lock()
+    server.stats = {"embedding_requests": 0, "embedding_inputs": 0, "rate_limited": 0,
+                    "chat_requests": 0, "chat_prompt_tokens": 0, "chat_cached_tokens": 0}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake OpenAI API server for offline benchmarks.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--embedding-tokens-per-second", type=float, default=1_000_000)
+    parser.add_argument("--requests-per-second", type=int, default=0, help="Reply 429 above this rate (0 = off)")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=20_000,
+                        help="Chat prompt tokens processed per second when not served from the prompt cache")
+    parser.add_argument("--output-tokens-per-second", type=float, default=500)
+    parser.add_argument("--reply-tokens", type=int, default=200, help="Length of every chat reply")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(args.host, args.port, args.latency, args.embedding_tokens_per_second,
+                                         args.requests_per_second, args.prefill_tokens_per_second,
+                                         args.output_tokens_per_second, args.reply_tokens)
+    print(f"🧪 Fake OpenAI server listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
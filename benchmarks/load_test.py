@@ -0,0 +1,180 @@
+"""
+Load test for backend.py: N concurrent chat sessions against a fake LLM.
+
+Starts the fake OpenAI server and the backend (as a separate process, as in
+production), then runs every session as a sequence of turns with a short
+think time between them. Reports throughput and the latency distribution
+of time to first token and of whole answers.
+
+    python benchmarks/load_test.py --sessions 50 --turns 4 --app travel
+    python benchmarks/load_test.py --sessions 50 --turns 4 --app caia
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import aiohttp
+import numpy as np
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from benchmarks.fake_openai_server import start_fake_server
+
+TOPICS = ["recommender systems", "collaborative filtering", "computer vision", "convolutional networks",
+          "responsible AI", "algorithmic bias", "data strategy", "feature engineering", "model drift",
+          "privacy", "explainability", "image segmentation", "matrix factorisation", "data labelling"]
+ASKS = ["What is", "Explain", "Give an example of", "Why does it matter to study", "Summarise"]
+PLACES = ["Penang", "Langkawi", "Malacca", "Kuching", "Ipoh", "Cameron Highlands", "Kota Kinabalu"]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def build_store(db_path, base_url, n_chunks):
+    from langchain_openai import OpenAIEmbeddings
+    from utils.embedding_builder import BatchEmbedder
+    from utils.faiss_index import build_vectorstore, docs_by_id, save_vectorstore_atomic
+
+    rng = random.Random(0)
+    chunks = [(f"Chapter {7 + i % 4}", " ".join(rng.choice(TOPICS) for _ in range(40))) for i in range(n_chunks)]
+    embedder = BatchEmbedder(api_key="fake", base_url=base_url)
+    embeddings = OpenAIEmbeddings(openai_api_key="fake", base_url=base_url, check_embedding_ctx_length=False)
+    save_vectorstore_atomic(build_vectorstore(docs_by_id(chunks), embedder, embeddings), db_path)
+
+
+def question(app, rng, session, turn):
+    if app == "caia":
+        return f"{rng.choice(ASKS)} {rng.choice(TOPICS)} and {rng.choice(TOPICS)} (s{session} t{turn})"
+    return f"Plan {rng.randint(2, 7)} days in {rng.choice(PLACES)} for RM {rng.randint(5, 30) * 100} (s{session} t{turn})"
+
+
+async def run_session(http, base_url, app, run, session, turns, think_time, results):
+    # Fresh questions per run, so later runs do not just hit the answer cache
+    rng = random.Random(f"{run}-{session}")
+    session_id = f"load-{run}-{session}"
+    for turn in range(turns):
+        payload = {"session_id": session_id, "message": question(app, rng, session, turn)}
+        started = time.perf_counter()
+        first_token = None
+        async with http.post(f"{base_url}/{app}/chat", json=payload) as response:
+            async for line in response.content:
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[6:])
+                if "error" in event:
+                    results["errors"] += 1
+                    break
+                if first_token is None:
+                    first_token = time.perf_counter()
+                if event.get("done"):
+                    results["cached"] += event["cached"]
+                    break
+        finished = time.perf_counter()
+        results["ttft"].append((first_token or finished) - started)
+        results["latency"].append(finished - started)
+        await asyncio.sleep(think_time * rng.random() * 2)
+
+
+async def run_load(base_url, app, sessions, turns, think_time):
+    run = time.time_ns()
+    results = {"ttft": [], "latency": [], "errors": 0, "cached": 0}
+    connector = aiohttp.TCPConnector(limit=0)
+    timeout = aiohttp.ClientTimeout(total=600)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        started = time.perf_counter()
+        await asyncio.gather(*(run_session(http, base_url, app, run, session, turns, think_time, results)
+                               for session in range(sessions)))
+        results["seconds"] = time.perf_counter() - started
+    return results
+
+
+def wait_until_up(base_url, backend, timeout=60):
+    import httpx
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if backend.poll() is not None:
+            raise RuntimeError("Backend exited during startup")
+        try:
+            return httpx.get(f"{base_url}/health").json()
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise TimeoutError("Backend did not start")
+
+
+@contextmanager
+def running_backend(fake_url, work_dir, app="caia", chunks=500, max_concurrent=32):
+    """
+    backend.py in its own process, talking to the fake server, with a synthetic
+    store for the CAIA app; yields its base URL
+    """
+    # Fake vectors stay out of the real query embedding cache
+    env = dict(os.environ, OPENAI_API_KEY="fake", OPENAI_BASE_URL=fake_url,
+               CAIA_QUERY_EMBEDDING_CACHE=str(Path(work_dir) / "query_embeddings.sqlite"))
+    db_path = Path(work_dir) / "vectorstore"
+    if app == "caia":
+        build_store(db_path, fake_url, chunks)
+    port = free_port()
+    backend = subprocess.Popen(
+        [sys.executable, str(CURRENT_DIR.parent / "backend.py"), "--port", str(port), "--db", str(db_path),
+         "--max-concurrent", str(max_concurrent)],
+        cwd=CURRENT_DIR.parent, env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_until_up(base_url, backend)
+        yield base_url
+    finally:
+        backend.terminate()
+        backend.wait()
+
+
+def percentiles(values):
+    return [np.percentile(values, q) * 1000 for q in (50, 95, 99)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent chat sessions against backend.py.")
+    parser.add_argument("--app", choices=["travel", "caia"], default="travel")
+    parser.add_argument("--sessions", default="10,50", help="Comma-separated numbers of concurrent sessions")
+    parser.add_argument("--turns", type=int, default=4)
+    parser.add_argument("--think-time", type=float, default=0.5, help="Mean seconds between a session's turns")
+    parser.add_argument("--max-concurrent", type=int, default=32, help="Backend generation slots")
+    parser.add_argument("--latency", type=float, default=0.2, help="Fake LLM seconds before the first token")
+    parser.add_argument("--output-tokens-per-second", type=float, default=200)
+    parser.add_argument("--reply-tokens", type=int, default=100)
+    parser.add_argument("--chunks", type=int, default=500, help="Synthetic vectorstore size for --app caia")
+    args = parser.parse_args()
+
+    server, fake_url = start_fake_server(latency=args.latency, output_tokens_per_second=args.output_tokens_per_second,
+                                         reply_tokens=args.reply_tokens)
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            with running_backend(fake_url, tmp, args.app, args.chunks, args.max_concurrent) as base_url:
+                print(f"{'sessions':>8} {'requests':>8} {'req/s':>7} {'errors':>6} {'cached':>6} "
+                      f"{'ttft p50/p95/p99 ms':>22} {'latency p50/p95/p99 ms':>25}")
+                for sessions in (int(n) for n in args.sessions.split(",") if n):
+                    results = asyncio.run(run_load(base_url, args.app, sessions, args.turns, args.think_time))
+                    requests = len(results["latency"])
+                    ttft = "/".join(f"{value:.0f}" for value in percentiles(results["ttft"]))
+                    latency = "/".join(f"{value:.0f}" for value in percentiles(results["latency"]))
+                    print(f"{sessions:>8} {requests:>8} {requests / results['seconds']:>7.1f} {results['errors']:>6} "
+                          f"{results['cached']:>6} {ttft:>22} {latency:>25}")
+        finally:
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
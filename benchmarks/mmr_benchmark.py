@@ -0,0 +1,98 @@
+"""
+Per-query cost of MMR retrieval as the corpus grows: LangChain's FAISS
+max_marginal_relevance_search against the pre-normalised VectorMatrix.
+
+Corpora are synthetic clustered 1536-dim vectors, and queries are given as
+vectors, so only the search and the MMR selection are timed (no embeddings
+calls). Allocations are the tracemalloc peak per query, which covers Python
+and NumPy memory but not FAISS's own C++ buffers.
+
+    python benchmarks/mmr_benchmark.py --sizes 1000,10000,50000
+"""
+import argparse
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from utils.faiss_index import build_vectorstore
+from utils.vector_matrix import VectorMatrix, normalize_rows, write_vector_matrix
+
+DIM = 1536
+
+
+class RandomEmbedder:
+    """Stands in for BatchEmbedder: unit vectors (like OpenAI's) drawn around topic centres"""
+
+    def __init__(self, n_topics, rng):
+        self.centres = rng.normal(size=(n_topics, DIM)).astype(np.float32)
+        self.rng = rng
+
+    def embed(self, texts):
+        topics = self.rng.integers(len(self.centres), size=len(texts))
+        return normalize_rows(self.centres[topics] + 0.5 * self.rng.normal(size=(len(texts), DIM)))
+
+
+def measure(search, queries):
+    """(mean ms, p95 ms, mean peak KiB) over the queries"""
+    seconds, peaks = [], []
+    for query in queries:
+        tracemalloc.start()
+        started = time.perf_counter()
+        search(query)
+        seconds.append(time.perf_counter() - started)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return np.mean(seconds) * 1000, np.percentile(seconds, 95) * 1000, np.mean(peaks) / 1024
+
+
+def main():
+    from langchain_community.embeddings import FakeEmbeddings
+    from langchain_core.documents import Document
+
+    parser = argparse.ArgumentParser(description="Compare LangChain FAISS MMR with the vectorised VectorMatrix MMR.")
+    parser.add_argument("--sizes", default="1000,10000,50000", help="Comma-separated corpus sizes")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    parser.add_argument("--lambda-mult", type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{'chunks':>7} {'engine':>10} {'mean ms':>8} {'p95 ms':>7} {'peak KiB':>9} {'same docs':>9}")
+    for size in (int(n) for n in args.sizes.split(",") if n):
+        rng = np.random.default_rng(size)
+        embedder = RandomEmbedder(max(1, size // 50), rng)
+        docs = {i: Document(page_content=f"chunk {i}", metadata={"section": f"Chapter {i % 4 + 7}"})
+                for i in range(size)}
+        vectorstore = build_vectorstore(docs, embedder, FakeEmbeddings(size=DIM), "flat")
+        queries = [vector.tolist() for vector in embedder.embed(range(args.queries))]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            write_vector_matrix(vectorstore, tmp)
+            matrix = VectorMatrix(tmp)
+
+            def langchain_mmr(query):
+                return [doc.page_content for doc, _ in vectorstore.max_marginal_relevance_search_with_score_by_vector(
+                    query, k=args.k, fetch_k=args.fetch_k, lambda_mult=args.lambda_mult)]
+
+            def matrix_mmr(query):
+                labels = matrix.mmr(query, args.k, args.fetch_k, args.lambda_mult)
+                return [vectorstore.docstore.search(vectorstore.index_to_docstore_id[label]).page_content
+                        for label in labels]
+
+            same = np.mean([langchain_mmr(query) == matrix_mmr(query) for query in queries])
+            for name, search in (("langchain", langchain_mmr), ("matrix", matrix_mmr)):
+                search(queries[0])  # Warm up page cache and lazy imports
+                mean_ms, p95_ms, peak_kib = measure(search, queries)
+                print(f"{size:>7} {name:>10} {mean_ms:>8.2f} {p95_ms:>7.2f} {peak_kib:>9.1f} {same:>9.0%}")
+            del matrix
+
+
+if __name__ == "__main__":
+    main()
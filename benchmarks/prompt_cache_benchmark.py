@@ -0,0 +1,128 @@
+"""
+Input tokens, prompt-cache hits and time to first token per turn of a
+travel-planner conversation, for three ways of laying out the history:
+
+    buffer   every turn verbatim (the old ConversationBufferMemory)
+    sliding  token-budgeted history that folds one turn per turn
+    blocks   token-budgeted history that folds turns in blocks (what the app uses)
+
+Runs against the local fake OpenAI server, which simulates prefix caching
+and charges prefill time only for uncached prompt tokens. Summaries are
+allowed to land between turns, as they do while the user reads the answer.
+
+    python benchmarks/prompt_cache_benchmark.py --turns 20
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_openai import ChatOpenAI
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from benchmarks.fake_openai_server import start_fake_server
+from utils.conversation_memory import SummaryBufferHistory
+from utils.prompt_usage import PromptUsage
+from utils.travel_prompts import TRAVEL_SYSTEM_PROMPT
+
+QUESTIONS = [
+    "Plan a 5-day trip from Kuala Lumpur for RM 1500 per person, we love street food.",
+    "Can you swap day 3 for something in the Cameron Highlands?",
+    "What is the cheapest way to get from Penang to Ipoh?",
+    "We are travelling with two kids aged 6 and 9, what should change?",
+    "Suggest halal-friendly places to eat in Georgetown.",
+    "How much should we budget for the ferry to Langkawi?",
+    "Is December a good month for the east coast islands?",
+    "Add a rainy-day backup for each day.",
+]
+
+
+class BufferHistory:
+    """Every message verbatim, no budget"""
+
+    def __init__(self):
+        self.messages = []
+
+    def add_user_message(self, text):
+        self.messages.append(HumanMessage(content=text))
+
+    def add_ai_message(self, text):
+        self.messages.append(AIMessage(content=text))
+
+    def wait(self):
+        pass
+
+
+def run_conversation(chat, memory, turns):
+    system_prompt = SystemMessage(content=TRAVEL_SYSTEM_PROMPT)
+    usage = PromptUsage()
+    rows = []
+    for turn in range(turns):
+        question = QUESTIONS[turn % len(QUESTIONS)] + f" (turn {turn + 1})"
+        messages = [system_prompt] + memory.messages + [HumanMessage(content=question)]
+        started = time.perf_counter()
+        first_token_at = None
+        parts, last_usage = [], None
+        for chunk in chat.stream(messages):
+            if chunk.usage_metadata:
+                last_usage = chunk.usage_metadata
+            if chunk.content:
+                first_token_at = first_token_at or time.perf_counter()
+                parts.append(chunk.content)
+        input_tokens, cached, _ = usage.record(last_usage)
+        rows.append((input_tokens, cached, (first_token_at or time.perf_counter()) - started))
+        memory.add_user_message(question)
+        memory.add_ai_message("".join(parts))
+        memory.wait()
+    return rows, usage
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare chat history layouts for prompt caching.")
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--reply-tokens", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=5_000)
+    parser.add_argument("--max-tokens", type=int, default=6000, help="History budget for sliding and blocks")
+    args = parser.parse_args()
+
+    server, base_url = start_fake_server(latency=args.latency, prefill_tokens_per_second=args.prefill_tokens_per_second,
+                                         output_tokens_per_second=100_000, reply_tokens=args.reply_tokens)
+
+    def new_chat():
+        return ChatOpenAI(model="gpt-4o-mini", api_key="fake", base_url=base_url, stream_usage=True)
+
+    layouts = {
+        "buffer": lambda: BufferHistory(),
+        "sliding": lambda: SummaryBufferHistory(new_chat(), max_tokens=args.max_tokens, fold_turns=0),
+        "blocks": lambda: SummaryBufferHistory(new_chat(), max_tokens=args.max_tokens),
+    }
+    results = {}
+    for name, make_memory in layouts.items():
+        # Every layout starts from a cold prompt cache
+        server.prompt_cache.prefixes.clear()
+        results[name] = run_conversation(new_chat(), make_memory(), args.turns)
+
+    print(f"{'turn':>4} " + " ".join(f"{name + ' in/cached/ttft':>30}" for name in layouts))
+    for turn in range(args.turns):
+        cells = []
+        for name in layouts:
+            input_tokens, cached, ttft = results[name][0][turn]
+            cells.append(f"{input_tokens:>12} {cached:>8} {ttft * 1000:>7.0f}ms")
+        print(f"{turn + 1:>4} " + " ".join(cells))
+
+    print()
+    print(f"{'layout':>8} {'input tokens':>13} {'cached %':>8} {'uncached':>9} {'mean ttft':>10}")
+    for name in layouts:
+        rows, usage = results[name]
+        mean_ttft = sum(row[2] for row in rows) / len(rows)
+        print(f"{name:>8} {usage.input_tokens:>13} {usage.cache_hit_rate:>8.0%} "
+              f"{usage.input_tokens - usage.cached_tokens:>9} {mean_ttft * 1000:>8.0f}ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Retrieval quality and latency of vector, BM25 and hybrid retrieval.
+
+Builds a store from the processed chunks in db/chunks/processed with the fake OpenAI
+server's embeddings (lexical bag-of-words vectors with a simulated network
+round trip), then runs three kinds of queries generated from the chunks,
+each with known relevant chunks:
+
+    keyword   a rare term of a chunk, optionally with its chapter ("Chapter 9 GDPR")
+    phrase    eight consecutive words of a chunk
+    question  a question built from a chunk's most distinctive words
+
+Reports hit rate@k, MRR, mean latency and embeddings calls per query.
+With --embedding-backend local the store and the queries are embedded by a
+sentence-transformers model on the CPU instead, with no network at all.
+
+    python benchmarks/retrieval_benchmark.py --queries 100
+    python benchmarks/retrieval_benchmark.py --embedding-backend local
+"""
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from benchmarks.fake_openai_server import start_fake_server
+from utils.bm25_index import BM25_FILE, BM25Index, tokenize
+from utils.chunk_store import load_chunks
+from utils.faiss_index import build_vectorstore, chunk_id, docs_by_id, save_vectorstore_atomic
+from utils.hybrid_retriever import HybridRetriever
+
+CHUNKS_DIR = CURRENT_DIR.parent / "db" / "chunks" / "processed"
+
+
+class VectorRetriever:
+    def __init__(self, hybrid):
+        self.hybrid = hybrid
+
+    def invoke(self, query):
+        return self.hybrid._documents(self.hybrid.vector_ranking(query)[:self.hybrid.k])
+
+
+class KeywordRetriever:
+    def __init__(self, hybrid):
+        self.hybrid = hybrid
+
+    def invoke(self, query):
+        return self.hybrid._documents([label for label, _ in self.hybrid.bm25.search(query, self.hybrid.k)])
+
+
+def make_queries(chunks, n_queries, rng):
+    """[(kind, query, relevant chunk ids)]"""
+    token_sets = [set(tokenize(f"{title}\n{content}")) for title, content, *_ in chunks]
+    document_frequency = {}
+    for tokens in token_sets:
+        for token in tokens:
+            document_frequency[token] = document_frequency.get(token, 0) + 1
+    ids = [chunk_id(title, content) for title, content, *_ in chunks]
+
+    queries = []
+    while len(queries) < n_queries:
+        i = rng.randrange(len(chunks))
+        title, content = chunks[i][:2]
+        words = content.split()
+        rare = sorted((t for t in token_sets[i] if len(t) > 3 and not t.isdigit()),
+                      key=lambda t: (document_frequency[t], t))
+        if len(words) < 12 or len(rare) < 3:
+            continue
+        term = rare[0]
+        relevant = {ids[j] for j, tokens in enumerate(token_sets) if term in tokens}
+        chapter = re.search(r"\d+", title)
+        keyword = f"Chapter {chapter.group()} {term.upper()}" if chapter and rng.random() < 0.5 else term.upper()
+        start = rng.randrange(len(words) - 8)
+        queries.append(("keyword", keyword, relevant))
+        queries.append(("phrase", " ".join(words[start:start + 8]), {ids[i]}))
+        queries.append(("question", f"What does the course say about {rare[1]}, {rare[2]} and {rare[0]}?", {ids[i]}))
+    return queries
+
+
+def evaluate(retriever, queries, server):
+    results = {}
+    for kind, query, relevant in queries:
+        calls_before = server.stats["embedding_requests"]
+        started = time.perf_counter()
+        docs = retriever.invoke(query)
+        elapsed = time.perf_counter() - started
+        found = [chunk_id(doc.metadata.get("section", ""), doc.page_content) for doc in docs]
+        rank = next((r for r, label in enumerate(found) if label in relevant), None)
+        row = results.setdefault(kind, {"hits": 0, "rr": 0.0, "seconds": 0.0, "calls": 0, "n": 0})
+        row["n"] += 1
+        row["hits"] += rank is not None
+        row["rr"] += 0 if rank is None else 1 / (rank + 1)
+        row["seconds"] += elapsed
+        row["calls"] += server.stats["embedding_requests"] - calls_before
+    return results
+
+
+def main():
+    from langchain_openai import OpenAIEmbeddings
+    from utils.mmap_store import load_mmap_vectorstore
+    from utils.query_embeddings import EMBEDDING_BACKENDS, document_embedder
+
+    parser = argparse.ArgumentParser(description="Compare vector, BM25 and hybrid retrieval.")
+    parser.add_argument("--chunks", type=Path, default=CHUNKS_DIR)
+    parser.add_argument("--queries", type=int, default=60, help="Queries of each kind")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake embeddings round trip in seconds")
+    parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default="openai",
+                        help="openai uses the fake server's embeddings, local a sentence-transformers model")
+    args = parser.parse_args()
+
+    chunks = load_chunks(args.chunks)
+    server, base_url = start_fake_server(latency=args.latency)
+    embedder = document_embedder(args.embedding_backend, "fake", base_url=base_url)
+    embeddings = embedder if args.embedding_backend == "local" else OpenAIEmbeddings(
+        openai_api_key="fake", base_url=base_url, check_embedding_ctx_length=False)
+    queries = make_queries(chunks, args.queries * 3, random.Random(0))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "store"
+        save_vectorstore_atomic(build_vectorstore(docs_by_id(chunks), embedder, embeddings), db_path)
+        vectorstore = load_mmap_vectorstore(db_path, embeddings)
+        hybrid = HybridRetriever(vectorstore=vectorstore, bm25=BM25Index(db_path / BM25_FILE), k=args.k)
+
+        round_trip = "local embeddings" if args.embedding_backend == "local" else \
+            f"{args.latency * 1000:.0f} ms embeddings round trip"
+        print(f"{len(chunks)} chunks, {len(queries)} queries, {round_trip}")
+        print(f"{'retriever':>9} {'queries':>8} {f'hit@{args.k}':>7} {'MRR':>6} {'mean ms':>8} {'embed calls':>12}")
+        for name, retriever in (("vector", VectorRetriever(hybrid)), ("bm25", KeywordRetriever(hybrid)),
+                                ("hybrid", hybrid)):
+            results = evaluate(retriever, queries, server)
+            for kind, row in sorted(results.items()):
+                print(f"{name:>9} {kind:>8} {row['hits'] / row['n']:>7.2f} {row['rr'] / row['n']:>6.2f} "
+                      f"{row['seconds'] / row['n'] * 1000:>8.1f} {row['calls'] / row['n']:>12.2f}")
+        print(f"hybrid routing: {hybrid.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Cold-start time and memory of FAISS.load_local on a pickled index.pkl store
+versus the memory-mapped store that replaced it.
+
+Each load runs in a fresh interpreter so nothing is shared between runs, and
+reports load time, first-query latency, RSS growth and anonymous memory
+growth. Anonymous memory is private to the process; the rest of the RSS is
+file-backed pages that several app replicas on one host share through the
+page cache. Synthetic stores also get the pickled index.pkl saved next to
+them for comparison; existing stores are only measured pickled if they still
+have one.
+
+    python benchmarks/store_load_benchmark.py --db db/vectorstore
+    python benchmarks/store_load_benchmark.py --synthetic 10000,100000
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+LOAD_SCRIPT = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+
+def memory_kb():
+    fields = {{}}
+    for line in open("/proc/self/smaps_rollup"):
+        parts = line.split()
+        if len(parts) == 3 and parts[2] == "kB":
+            fields[parts[0].rstrip(":")] = int(parts[1])
+    return fields["Rss"], fields["Anonymous"]
+
+import numpy as np
+from langchain_community.embeddings import FakeEmbeddings
+from langchain_community.vectorstores import FAISS
+from utils.mmap_store import load_mmap_vectorstore
+
+rss_before, anon_before = memory_kb()
+started = time.perf_counter()
+if {mode!r} == "mmap":
+    vectorstore = load_mmap_vectorstore({db!r}, FakeEmbeddings(size=1))
+else:
+    vectorstore = FAISS.load_local({db!r}, FakeEmbeddings(size=1), allow_dangerous_deserialization=True)
+load_seconds = time.perf_counter() - started
+
+query = np.random.default_rng(0).standard_normal(vectorstore.index.d).tolist()
+started = time.perf_counter()
+vectorstore.similarity_search_by_vector(query, k=5)
+query_seconds = time.perf_counter() - started
+
+rss_after, anon_after = memory_kb()
+print(json.dumps({{"load_ms": load_seconds * 1000, "query_ms": query_seconds * 1000,
+                  "rss_mb": (rss_after - rss_before) / 1024, "anon_mb": (anon_after - anon_before) / 1024}}))
+"""
+
+
+class RandomEmbedder:
+    def __init__(self, dim):
+        self.dim = dim
+        self.rng = np.random.default_rng(0)
+
+    def embed(self, texts):
+        return self.rng.standard_normal((len(texts), self.dim), dtype=np.float32)
+
+
+def build_synthetic_store(path, n_chunks, dim):
+    from langchain_community.embeddings import FakeEmbeddings
+    from utils.faiss_index import build_vectorstore, docs_by_id, save_vectorstore_atomic
+
+    words = "model data user item vision ethics bias filter matrix train".split()
+    rng = np.random.default_rng(0)
+    chunks = [(f"Chapter {i % 12}", " ".join(rng.choice(words, 80))) for i in range(n_chunks)]
+    vectorstore = build_vectorstore(docs_by_id(chunks), RandomEmbedder(dim), FakeEmbeddings(size=dim))
+    save_vectorstore_atomic(vectorstore, path)
+    vectorstore.save_local(str(path))  # The old pickled format, only for the comparison
+
+
+def measure(db_path, mode):
+    script = LOAD_SCRIPT.format(root=str(CURRENT_DIR.parent), mode=mode, db=str(db_path))
+    output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def report(label, db_path):
+    modes = ("pickle", "mmap") if (Path(db_path) / "index.pkl").exists() else ("mmap",)
+    for mode in modes:
+        result = measure(db_path, mode)
+        print(f"{label:>10} {mode:>7} {result['load_ms']:>9.1f} {result['query_ms']:>9.2f} "
+              f"{result['rss_mb']:>8.1f} {result['anon_mb']:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare pickle and memory-mapped vectorstore loading.")
+    parser.add_argument("--db", type=Path, help="Existing store with a chunks/ directory")
+    parser.add_argument("--synthetic", default="", help="Comma-separated chunk counts for synthetic stores")
+    parser.add_argument("--dim", type=int, default=1536)
+    args = parser.parse_args()
+
+    print(f"{'store':>10} {'loader':>7} {'load ms':>9} {'query ms':>9} {'RSS MB':>8} {'anon MB':>10}")
+    if args.db:
+        report(args.db.name, args.db)
+    for n_chunks in (int(n) for n in args.synthetic.split(",") if n):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "store"
+            build_synthetic_store(db_path, n_chunks, args.dim)
+            report(str(n_chunks), db_path)
+
+
+if __name__ == "__main__":
+    main()
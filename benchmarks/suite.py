@@ -0,0 +1,222 @@
+"""
+Offline benchmark suite with saved baselines and regression thresholds.
+
+Every scenario runs against the fake OpenAI server (benchmarks/fake_openai_server.py)
+with fixed latencies, token rates and seeds, so no network access or API
+key is needed and runs are comparable:
+
+    indexing    synthetic pages -> chunk_pages -> batched embeddings -> FAISS -> save_vectorstore_atomic
+    retrieval   vector, BM25, hybrid and MMR retrieval over the processed chunks, with hit rate@k
+    qa          end-to-end CAIA answers from backend.py under concurrent sessions
+
+Results are compared with benchmarks/baselines.json; a metric worse than
+its baseline by more than its threshold (THRESHOLDS: a relative tolerance
+plus an absolute slack, for metrics too small to compare relatively) is a
+regression, and the run exits with status 1. Baselines are per machine:
+save them with --save-baseline on the machine the suite gates.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --scenarios retrieval,qa --output results.json
+    python benchmarks/suite.py --save-baseline
+
+The apps and the preprocessing scripts run offline against the same server:
+
+    python benchmarks/fake_openai_server.py --port 8900
+    OPENAI_API_KEY=fake OPENAI_BASE_URL=http://127.0.0.1:8900/v1 streamlit run app_travel.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+CURRENT_DIR = Path(__file__).parent
+sys.path.append(str(CURRENT_DIR.parent))
+
+from benchmarks.embedding_benchmark import VOCABULARY
+from benchmarks.fake_openai_server import start_fake_server
+
+BASELINE_FILE = CURRENT_DIR / "baselines.json"
+SCENARIOS = ("indexing", "retrieval", "qa")
+
+# Fake server settings per scenario
+INDEXING_SERVER = {"latency": 0.05, "embedding_tokens_per_second": 1_000_000}
+RETRIEVAL_SERVER = {"latency": 0.0}
+QA_SERVER = {"latency": 0.2, "prefill_tokens_per_second": 20_000, "output_tokens_per_second": 200, "reply_tokens": 100}
+
+INDEXING_PAGES = 200
+INDEXING_WORDS_PER_PAGE = 400
+RETRIEVAL_QUERIES = 40  # Of each kind: keyword, phrase, question
+RETRIEVAL_K = 5
+QA_SESSIONS = 8
+QA_TURNS = 3
+QA_THINK_TIME = 0.1
+QA_CHUNKS = 500
+
+# metric -> (better, relative tolerance, absolute slack)
+THRESHOLDS = {
+    "indexing.chunks_per_second": ("higher", 0.25, 0.0),
+    "indexing.chunk_seconds": ("lower", 0.5, 0.05),
+    "retrieval.vector_ms": ("lower", 0.5, 1.0),
+    "retrieval.bm25_ms": ("lower", 0.5, 0.5),
+    "retrieval.hybrid_ms": ("lower", 0.5, 1.0),
+    "retrieval.mmr_ms": ("lower", 0.5, 1.0),
+    "retrieval.hybrid_hit_rate": ("higher", 0.0, 0.02),
+    "retrieval.mmr_hit_rate": ("higher", 0.0, 0.02),
+    "qa.ttft_p50_ms": ("lower", 0.3, 20.0),
+    "qa.ttft_p95_ms": ("lower", 0.3, 50.0),
+    "qa.latency_p95_ms": ("lower", 0.3, 50.0),
+    "qa.requests_per_second": ("higher", 0.25, 0.0),
+    "qa.errors": ("lower", 0.0, 0.0),
+}
+
+
+def synthetic_pages(n_pages, words_per_page, seed=0):
+    """(page_number, text) with a chapter heading every 10 pages and a section heading every other page"""
+    rng = random.Random(seed)
+    for page in range(1, n_pages + 1):
+        heading = ""
+        if page % 10 == 1:
+            heading = f"Chapter {page // 10 + 1} "
+        elif page % 2:
+            heading = f"Section {page // 10 + 1}.{page % 10} "
+        yield page, heading + " ".join(rng.choices(VOCABULARY, k=words_per_page))
+
+
+def run_indexing():
+    from langchain_community.embeddings import FakeEmbeddings
+    from utils.chunker import chunk_pages
+    from utils.embedding_builder import BatchEmbedder
+    from utils.faiss_index import build_vectorstore, docs_by_id, save_vectorstore_atomic
+
+    server, base_url = start_fake_server(**INDEXING_SERVER)
+    try:
+        started = time.perf_counter()
+        chunks = list(chunk_pages(synthetic_pages(INDEXING_PAGES, INDEXING_WORDS_PER_PAGE)))
+        chunked = time.perf_counter()
+        with tempfile.TemporaryDirectory() as tmp:
+            embedder = BatchEmbedder(api_key="fake", base_url=base_url)
+            vectorstore = build_vectorstore(docs_by_id(chunks), embedder, FakeEmbeddings(size=1536))
+            save_vectorstore_atomic(vectorstore, Path(tmp) / "store")
+        seconds = time.perf_counter() - started
+    finally:
+        server.shutdown()
+    return {"chunks": len(chunks), "chunk_seconds": chunked - started, "seconds": seconds,
+            "chunks_per_second": len(chunks) / seconds}
+
+
+def run_retrieval():
+    from langchain_openai import OpenAIEmbeddings
+    from benchmarks.retrieval_benchmark import CHUNKS_DIR, KeywordRetriever, VectorRetriever, evaluate, make_queries
+    from utils.bm25_index import BM25_FILE, BM25Index
+    from utils.chunk_store import load_chunks
+    from utils.embedding_builder import BatchEmbedder
+    from utils.faiss_index import build_vectorstore, docs_by_id, save_vectorstore_atomic
+    from utils.hybrid_retriever import HybridRetriever
+    from utils.mmap_store import load_mmap_vectorstore
+    from utils.vector_matrix import MatrixMMRRetriever, VectorMatrix
+
+    chunks = load_chunks(CHUNKS_DIR)
+    queries = make_queries(chunks, RETRIEVAL_QUERIES * 3, random.Random(0))
+    server, base_url = start_fake_server(**RETRIEVAL_SERVER)
+    results = {"chunks": len(chunks), "queries": len(queries)}
+    try:
+        embeddings = OpenAIEmbeddings(openai_api_key="fake", base_url=base_url, check_embedding_ctx_length=False)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "store"
+            embedder = BatchEmbedder(api_key="fake", base_url=base_url)
+            save_vectorstore_atomic(build_vectorstore(docs_by_id(chunks), embedder, embeddings), db_path)
+            vectorstore = load_mmap_vectorstore(db_path, embeddings)
+            hybrid = HybridRetriever(vectorstore=vectorstore, bm25=BM25Index(db_path / BM25_FILE), k=RETRIEVAL_K)
+            mmr = MatrixMMRRetriever(vectorstore=vectorstore, matrix=VectorMatrix(db_path), k=RETRIEVAL_K)
+            for name, retriever in (("vector", VectorRetriever(hybrid)), ("bm25", KeywordRetriever(hybrid)),
+                                    ("hybrid", hybrid), ("mmr", mmr)):
+                rows = evaluate(retriever, queries, server).values()
+                n = sum(row["n"] for row in rows)
+                results[f"{name}_ms"] = sum(row["seconds"] for row in rows) / n * 1000
+                results[f"{name}_hit_rate"] = sum(row["hits"] for row in rows) / n
+    finally:
+        server.shutdown()
+    return results
+
+
+def run_qa():
+    from benchmarks.load_test import percentiles, run_load, running_backend
+
+    server, fake_url = start_fake_server(**QA_SERVER)
+    try:
+        with tempfile.TemporaryDirectory() as tmp, running_backend(fake_url, tmp, "caia", QA_CHUNKS) as base_url:
+            load = asyncio.run(run_load(base_url, "caia", QA_SESSIONS, QA_TURNS, QA_THINK_TIME))
+    finally:
+        server.shutdown()
+    ttft_p50, ttft_p95, _ = percentiles(load["ttft"])
+    _, latency_p95, _ = percentiles(load["latency"])
+    return {"sessions": QA_SESSIONS, "requests": len(load["latency"]), "ttft_p50_ms": ttft_p50,
+            "ttft_p95_ms": ttft_p95, "latency_p95_ms": latency_p95,
+            "requests_per_second": len(load["latency"]) / load["seconds"], "errors": load["errors"]}
+
+
+RUNNERS = {"indexing": run_indexing, "retrieval": run_retrieval, "qa": run_qa}
+
+
+def regressions(results, baselines):
+    """[(metric, value, baseline, limit)] for every thresholded metric worse than its baseline allows"""
+    found = []
+    for metric, (better, tolerance, slack) in THRESHOLDS.items():
+        scenario, name = metric.split(".")
+        if name not in results.get(scenario, {}) or name not in baselines.get(scenario, {}):
+            continue
+        value, baseline = results[scenario][name], baselines[scenario][name]
+        if better == "higher":
+            limit = baseline * (1 - tolerance) - slack
+            worse = value < limit
+        else:
+            limit = baseline * (1 + tolerance) + slack
+            worse = value > limit
+        if worse:
+            found.append((metric, value, baseline, limit))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite and compare with baselines.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios to run")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run's results as the baseline")
+    parser.add_argument("--output", type=Path, help="Also write this run's results as JSON")
+    args = parser.parse_args()
+
+    baselines = json.loads(args.baseline.read_text()) if args.baseline.exists() else {}
+    results = {}
+    for scenario in (name for name in args.scenarios.split(",") if name):
+        if scenario not in RUNNERS:
+            parser.error(f"Unknown scenario {scenario!r}, expected one of {SCENARIOS}")
+        print(f"🏃 {scenario}...")
+        results[scenario] = RUNNERS[scenario]()
+        for name, value in results[scenario].items():
+            baseline = baselines.get(scenario, {}).get(name)
+            compared = f" (baseline {baseline:.4g}, {value / baseline - 1:+.0%})" if baseline else ""
+            print(f"   {name:>20} {value:>10.4g}{compared}")
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        baselines.update({scenario: {name: round(value, 4) for name, value in metrics.items()}
+                          for scenario, metrics in results.items()})
+        args.baseline.write_text(json.dumps(baselines, indent=2) + "\n")
+        print(f"💾 Saved baseline to {args.baseline}")
+        return
+
+    found = regressions(results, baselines)
+    for metric, value, baseline, limit in found:
+        print(f"❌ {metric} regressed: {value:.4g} against baseline {baseline:.4g} (limit {limit:.4g})")
+    if found:
+        sys.exit(1)
+    print("✅ No regressions" if baselines else f"⚠️ No baseline at {args.baseline}; save one with --save-baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import re
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils import chunker
+from utils.chunker import chunk_pages, chunk_text
+from utils.tokenizer import count_tokens
+
+WORDS = "students learn how recommender systems rank items for each user from ratings and clicks".split()
+
+
+def words(n, offset=0):
+    return " ".join(WORDS[(offset + i) % len(WORDS)] for i in range(n))
+
+
+def spaced_tokens(text):
+    """Like tiktoken: a word costs one token with the space before it and two without"""
+    return len(re.findall(r" ?[^ ]+", text)) + (not text.startswith(" ") and bool(text))
+
+
+def test_chunks_match_the_document_and_stay_within_budget():
+    pages = [(1, "Preface text that is not chunked. Chapter 1 " + words(150)),
+             (2, words(150, 3) + "\n\n Section 1.2   " + words(80, 5)),
+             (3, words(200, 7))]
+    document = " ".join(re.sub(r"\s+", " ", text).strip() for _, text in pages)
+    chunks = list(chunk_pages(pages, chunk_tokens=60, overlap_tokens=15))
+
+    assert {title for title, _, _ in chunks} == {"Chapter 1", "Section 1.2"}
+    assert chunks[0][1].startswith("Chapter 1")
+    assert (chunks[0][2]["page_start"], chunks[-1][2]["page_end"]) == (1, 3)
+    for title, text, metadata in chunks:
+        assert text == document[metadata["char_start"]:metadata["char_end"]]
+        assert metadata["tokens"] == count_tokens(text) <= 60
+        assert "Preface" not in text
+    for (title, _, before), (next_title, text, after) in zip(chunks, chunks[1:]):
+        if title == next_title:
+            # Consecutive windows of a section share some words, but no more than the overlap
+            assert after["char_start"] < before["char_end"] < after["char_end"]
+            assert count_tokens(document[after["char_start"]:before["char_end"]]) <= 15
+        else:
+            assert text.startswith(next_title)
+
+
+def test_chunks_fill_the_budget_when_the_first_word_costs_more(monkeypatch):
+    monkeypatch.setattr(chunker, "count_tokens", spaced_tokens)
+    monkeypatch.setattr(chunker, "word_tokens", spaced_tokens)
+    chunks = list(chunk_text("Chapter 1 " + words(500), chunk_tokens=40, overlap_tokens=10))
+
+    # Words were once counted bare, two tokens each, so chunks held about half the budget
+    assert all(metadata["tokens"] == spaced_tokens(text) for _, text, metadata in chunks)
+    assert all(metadata["tokens"] == 40 for _, _, metadata in chunks[:-1])
+    assert chunks[-1][2]["tokens"] <= 40
+
+
+def test_heading_split_across_pages_starts_a_section():
+    chunks = list(chunk_pages([(1, "Chapter 1 " + words(30) + " Chapter"), (2, "2 " + words(30))],
+                              chunk_tokens=500, overlap_tokens=0))
+    assert [(title, metadata["page_start"], metadata["page_end"]) for title, _, metadata in chunks] == \
+        [("Chapter 1", 1, 1), ("Chapter 2", 1, 2)]
+
+
+def test_a_word_longer_than_the_budget_is_its_own_chunk():
+    chunks = list(chunk_text("Chapter 1 " + "x" * 400 + " " + words(5), chunk_tokens=20, overlap_tokens=5))
+    assert "x" * 400 in [text for _, text, _ in chunks]
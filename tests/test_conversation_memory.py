@@ -0,0 +1,114 @@
+import sys
+import threading
+import time
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.runnables import RunnableLambda
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.conversation_memory import SummaryBufferHistory
+
+
+class FakeSummarizer:
+    """Stands in for the chat model: records each prompt and answers with a numbered summary"""
+
+    def __init__(self, gate=None, error=None):
+        self.prompts = []
+        self.gate = gate
+        self.error = error
+        self.called = threading.Event()
+        self.llm = RunnableLambda(self._summarize)
+
+    def _summarize(self, prompt):
+        self.called.set()
+        if self.gate is not None:
+            self.gate.wait(5)
+        if self.error is not None:
+            raise self.error
+        self.prompts.append(prompt.to_string())
+        return f"summary {len(self.prompts)}"
+
+
+def add_turns(history, start, end, words=3):
+    for i in range(start, end):
+        history.add_message(HumanMessage(f"question {i} " + "word " * words))
+        history.add_message(AIMessage(f"answer {i} " + "word " * words))
+
+
+def test_short_chats_stay_verbatim():
+    summarizer = FakeSummarizer()
+    history = SummaryBufferHistory(summarizer.llm, keep_turns=3, fold_turns=4)
+    add_turns(history, 0, 7)
+    history.wait()
+    assert len(history.messages) == 14
+    assert (history.summary, history.summaries_run, summarizer.prompts) == ("", 0, [])
+
+
+def test_old_turns_are_folded_in_one_block():
+    summarizer = FakeSummarizer()
+    history = SummaryBufferHistory(summarizer.llm, keep_turns=3, fold_turns=4)
+    add_turns(history, 0, 8)
+    history.wait()
+
+    messages = history.messages
+    assert messages[0] == SystemMessage(content="Summary of the earlier conversation: summary 1")
+    assert [message.content.split()[1] for message in messages[1:]] == ["5", "5", "6", "6", "7", "7"]
+    assert len(summarizer.prompts) == 1
+    assert "User: question 4" in summarizer.prompts[0] and "question 5" not in summarizer.prompts[0]
+
+
+def test_history_only_grows_at_its_end_between_folds():
+    history = SummaryBufferHistory(FakeSummarizer().llm, keep_turns=3, fold_turns=4)
+    add_turns(history, 0, 8)
+    history.wait()
+    before = history.messages
+    add_turns(history, 8, 11)
+    after = history.messages
+    assert after[:len(before)] == before and len(after) == len(before) + 6
+
+
+def test_history_stays_within_the_token_budget_while_a_summary_is_pending():
+    gate = threading.Event()
+    history = SummaryBufferHistory(FakeSummarizer(gate).llm, max_tokens=300, keep_turns=2, fold_turns=20,
+                                   summary_tokens=50)
+    add_turns(history, 0, 6, words=40)
+    # The turns waiting for their summary no longer fit, so they are left out rather than shown in part
+    assert history.prompt_tokens <= 300
+    assert all(not isinstance(message, SystemMessage) for message in history.messages)
+    gate.set()
+    history.wait()
+    assert history.summaries_run >= 1
+    assert isinstance(history.messages[0], SystemMessage)
+    assert history.prompt_tokens <= 300
+
+
+def test_failed_summaries_keep_the_turns_for_the_next_fold(capsys):
+    summarizer = FakeSummarizer(error=RuntimeError("rate limited"))
+    history = SummaryBufferHistory(summarizer.llm, keep_turns=1, fold_turns=1)
+    add_turns(history, 0, 3)
+    history.wait()
+    assert "Could not summarise" in capsys.readouterr().out
+    assert history.summary == "" and len(history.messages) == 6
+
+    summarizer.error = None
+    add_turns(history, 3, 4)
+    history.wait()
+    assert history.summary == "summary 1"
+    assert "question 0" in summarizer.prompts[0]
+
+
+def test_clear_drops_a_summary_still_in_flight():
+    gate = threading.Event()
+    summarizer = FakeSummarizer(gate)
+    history = SummaryBufferHistory(summarizer.llm, keep_turns=1, fold_turns=1)
+    add_turns(history, 0, 3)
+    assert summarizer.called.wait(5)
+    history.clear()
+    gate.set()
+    deadline = time.monotonic() + 5
+    while not summarizer.prompts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.05)  # Lets the fold apply its result, if it wrongly would
+    assert (history.summary, history.messages) == ("", [])
@@ -0,0 +1,89 @@
+import sys
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.bm25_index import BM25Index, tokenize, write_bm25
+from utils.hybrid_retriever import HybridRetriever, is_keyword_query, reciprocal_rank_fusion
+
+TEXTS = [
+    "Chapter 9 covers GDPR fines and data protection duties",
+    "Chapter 2 introduces recommender systems and user ratings",
+    "Regular car servicing keeps the engine healthy",
+    "Maintenance windows are scheduled for the database servers",
+    "Chapter 9 reviews privacy by design",
+]
+# Words that mean the same share a dimension, so vector search finds what BM25 cannot
+CONCEPTS = {"automobile": "car", "vehicle": "car", "upkeep": "servicing"}
+
+
+class ConceptEmbeddings(Embeddings):
+    """Bag of words over a fixed vocabulary, with synonyms folded together; counts query embeddings"""
+
+    def __init__(self):
+        self.vocabulary = sorted({token for text in TEXTS for token in tokenize(text)})
+        self.queries = 0
+
+    def _embed(self, text):
+        vector = [0.0] * len(self.vocabulary)
+        for token in tokenize(text):
+            token = CONCEPTS.get(token, token)
+            if token in self.vocabulary:
+                vector[self.vocabulary.index(token)] += 1.0
+        return vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries += 1
+        return self._embed(text)
+
+
+def build(tmp_path):
+    embeddings = ConceptEmbeddings()
+    vectorstore = FAISS.from_texts(TEXTS, embeddings)
+    write_bm25(tmp_path / "bm25.npz", [(label, TEXTS[label], {}) for label in range(len(TEXTS))])
+    return HybridRetriever(vectorstore=vectorstore, bm25=BM25Index(tmp_path / "bm25.npz"), k=3), embeddings
+
+
+def test_reciprocal_rank_fusion_prefers_labels_in_both_rankings():
+    assert reciprocal_rank_fusion([[1, 2, 3], [3, 4]]) == [3, 1, 2, 4]
+    assert reciprocal_rank_fusion([[5], []]) == [5]
+
+
+def test_is_keyword_query():
+    assert is_keyword_query("Chapter 9")
+    assert is_keyword_query("GDPR fines")
+    assert is_keyword_query('"privacy by design"')
+    assert not is_keyword_query("how do recommender systems use ratings")
+    assert not is_keyword_query("Chapter 9 and what it says about the fines for companies")
+    assert not is_keyword_query("the")
+
+
+def test_keyword_lookup_skips_the_embeddings_call(tmp_path):
+    retriever, embeddings = build(tmp_path)
+    docs = retriever.invoke("GDPR fines")
+    assert docs[0].page_content == TEXTS[0]
+    assert embeddings.queries == 0
+    assert retriever.stats == {"bm25_only": 1, "hybrid": 0}
+
+
+def test_keyword_lookup_without_a_full_match_is_fused(tmp_path):
+    retriever, embeddings = build(tmp_path)
+    # No single chunk has both "Chapter 2" and "GDPR", so the vector ranking is needed
+    retriever.invoke("Chapter 2 GDPR")
+    assert embeddings.queries == 1
+    assert retriever.stats == {"bm25_only": 0, "hybrid": 1}
+
+
+def test_questions_fuse_keyword_and_vector_rankings(tmp_path):
+    retriever, embeddings = build(tmp_path)
+    contents = [doc.page_content for doc in retriever.invoke("what about automobile maintenance and upkeep")]
+    # "Maintenance" is a keyword hit; the car chunk only matches by meaning
+    assert TEXTS[2] in contents and TEXTS[3] in contents
+    assert embeddings.queries == 1
+    assert retriever.stats == {"bm25_only": 0, "hybrid": 1}
@@ -0,0 +1,78 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils import itinerary_cache
+from utils.itinerary_cache import BUDGET_BUCKET_MYR, ItineraryCache, form_key, normalize_form
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(itinerary_cache.time, "time", clock)
+    return clock
+
+
+def key_for(start, budget=1000):
+    fields = normalize_form(start, budget, 3, [])
+    return form_key(fields), fields
+
+
+def test_budgets_round_down_to_a_bucket():
+    assert normalize_form("KL", 1499, 3, [])["budget_per_pax"] == 1250
+    assert normalize_form("KL", 1500, 3, [])["budget_per_pax"] == 1500
+    # Below one bucket the budget is kept rather than rounded to zero
+    assert normalize_form("KL", BUDGET_BUCKET_MYR - 1, 3, [])["budget_per_pax"] == BUDGET_BUCKET_MYR - 1
+    assert key_for("Penang", 1010)[0] == key_for("Penang", 1240)[0] != key_for("Penang", 1250)[0]
+
+
+def test_equivalent_forms_share_a_key():
+    first = normalize_form("  kuala   lumpur ", 2000, "5", ["Food Tour", "Coastal/Beach"], " quiet  hotels ")
+    second = normalize_form("Kuala Lumpur", 2100, 5, ["Coastal/Beach", "Food Tour", "Food Tour"], "Quiet hotels")
+    assert first["starting_destination"] == "Kuala Lumpur"
+    assert first["preferences"] == ["Coastal/Beach", "Food Tour"]
+    assert form_key(first) == form_key(second)
+    assert form_key(first) != form_key(normalize_form("Kuala Lumpur", 2000, 5, ["Food Tour"], "quiet hotels"))
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = ItineraryCache(tmp_path / "cache.sqlite", ttl=60)
+    key, fields = key_for("Penang")
+    cache.put(key, fields, "Day 1: George Town")
+    clock.now += 60
+    assert cache.get(key) == "Day 1: George Town"
+    clock.now += 1
+    assert key not in cache
+    assert cache.get(key) is None
+    assert (cache.hits, cache.misses, len(cache)) == (1, 1, 0)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = ItineraryCache(tmp_path / "cache.sqlite", max_entries=2)
+    (a, a_fields), (b, b_fields), (c, c_fields) = key_for("Penang"), key_for("Malacca"), key_for("Ipoh")
+    cache.put(a, a_fields, "a")
+    clock.now += 1
+    cache.put(b, b_fields, "b")
+    clock.now += 1
+    assert cache.get(a) == "a"  # Now b is the least recently used
+    clock.now += 1
+    cache.put(c, c_fields, "c")
+    assert (a in cache, b in cache, c in cache) == (True, False, True)
+    assert len(cache) == 2
+
+
+def test_entries_survive_a_restart(tmp_path):
+    key, fields = key_for("Kota Kinabalu")
+    ItineraryCache(tmp_path / "cache.sqlite").put(key, fields, "Day 1: Mount Kinabalu")
+    assert ItineraryCache(tmp_path / "cache.sqlite").get(key) == "Day 1: Mount Kinabalu"
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.semantic_cache import SIMILARITY_THRESHOLD, SemanticCache, normalize_question
+
+
+class OrthogonalEmbeddings:
+    """A different unit vector per distinct text, so only exact-key lookups can hit"""
+
+    def __init__(self):
+        self.seen = {}
+
+    def __call__(self, text):
+        vector = np.zeros(64, dtype=np.float32)
+        vector[self.seen.setdefault(text, len(self.seen))] = 1.0
+        return vector
+
+
+def at_similarity(similarity):
+    """A unit vector with the given cosine similarity to [1, 0]"""
+    return np.array([similarity, np.sqrt(1 - similarity ** 2)], dtype=np.float32)
+
+
+def test_normalize_question_keeps_symbols():
+    assert normalize_question("  What is   C++? ") == "what is c++"
+    assert len({normalize_question(q) for q in ("What is C++?", "What is C#?", "What is C?")}) == 3
+
+
+def test_exact_lookup_does_not_mix_up_languages():
+    cache = SemanticCache(OrthogonalEmbeddings(), version="v1")
+    cache.store("What is C++?", "C++ is a language with classes.")
+    assert cache.lookup("what is c++") == "C++ is a language with classes."
+    assert cache.lookup("What is C#?") is None
+    assert cache.lookup("What is C?") is None
+
+
+def test_near_threshold_question_misses():
+    vectors = {
+        "How do I reset my password?": np.array([1.0, 0.0], dtype=np.float32),
+        "How do I reset my router?": at_similarity(SIMILARITY_THRESHOLD - 0.01),
+        "How can I reset my password?": at_similarity(SIMILARITY_THRESHOLD + 0.01),
+    }
+    cache = SemanticCache(vectors.__getitem__, version="v1")
+    cache.store("How do I reset my password?", "Use the forgot password link.")
+    assert cache.lookup("How do I reset my router?") is None
+    assert cache.lookup("How can I reset my password?") == "Use the forgot password link."
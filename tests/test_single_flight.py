@@ -0,0 +1,134 @@
+import asyncio
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.single_flight import AsyncSingleFlight, SingleFlight, flight_key
+
+
+def gated_stream(gate, tokens, error=None):
+    """make_stream for a call that waits for gate, streams tokens, then optionally fails"""
+    def make_stream():
+        gate.wait()
+        yield from tokens
+        if error is not None:
+            raise error
+    return make_stream
+
+
+def collect(stream, results, i):
+    try:
+        results[i] = list(stream)
+    except Exception as e:
+        results[i] = e
+
+
+def test_flight_key_ignores_formatting_but_not_history():
+    assert flight_key("What is  RAG?") == flight_key("what is rag?")
+    assert flight_key("What is RAG?") != flight_key("What is RAG?", [HumanMessage("hi"), AIMessage("hello")])
+    assert flight_key("it?", [HumanMessage("What is RAG?")]) != flight_key("it?", [HumanMessage("What is MMR?")])
+
+
+def test_concurrent_callers_share_one_call():
+    flights, gate, started = SingleFlight(), threading.Event(), []
+
+    def make_stream():
+        started.append(1)
+        return gated_stream(gate, ["Retrieval ", "augmented ", "generation"])()
+
+    streams = [flights.stream("key", make_stream) for _ in range(5)]
+    results = [None] * len(streams)
+    threads = [threading.Thread(target=collect, args=(stream, results, i)) for i, stream in enumerate(streams)]
+    for thread in threads:
+        thread.start()
+    gate.set()
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert results == [["Retrieval ", "augmented ", "generation"]] * 5
+    assert (len(started), flights.calls, flights.coalesced, flights.in_flight) == (1, 1, 4, 0)
+
+
+def test_an_abandoned_caller_does_not_stall_the_others():
+    flights, gate = SingleFlight(), threading.Event()
+    flights.stream("key", gated_stream(gate, ["a", "b"]))  # Never read
+    joined = flights.stream("key", gated_stream(gate, ["never", "started"]))
+    gate.set()
+    assert list(joined) == ["a", "b"]
+
+
+def test_errors_reach_every_caller_and_the_next_request_starts_fresh():
+    flights, gate = SingleFlight(), threading.Event()
+    streams = [flights.stream("key", gated_stream(gate, ["partial"], ValueError("upstream failed")))
+               for _ in range(3)]
+    gate.set()
+    for stream in streams:
+        tokens = []
+        with pytest.raises(ValueError, match="upstream failed"):
+            for token in stream:
+                tokens.append(token)
+        assert tokens == ["partial"]
+    assert (flights.calls, flights.coalesced, flights.errors) == (1, 2, 1)
+
+    assert list(flights.stream("key", gated_stream(gate, ["ok"]))) == ["ok"]
+    assert flights.calls == 2
+
+
+def test_different_keys_do_not_share_a_call():
+    flights, gate = SingleFlight(), threading.Event()
+    first = flights.stream("one", gated_stream(gate, ["1"]))
+    second = flights.stream("two", gated_stream(gate, ["2"]))
+    gate.set()
+    assert (list(first), list(second)) == (["1"], ["2"])
+    assert (flights.calls, flights.coalesced) == (2, 0)
+
+
+def async_gated_stream(gate, tokens, error=None):
+    async def make_stream():
+        await gate.wait()
+        for token in tokens:
+            yield token
+        if error is not None:
+            raise error
+    return make_stream
+
+
+async def async_collect(stream):
+    try:
+        return [token async for token in stream]
+    except Exception as e:
+        return e
+
+
+def test_async_callers_share_one_call():
+    async def scenario():
+        flights, gate = AsyncSingleFlight(), asyncio.Event()
+        streams = [flights.stream("key", async_gated_stream(gate, ["x", "y"])) for _ in range(4)]
+        tasks = [asyncio.create_task(async_collect(stream)) for stream in streams]
+        gate.set()
+        return flights, await asyncio.gather(*tasks)
+
+    flights, results = asyncio.run(scenario())
+    assert results == [["x", "y"]] * 4
+    assert (flights.calls, flights.coalesced, flights.in_flight) == (1, 3, 0)
+
+
+def test_async_errors_reach_every_caller():
+    async def scenario():
+        flights, gate = AsyncSingleFlight(), asyncio.Event()
+        streams = [flights.stream("key", async_gated_stream(gate, ["x"], RuntimeError("boom"))) for _ in range(2)]
+        tasks = [asyncio.create_task(async_collect(stream)) for stream in streams]
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        retry = await async_collect(flights.stream("key", async_gated_stream(gate, ["ok"])))
+        return flights, results, retry
+
+    flights, results, retry = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) and str(result) == "boom" for result in results)
+    assert retry == ["ok"]
+    assert (flights.calls, flights.coalesced, flights.errors) == (2, 1, 1)
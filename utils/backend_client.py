@@ -0,0 +1,40 @@
+import json
+import os
+import uuid
+
+import httpx
+
+BACKEND_URL = os.getenv("CAIA_BACKEND_URL")  # Unset: the apps run their chains in-process
+BACKEND_TIMEOUT = httpx.Timeout(10.0, read=120.0)
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+class BackendClient:
+    """Thin client for backend.py; one per Streamlit process, reusing its HTTP connections"""
+
+    def __init__(self, base_url=BACKEND_URL):
+        self.base_url = base_url.rstrip("/")
+        self.http = httpx.Client(base_url=self.base_url, timeout=BACKEND_TIMEOUT)
+
+    def stream(self, path, payload):
+        """Yields answer tokens from an SSE endpoint, ready for st.write_stream"""
+        with self.http.stream("POST", path, json=payload) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[len("data: "):])
+                if "error" in event:
+                    raise RuntimeError(event["error"])
+                if event.get("done"):
+                    if event["cached"]:
+                        # Cached answers arrive whole, without token events
+                        yield event["answer"]
+                    return
+                yield event["token"]
+
+    def clear(self, session_id):
+        self.http.post("/clear", json={"session_id": session_id}).raise_for_status()
@@ -0,0 +1,165 @@
+"""
+Answer a file of questions with the CAIA QA chain, without the UI.
+
+Reads JSONL with one {"question": ...} object per line (any other fields,
+such as an "id" or the expected answer, are passed through), then:
+
+    embed     every question in one batched call, reusing cached query embeddings
+    search    the retriever the app uses (module routing, hybrid or MMR), which
+              finds the question vectors in the query embedding cache
+    generate  answers from the retrieved chunks, --concurrency calls in flight
+
+and writes one JSONL line per question with the answer, the retrieved chunk
+ids, sections and modules, and timings per stage. The embed and search
+timings are the batch totals spread over the questions.
+
+    python utils/batch_qa.py questions.jsonl -o answers.jsonl --concurrency 8
+
+--fill-cache also adds every answer to db/answer_cache.npz, which the apps
+load at startup, so precomputed questions are answered without an LLM call.
+Answers are dropped once older than the answer cache TTL, so fill it shortly
+before it is needed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.chunk_store import chunk_id
+from utils.semantic_cache import ANSWER_CACHE_FILE, SemanticCache, normalize_question
+
+DB_DIR = Path(__file__).parent.parent / "db" / "vectorstore"
+CONCURRENCY = 8
+TOP_K = 5
+
+
+def read_questions(path):
+    records = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not record.get("question"):
+                raise ValueError(f"{path}:{line_number} has no \"question\"")
+            record.setdefault("id", line_number)
+            records.append(record)
+    return records
+
+
+def retrieve(retriever, questions, concurrency):
+    """(documents, chunk ids) per question, from the same retriever the app answers with"""
+    found = retriever.batch(questions, config={"max_concurrency": concurrency})
+    return [(docs, [chunk_id(doc.metadata.get("section", ""), doc.page_content) for doc in docs]) for docs in found]
+
+
+async def generate_answers(answer_chain, questions, retrieved, concurrency):
+    """
+    (answer, seconds) per question, with at most `concurrency` LLM calls in
+    flight; repeats of a question are answered once
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def answer(question, docs):
+        async with slots:
+            started = time.perf_counter()
+            reply = await answer_chain.ainvoke({"input": question, "context": docs, "chat_history": []})
+            return reply, time.perf_counter() - started
+
+    tasks = {}
+    for question, (docs, _) in zip(questions, retrieved):
+        key = normalize_question(question)
+        if key not in tasks:
+            tasks[key] = asyncio.ensure_future(answer(question, docs))
+    await asyncio.gather(*tasks.values())
+    return [tasks[normalize_question(question)].result() for question in questions]
+
+
+def main():
+    from dotenv import load_dotenv
+    from langchain_openai import ChatOpenAI
+    from utils.module_registry import MODULES_FILE, ModuleRegistry, load_registry, routed_retriever
+    from utils.qa_chain import create_answer_chain
+    from utils.query_embeddings import query_embeddings
+
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the CAIA QA chain.")
+    parser.add_argument("questions", type=Path, help="JSONL with a \"question\" field per line")
+    parser.add_argument("-o", "--output", type=Path, help="Answers JSONL (default: <questions>.answers.jsonl)")
+    parser.add_argument("--modules", type=Path, default=MODULES_FILE, help="Module registry the app serves")
+    parser.add_argument("--db", type=Path, help="Answer from this one vectorstore instead of the module registry")
+    parser.add_argument("--k", type=int, default=TOP_K, help="Chunks retrieved per question")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="LLM calls in flight")
+    parser.add_argument("--fill-cache", action="store_true", help="Also add the answers to the answer cache file")
+    parser.add_argument("--cache-file", type=Path, default=ANSWER_CACHE_FILE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    records = read_questions(args.questions)
+    if not records:
+        print(f"⚠️ No questions in {args.questions}")
+        return
+    questions = [record["question"] for record in records]
+    modules = ModuleRegistry.single(args.db) if args.db else load_registry(args.modules, DB_DIR)
+    if not len(modules):
+        print("❌ No module vectorstores to answer from")
+        sys.exit(1)
+    embeddings = query_embeddings(modules.modules[0].db_path, openai_api_key)
+    # The answer cache serves these answers in the app, so they must come from the context the app retrieves
+    retriever = routed_retriever(modules, embeddings, k=args.k)
+    answer_chain = create_answer_chain(ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=openai_api_key))
+    print(f"❓ {len(questions)} questions, {len(modules)} modules: {', '.join(module.name for module in modules)}")
+
+    started = time.perf_counter()
+    embeddings.embed_queries(questions)
+    embed_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    retrieved = retrieve(retriever, questions, args.concurrency)
+    search_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    answers = asyncio.run(generate_answers(answer_chain, questions, retrieved, args.concurrency))
+    generate_seconds = time.perf_counter() - started
+
+    output = args.output or args.questions.with_suffix(".answers.jsonl")
+    with open(output, "w") as f:
+        for record, (docs, chunk_ids), (answer, seconds) in zip(records, retrieved, answers):
+            f.write(json.dumps(dict(
+                record,
+                answer=answer,
+                chunk_ids=chunk_ids,
+                sections=[doc.metadata.get("section", "") for doc in docs],
+                modules=[doc.metadata.get("module", "") for doc in docs],
+                timings_ms={
+                    "embed": round(embed_seconds / len(records) * 1000, 2),
+                    "search": round(search_seconds / len(records) * 1000, 2),
+                    "generate": round(seconds * 1000, 1),
+                },
+            )) + "\n")
+
+    generate_ms = [seconds * 1000 for _, seconds in answers]
+    print(f"⚡ embed {embed_seconds * 1000:.0f} ms ({embeddings}), search {search_seconds * 1000:.1f} ms, "
+          f"generate {generate_seconds:.1f}s (per answer p50 {np.percentile(generate_ms, 50):.0f} ms, "
+          f"p95 {np.percentile(generate_ms, 95):.0f} ms)")
+    print(f"✅ Wrote {len(records)} answers to {output}")
+
+    if args.fill_cache:
+        answer_cache = SemanticCache(embeddings.embed_query, modules.version())
+        fingerprint = modules.fingerprint()
+        answer_cache.load(args.cache_file, fingerprint)
+        for question, (answer, _) in zip(questions, answers):
+            answer_cache.store(question, answer)
+        print(f"🗄️ Saved {answer_cache.save(args.cache_file, fingerprint)} answers to {args.cache_file}")
+
+
+if __name__ == "__main__":
+    main()
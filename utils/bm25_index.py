@@ -0,0 +1,144 @@
+"""
+Local BM25 keyword index over the stored chunks.
+
+Built next to index.faiss whenever a store is saved, as one compact
+bm25.npz of postings arrays (term -> chunk positions and term counts), so
+exact terms such as "Chapter 9" or acronyms are found without an
+embeddings call. Build one for an existing store with:
+
+    python utils/bm25_index.py db/vectorstore
+"""
+import re
+import sys
+from pathlib import Path
+
+import numpy as np
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+BM25_FILE = "bm25.npz"
+BM25_K1 = 1.2
+BM25_B = 0.75
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "of", "to", "in", "on", "for", "with", "and",
+    "or", "as", "by", "at", "it", "its", "this", "that", "these", "those", "from", "what", "which", "how",
+    "do", "does", "can", "i", "you", "we", "me", "about", "tell",
+}
+
+
+def tokenize(text):
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def searchable_text(text, metadata):
+    """Section titles are indexed with the chunk, so "Chapter 9" finds every chunk of that chapter"""
+    return f"{metadata.get('section', '')}\n{text}"
+
+
+def write_bm25(path, records):
+    """Build and save the index from (label, text, metadata) records"""
+    labels, doc_lengths, postings = [], [], {}
+    for position, (label, text, metadata) in enumerate(records):
+        tokens = tokenize(searchable_text(text, metadata))
+        labels.append(label)
+        doc_lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, count in counts.items():
+            postings.setdefault(token, []).append((position, count))
+
+    terms = sorted(postings)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(postings[term]) for term in terms])
+    flat = [entry for term in terms for entry in postings[term]]
+    np.savez_compressed(
+        path,
+        terms=np.frombuffer("\n".join(terms).encode("utf-8"), dtype=np.uint8),
+        offsets=offsets,
+        docs=np.asarray([doc for doc, _ in flat], dtype=np.int32),
+        tfs=np.asarray([min(tf, 65535) for _, tf in flat], dtype=np.uint16),
+        doc_lengths=np.asarray(doc_lengths, dtype=np.int32),
+        labels=np.asarray(labels, dtype=np.int64),
+    )
+    return len(labels)
+
+
+def has_bm25(db_path):
+    return (Path(db_path) / BM25_FILE).exists()
+
+
+class BM25Index:
+    """Okapi BM25 scoring over the postings arrays written by write_bm25"""
+
+    def __init__(self, path, k1=BM25_K1, b=BM25_B):
+        with np.load(path) as data:
+            terms = data["terms"].tobytes().decode("utf-8")
+            self.term_ids = {term: i for i, term in enumerate(terms.split("\n"))} if terms else {}
+            self.offsets = data["offsets"]
+            self.docs = data["docs"]
+            self.tfs = data["tfs"].astype(np.float32)
+            self.labels = data["labels"]
+            doc_lengths = data["doc_lengths"].astype(np.float32)
+        self.k1 = k1
+        n_docs = len(self.labels)
+        document_frequency = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log1p((n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+        # Per-document length normalisation of BM25's tf saturation, precomputed once
+        self.length_norm = k1 * (1 - b + b * doc_lengths / max(doc_lengths.mean(), 1.0)) if n_docs else doc_lengths
+
+    def __len__(self):
+        return len(self.labels)
+
+    def scores(self, query):
+        """BM25 score of every document for query, and the query's terms found in the index"""
+        scores = np.zeros(len(self.labels), dtype=np.float32)
+        found = []
+        for token in set(tokenize(query)):
+            term = self.term_ids.get(token)
+            if term is None:
+                continue
+            found.append(term)
+            start, end = self.offsets[term], self.offsets[term + 1]
+            docs, tfs = self.docs[start:end], self.tfs[start:end]
+            scores[docs] += self.idf[term] * tfs * (self.k1 + 1) / (tfs + self.length_norm[docs])
+        return scores, found
+
+    def search(self, query, k=5):
+        """[(label, score)] of the k best matches, best first; documents matching no term are left out"""
+        scores, found = self.scores(query)
+        if not found:
+            return []
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(self.labels[i]), float(scores[i])) for i in top if scores[i] > 0]
+
+    def matches_all(self, query, label):
+        """Whether the document with this label contains every indexed query term"""
+        position = np.flatnonzero(self.labels == label)
+        if not len(position):
+            return False
+        for token in set(tokenize(query)):
+            term = self.term_ids.get(token)
+            if term is None:
+                return False
+            start, end = self.offsets[term], self.offsets[term + 1]
+            if position[0] not in self.docs[start:end]:
+                return False
+        return True
+
+
+def main():
+    from utils.chunk_store import ChunkStore
+    from utils.mmap_store import CHUNKS_DIR
+
+    for db_path in sys.argv[1:]:
+        n_docs = write_bm25(Path(db_path) / BM25_FILE, ChunkStore(Path(db_path) / CHUNKS_DIR))
+        print(f"✅ Wrote BM25 index for {n_docs} chunks to {Path(db_path) / BM25_FILE}")
+
+
+if __name__ == "__main__":
+    main()
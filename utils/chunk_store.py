@@ -0,0 +1,163 @@
+"""
+Columnar, memory-mapped chunk storage.
+
+Used for the processed chunks the preprocessing scripts pass between them
+(db/chunks/processed, which replaced the pickled processed_chunks.pkl) and
+for the documents of every vectorstore (<store>/chunks, which replaced the
+pickled docstore in index.pkl). Opening a store reads no records, so load
+time and memory do not grow with the corpus.
+"""
+import hashlib
+import json
+import os
+import pickle
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+
+def chunk_id(title, content):
+    """Stable 63-bit id for a chunk, so the same chunk keeps its FAISS id across runs"""
+    digest = hashlib.sha256(f"{title}\x00{content}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "little") & 0x7FFF_FFFF_FFFF_FFFF
+
+
+def _open_bytes(path):
+    # np.memmap refuses empty files, and an empty column is just no bytes
+    if path.stat().st_size == 0:
+        return np.zeros(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+
+
+def write_chunk_store(path, records):
+    """
+    Write (chunk_id, text, metadata) records as a directory of flat columns:
+
+        ids.npy                        int64 chunk ids, in record order
+        sorted_ids.npy, sorted_pos.npy chunk ids sorted, and their record positions
+        content.bin, content.offsets.npy   UTF-8 texts back to back, and n + 1 byte offsets
+        meta.bin, meta.offsets.npy     JSON metadata, same layout
+
+    Every file can be memory-mapped, so readers pay only for the records they touch.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    ids = []
+    content_offsets = [0]
+    meta_offsets = [0]
+    with open(path / "content.bin", "wb") as content, open(path / "meta.bin", "wb") as meta:
+        for chunk_id, text, metadata in records:
+            ids.append(chunk_id)
+            content_offsets.append(content_offsets[-1] + content.write(text.encode("utf-8")))
+            meta_offsets.append(meta_offsets[-1] + meta.write(json.dumps(metadata or {}).encode("utf-8")))
+
+    ids = np.asarray(ids, dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    np.save(path / "ids.npy", ids)
+    np.save(path / "sorted_ids.npy", ids[order])
+    np.save(path / "sorted_pos.npy", order.astype(np.int64))
+    np.save(path / "content.offsets.npy", np.asarray(content_offsets, dtype=np.int64))
+    np.save(path / "meta.offsets.npy", np.asarray(meta_offsets, dtype=np.int64))
+    return len(ids)
+
+
+class ChunkStore:
+    """
+    Read-only, memory-mapped view of a directory written by write_chunk_store.
+    Opening it reads no records; lookups by chunk id are a binary search over
+    the mapped id column plus one slice of the text and metadata columns.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.ids = np.load(self.path / "ids.npy", mmap_mode="r")
+        self._sorted_ids = np.load(self.path / "sorted_ids.npy", mmap_mode="r")
+        self._sorted_pos = np.load(self.path / "sorted_pos.npy", mmap_mode="r")
+        self._content = _open_bytes(self.path / "content.bin")
+        self._content_offsets = np.load(self.path / "content.offsets.npy", mmap_mode="r")
+        self._meta = _open_bytes(self.path / "meta.bin")
+        self._meta_offsets = np.load(self.path / "meta.offsets.npy", mmap_mode="r")
+
+    @staticmethod
+    def exists(path):
+        return (Path(path) / "ids.npy").exists()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, chunk_id):
+        return self.position(chunk_id) is not None
+
+    def position(self, chunk_id):
+        """Record position of chunk_id, or None if the store does not have it"""
+        i = int(np.searchsorted(self._sorted_ids, chunk_id))
+        if i < len(self._sorted_ids) and self._sorted_ids[i] == chunk_id:
+            return int(self._sorted_pos[i])
+        return None
+
+    def text(self, position):
+        start, end = self._content_offsets[position], self._content_offsets[position + 1]
+        return bytes(self._content[start:end]).decode("utf-8")
+
+    def metadata(self, position):
+        start, end = self._meta_offsets[position], self._meta_offsets[position + 1]
+        return json.loads(bytes(self._meta[start:end]))
+
+    def get(self, chunk_id):
+        """Returns (text, metadata) for chunk_id, or None"""
+        position = self.position(chunk_id)
+        if position is None:
+            return None
+        return self.text(position), self.metadata(position)
+
+    def __iter__(self):
+        """Yields (chunk_id, text, metadata) in record order, one record at a time"""
+        for position in range(len(self)):
+            yield int(self.ids[position]), self.text(position), self.metadata(position)
+
+
+def write_chunks(path, structured_chunks):
+    """
+    Save (title, content) or (title, content, metadata) chunks as a ChunkStore
+    keyed by chunk_id, with the title kept as the "section" metadata. Chunks
+    are consumed one at a time, duplicates are stored once, and the store is
+    written to a temp directory and swapped in. Returns the number stored.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+
+    def records():
+        seen = set()
+        for title, content, *metadata in structured_chunks:
+            label = chunk_id(title, content)
+            if label not in seen:
+                seen.add(label)
+                yield label, content, {"section": title, **(metadata[0] if metadata else {})}
+
+    n_chunks = write_chunk_store(tmp_path, records())
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return n_chunks
+
+
+def read_chunks(path):
+    """Yields the (title, content, metadata) chunks of a store written by write_chunks, in order"""
+    for _, text, metadata in ChunkStore(path):
+        title = metadata.pop("section", "")
+        yield title, text, metadata
+
+
+def load_chunks(path, legacy_pickle=None):
+    """
+    All chunks of the store at path. A processed_chunks.pkl from before the
+    store existed is converted once and not read again.
+    """
+    if not ChunkStore.exists(path) and legacy_pickle is not None and Path(legacy_pickle).exists():
+        with open(legacy_pickle, "rb") as f:
+            n_chunks = write_chunks(path, pickle.load(f))
+        print(f"🔄 Converted {legacy_pickle} to a chunk store at {path} ({n_chunks} chunks); the .pkl can be deleted")
+    if not ChunkStore.exists(path):
+        return None
+    return list(read_chunks(path))
@@ -0,0 +1,180 @@
+"""
+Streaming, token-sized chunker for the OCR'd module text.
+
+Pages are consumed one at a time into a single text buffer. Section
+headings ("Chapter 9", "Section 9.2") start new sections, and each section
+is cut into windows of whole words holding at most CHUNK_TOKENS tokens,
+each overlapping the previous one by about OVERLAP_TOKENS. Words are kept
+as arrays of character offsets and token counts, window boundaries come
+from a binary search over the cumulative token counts, and the only string
+built per chunk is its final slice of the buffer; text already chunked is
+dropped from the buffer as the scan moves on.
+
+Windows are sized from per-word token counts. tiktoken encodes the space
+before a word together with the word and never merges across that
+boundary, so each word is counted with its leading space, except the
+first word of a chunk. The final slice is counted again for its metadata,
+so "tokens" always equals count_tokens(text), also when tiktoken's
+vocabulary is unavailable and counts are estimates.
+
+Each chunk is (section title, text, metadata) with
+
+    page_start, page_end   pages the chunk starts and ends on
+    char_start, char_end   offsets into the whitespace-normalised document
+                           (pages joined by one space), so text == document[char_start:char_end]
+    tokens                 count_tokens of the chunk text
+"""
+import bisect
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from utils.tokenizer import count_tokens
+
+CHUNK_TOKENS = 120  # About the 80 words the word-window splitter used
+OVERLAP_TOKENS = 30
+HEADING_PATTERN = re.compile(r"(chapter\s+\d+|section\s+\d+\.\d+)", re.IGNORECASE)
+WHITESPACE_PATTERN = re.compile(r"\s+")
+HEADING_LOOKAHEAD = 32  # Chars held back until the next page, so a heading split across pages is still found
+
+word_tokens = lru_cache(maxsize=65536)(count_tokens)
+
+
+class _Chunker:
+    def __init__(self, chunk_tokens, overlap_tokens):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.buffer = ""
+        self.base = 0  # Document offset of buffer[0]
+        self.length = 0  # Document length so far
+        self.page_starts = []  # Document offset where each page starts
+        self.page_numbers = []
+        self.title = None  # Text before the first heading is not chunked
+        self.scanned = 0  # Document offset up to which words have been read
+        # Words of the current section not yet dropped: document start, end and token count
+        self.starts = self.ends = self.tokens = np.zeros(0, dtype=np.int64)
+        self.emitted = 0  # Words before this index have been in an emitted chunk
+
+    def add_page(self, page_number, text):
+        text = WHITESPACE_PATTERN.sub(" ", text).strip()
+        if not text:
+            return
+        if self.length:
+            self.buffer += " "
+            self.length += 1
+        self.page_starts.append(self.length)
+        self.page_numbers.append(page_number)
+        self.buffer += text
+        self.length += len(text)
+
+    def page_at(self, offset):
+        return self.page_numbers[max(bisect.bisect_right(self.page_starts, offset) - 1, 0)]
+
+    def _chunk(self, first, last):
+        start, end = int(self.starts[first]), int(self.ends[last - 1])
+        text = self.buffer[start - self.base:end - self.base]
+        return self.title, text, {
+            "page_start": self.page_at(start),
+            "page_end": self.page_at(end - 1),
+            "char_start": start,
+            "char_end": end,
+            "tokens": count_tokens(text),
+        }
+
+    def _read_words(self, until):
+        """Add the words starting before `until` to the current section"""
+        if until <= self.scanned:
+            return
+        # Words are separated by exactly one space, so the segment ends where the word holding until - 1 ends
+        cut = self.buffer.find(" ", until - 1 - self.base)
+        cut = self.length if cut == -1 else cut + self.base
+        offset = self.scanned
+        segment = self.buffer[offset - self.base:cut - self.base]
+        self.scanned = max(cut, until)
+        stripped = segment.lstrip(" ")
+        offset += len(segment) - len(stripped)
+        if self.title is None or not stripped:
+            return
+        words = stripped.rstrip(" ").split(" ")
+        lengths = np.fromiter(map(len, words), dtype=np.int64, count=len(words))
+        starts = offset + np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        self.starts = np.concatenate((self.starts, starts))
+        self.ends = np.concatenate((self.ends, starts + lengths))
+        # Counted with the space before them, which is encoded together with the word
+        self.tokens = np.concatenate((self.tokens, np.fromiter((word_tokens(" " + word) for word in words),
+                                                               dtype=np.int64, count=len(words))))
+
+    def _leading_space_tokens(self, i):
+        """Tokens word i saves when it starts a chunk and has no space before it"""
+        word = self.buffer[int(self.starts[i]) - self.base:int(self.ends[i]) - self.base]
+        return int(self.tokens[i]) - word_tokens(word)
+
+    def _windows(self, section_end):
+        """Emit every window that can no longer grow, then drop the words no later window needs"""
+        n = len(self.tokens)
+        cumulative = np.concatenate(([0], np.cumsum(self.tokens)))
+        first = 0
+        while first < n:
+            # Longest run of whole words from `first` within the token budget (at least one word)
+            saved = self._leading_space_tokens(first)
+            last = max(int(np.searchsorted(cumulative, cumulative[first] + saved + self.chunk_tokens, "right")) - 1,
+                       first + 1)
+            if last >= n and not section_end:
+                break
+            last = min(last, n)
+            if last > self.emitted:
+                yield self._chunk(first, last)
+                self.emitted = last
+            if last == n:
+                first = n
+                break
+            # The next window keeps at most overlap_tokens of this one and must fit the word after it,
+            # unless that word alone is over the budget and becomes a chunk of its own
+            first = min(max(int(np.searchsorted(cumulative, cumulative[last] - self.overlap_tokens, "left")),
+                            int(np.searchsorted(cumulative, cumulative[last + 1] - self.chunk_tokens, "left")),
+                            first + 1), last)
+        self.starts, self.ends, self.tokens = self.starts[first:], self.ends[first:], self.tokens[first:]
+        self.emitted = max(self.emitted - first, 0)
+
+    def _end_section(self):
+        yield from self._windows(section_end=True)
+        self.starts = self.ends = self.tokens = np.zeros(0, dtype=np.int64)
+        self.emitted = 0
+
+    def advance(self, final=False):
+        """Chunk everything that can no longer change; at the end of input, everything"""
+        limit = self.length if final else max(self.length - HEADING_LOOKAHEAD, self.scanned)
+        for heading in HEADING_PATTERN.finditer(self.buffer, self.scanned - self.base):
+            if heading.start() + self.base >= limit:
+                break
+            self._read_words(heading.start() + self.base)
+            yield from self._end_section()
+            self.title = heading.group(0)
+        self._read_words(limit)
+        if final:
+            yield from self._end_section()
+        else:
+            yield from self._windows(section_end=False)
+
+        # Only the words of the current window and the unread tail are still needed
+        keep = int(self.starts[0]) if len(self.starts) else self.scanned
+        if keep > self.base:
+            self.buffer = self.buffer[keep - self.base:]
+            self.base = keep
+            first_page = max(bisect.bisect_right(self.page_starts, keep) - 1, 0)
+            del self.page_starts[:first_page], self.page_numbers[:first_page]
+
+
+def chunk_pages(pages, chunk_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """Yields (title, text, metadata) chunks from an iterable of (page_number, text)"""
+    chunker = _Chunker(chunk_tokens, overlap_tokens)
+    for page_number, text in pages:
+        chunker.add_page(page_number, text)
+        yield from chunker.advance()
+    yield from chunker.advance(final=True)
+
+
+def chunk_text(text, chunk_tokens=CHUNK_TOKENS, overlap_tokens=OVERLAP_TOKENS):
+    """chunk_pages for one text without page breaks"""
+    return chunk_pages([(1, text)], chunk_tokens, overlap_tokens)
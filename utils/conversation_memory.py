@@ -0,0 +1,169 @@
+"""
+Chat history with a token budget.
+
+The last few turns are kept verbatim and everything older is folded into a
+running summary by a background thread, so the history sent with each
+prompt stays bounded however long the session runs and the user never
+waits on a summarisation call.
+
+Turns are folded in blocks rather than one per turn. Between folds the
+history only grows at its end, so the system prompt plus history is a
+byte-identical prefix of the next request and the provider's prompt cache
+keeps hitting; the prefix changes once per block instead of every turn.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from utils.tokenizer import count_tokens
+
+HISTORY_TOKEN_BUDGET = 1500  # Summary + verbatim turns sent with each prompt
+KEEP_TURNS = 3  # Most recent user/assistant exchanges always kept word for word
+FOLD_TURNS = 4  # Turns allowed to pile up past KEEP_TURNS before a block is folded
+LOW_WATER = 0.5  # A fold forced by the token budget frees history down to this share of it
+SUMMARY_TOKEN_BUDGET = 300
+
+# Shared by every session; summaries are a few hundred tokens and never on the request path
+SUMMARY_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="history-summary")
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "You maintain a running summary of a conversation between a user and an assistant. "
+               "Merge the new lines into the existing summary. Keep facts, names, numbers, preferences and "
+               "open questions the assistant may need later; drop greetings and repetition. "
+               "Answer with the updated summary only, in at most {max_words} words."),
+    ("human", "Existing summary:\n{summary}\n\nNew lines:\n{lines}"),
+])
+
+
+def message_tokens(message):
+    return count_tokens(message.content) + 4  # Role and separators
+
+
+def format_lines(messages):
+    return "\n".join(f"{'User' if isinstance(m, HumanMessage) else 'Assistant'}: {m.content}" for m in messages)
+
+
+class SummaryBufferHistory(BaseChatMessageHistory):
+    """
+    Drop-in replacement for InMemoryChatMessageHistory / ConversationBufferMemory.
+
+    `messages` is the running summary (as one SystemMessage) followed by the
+    recent turns, within `max_tokens`. Once more than keep_turns + fold_turns
+    turns or the token budget pile up, the oldest are handed to `llm` on a
+    background thread; until their summary lands they are still shown
+    verbatim if the whole block fits the budget.
+    """
+
+    def __init__(self, llm, max_tokens=HISTORY_TOKEN_BUDGET, keep_turns=KEEP_TURNS, fold_turns=FOLD_TURNS,
+                 summary_tokens=SUMMARY_TOKEN_BUDGET):
+        self.summarizer = SUMMARY_PROMPT | llm | StrOutputParser()
+        self.max_tokens = max_tokens
+        self.keep_turns = keep_turns
+        self.fold_turns = fold_turns
+        self.summary_tokens = summary_tokens
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self.summary = ""
+        self._recent = []
+        self._pending = []  # Folded out of the window, not yet in the summary
+        self._folding = False
+        self.summaries_run = 0
+
+    def add_message(self, message):
+        with self._lock:
+            self._recent.append(message)
+            self._spill()
+            start_fold = self._pending and not self._folding
+            if start_fold:
+                self._folding = True
+        if start_fold:
+            SUMMARY_EXECUTOR.submit(self._fold)
+
+    def _spill(self):
+        # Whole turns only, so a question is never separated from its answer
+        verbatim_budget = self.max_tokens - self.summary_tokens
+        if (len(self._recent) <= 2 * (self.keep_turns + self.fold_turns)
+                and self._tokens(self._recent) <= verbatim_budget):
+            return
+        while len(self._recent) > 2 and (
+                len(self._recent) > 2 * self.keep_turns
+                or self._tokens(self._recent) > verbatim_budget * LOW_WATER):
+            self._pending.extend(self._recent[:2])
+            del self._recent[:2]
+
+    @staticmethod
+    def _tokens(messages):
+        return sum(message_tokens(message) for message in messages)
+
+    def _fold(self):
+        while True:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+                if not batch:
+                    self._folding = False
+                    return
+            try:
+                updated = self.summarizer.invoke({
+                    "summary": summary or "(none)",
+                    "lines": format_lines(batch),
+                    "max_words": int(self.summary_tokens * 0.75),
+                })
+            except Exception as e:
+                print(f"⚠️ Could not summarise conversation history: {e}")
+                with self._lock:
+                    self._folding = False
+                return
+            with self._lock:
+                # clear() may have run while the LLM call was in flight
+                if self._pending[:len(batch)] == batch:
+                    del self._pending[:len(batch)]
+                    self.summary = updated.strip()
+                    self.summaries_run += 1
+
+    @property
+    def messages(self):
+        with self._lock:
+            recent = list(self._recent)
+            pending = list(self._pending)
+            summary = self.summary
+
+        history = []
+        budget = self.max_tokens - self._tokens(recent)
+        if summary:
+            summary_message = SystemMessage(content=f"Summary of the earlier conversation: {summary}")
+            budget -= message_tokens(summary_message)
+            history.append(summary_message)
+        # Unsummarised turns stay in place until their summary lands, but only as a
+        # whole block: showing part of it would change the prefix twice
+        if self._tokens(pending) > budget:
+            pending = []
+        return history + pending + recent
+
+    @property
+    def prompt_tokens(self):
+        return self._tokens(self.messages)
+
+    def wait(self, timeout=30):
+        """Block until pending turns are summarised; for scripts, never called by the apps"""
+        deadline = time.monotonic() + timeout
+        while self._folding and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def __str__(self):
+        with self._lock:
+            turns = len(self._recent) // 2
+            pending = len(self._pending) // 2
+        return (f"{turns} recent turns, {pending} waiting for summary, {self.summaries_run} summaries, "
+                f"~{self.prompt_tokens} history tokens")
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import re
+import time
+
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from utils.embedding_cache import text_hash
+
+EMBEDDING_MODEL = "text-embedding-ada-002"  # Same default model OpenAIEmbeddings uses at query time
+EMBEDDING_BATCH_SIZE = 128  # Inputs per request; the API accepts up to 2048
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 6
+
+DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_SECONDS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_duration(value):
+    """Parse OpenAI reset headers such as "20ms", "1s" or "6m0s" into seconds"""
+    parts = DURATION_PART.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_SECONDS[unit] for amount, unit in parts)
+
+
+def retry_delay(headers, attempt):
+    """
+    How long to wait after a 429, preferring what the server told us over
+    plain exponential backoff.
+    """
+    if headers is not None:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            try:
+                return float(headers["retry-after"])
+            except ValueError:
+                pass
+        resets = [
+            parse_duration(headers.get(name))
+            for name in ("x-ratelimit-reset-requests", "x-ratelimit-reset-tokens")
+        ]
+        resets = [reset for reset in resets if reset is not None]
+        if resets:
+            return max(resets)
+    return min(2 ** attempt * 0.5, 30)
+
+
+class EmbeddingStats:
+    def __init__(self):
+        self.requests = 0
+        self.retries = 0
+        self.tokens = 0
+        self.seconds = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def tokens_per_second(self):
+        return self.tokens / self.seconds if self.seconds else 0.0
+
+    @property
+    def cache_hit_rate(self):
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else 0.0
+
+    def __str__(self):
+        summary = (f"{self.tokens} tokens in {self.seconds:.1f}s ({self.tokens_per_second:,.0f} tokens/s), "
+                   f"{self.requests} requests, {self.retries} retries")
+        if self.cache_hits or self.cache_misses:
+            summary += f", cache hit rate {self.cache_hit_rate:.0%} ({self.cache_hits}/{self.cache_hits + self.cache_misses})"
+        return summary
+
+
+class BatchEmbedder:
+    """
+    Embeds many texts with few HTTP round trips: inputs are sent in batches,
+    up to `max_concurrent` requests are in flight at once, and a 429 pauses
+    every request until the reset time the server reported.
+
+    With an EmbeddingCache, only texts the cache has not seen for this model
+    are sent to the API.
+    """
+
+    def __init__(self, api_key=None, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE,
+                 max_concurrent=MAX_CONCURRENT_REQUESTS, base_url=None, cache=None):
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_concurrent = max_concurrent
+        # Retries are handled here so a 429 slows the whole pipeline down, not just one request
+        self.client_kwargs = {
+            "api_key": api_key or os.getenv("OPENAI_API_KEY"),
+            "base_url": base_url or os.getenv("OPENAI_BASE_URL"),
+            "max_retries": 0,
+        }
+        self.stats = EmbeddingStats()
+        self._resume_at = 0.0
+
+    async def _wait_for_rate_limit(self):
+        delay = self._resume_at - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _embed_batch(self, client, semaphore, texts):
+        for attempt in range(MAX_RETRIES + 1):
+            await self._wait_for_rate_limit()
+            async with semaphore:
+                await self._wait_for_rate_limit()
+                try:
+                    self.stats.requests += 1
+                    response = await client.embeddings.create(model=self.model, input=texts)
+                except RateLimitError as e:
+                    delay = retry_delay(e.response.headers, attempt)
+                    self._resume_at = max(self._resume_at, time.monotonic() + delay)
+                except (APIConnectionError, InternalServerError) as e:
+                    if attempt == MAX_RETRIES:
+                        raise
+                    delay = retry_delay(None, attempt)
+                else:
+                    if response.usage is not None:
+                        self.stats.tokens += response.usage.total_tokens
+                    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            self.stats.retries += 1
+            print(f"⏳ Embedding request throttled, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        raise RuntimeError(f"Embedding request still rate limited after {MAX_RETRIES} retries")
+
+    async def _aembed_uncached(self, texts):
+        semaphore = asyncio.Semaphore(self.max_concurrent)
+        started = time.perf_counter()
+        async with AsyncOpenAI(**self.client_kwargs) as client:
+            batches = await asyncio.gather(*[
+                self._embed_batch(client, semaphore, texts[i:i + self.batch_size])
+                for i in range(0, len(texts), self.batch_size)
+            ])
+        self.stats.seconds += time.perf_counter() - started
+        return [vector for batch in batches for vector in batch]
+
+    async def aembed(self, texts):
+        """Embed texts concurrently, returning vectors in input order"""
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            return await self._aembed_uncached(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, set(hashes))
+        # Identical chunks are embedded once
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        misses = sum(1 for key in hashes if key in missing)
+        self.stats.cache_hits += len(hashes) - misses
+        self.stats.cache_misses += misses
+
+        if missing:
+            fresh = await self._aembed_uncached(list(missing.values()))
+            self.cache.put_many(self.model, missing.keys(), fresh)
+            vectors.update(zip(missing.keys(), fresh))
+        return [vectors[key] for key in hashes]
+
+    def embed(self, texts):
+        return asyncio.run(self.aembed(texts))
@@ -0,0 +1,231 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from utils.bm25_index import BM25_FILE, write_bm25
+from utils.chunk_store import ChunkStore, chunk_id
+from utils.mmap_store import CHUNKS_DIR, docstore_records, write_mmap_chunks
+from utils.query_embeddings import EMBEDDING_INFO_FILE, write_embedding_info
+from utils.vector_matrix import write_vector_matrix
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+INDEX_TYPE = os.getenv("CAIA_INDEX_TYPE", "flat")
+
+HNSW_M = 32  # Graph neighbours per node
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16  # Inverted lists scanned per query
+PQ_M = 64  # Sub-quantizers; must divide the embedding size (1536 / 64 = 24 dims each)
+PQ_BITS = 8
+TRAIN_SAMPLE = 50_000  # Vectors used to train IVF centroids and PQ codebooks
+
+
+def docs_by_id(structured_chunks):
+    """
+    Map chunk id -> Document; duplicate chunks collapse into one entry.
+    Chunks are (title, content) or, from utils/chunker.py, (title, content, metadata).
+    """
+    return {
+        chunk_id(title, content): Document(page_content=content,
+                                           metadata={"section": title, **(metadata[0] if metadata else {})})
+        for title, content, *metadata in structured_chunks
+    }
+
+
+def ivf_nlist(n_vectors):
+    """Roughly 4 * sqrt(n) inverted lists, with enough training points (39 per list) for each"""
+    return max(1, min(int(4 * np.sqrt(n_vectors)), n_vectors // 39))
+
+
+def new_index(dim, index_type=INDEX_TYPE, training_vectors=None):
+    """
+    Create an empty index that can add, remove and reconstruct vectors by
+    chunk id, which the incremental updater and the MMR retriever rely on.
+    IVF variants are trained on (a sample of) training_vectors, and raise
+    ValueError when there are too few of them to train on.
+    """
+    if index_type == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatL2(dim))
+
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.hnsw.efSearch = HNSW_EF_SEARCH
+        return faiss.IndexIDMap2(hnsw)
+
+    if index_type not in ("ivf", "ivfpq"):
+        raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
+
+    n_vectors = len(training_vectors)
+    # k-means wants ~39 points per centroid: per inverted list, and per PQ codebook entry
+    min_points = 39 * 2 ** PQ_BITS if index_type == "ivfpq" else 39
+    if n_vectors < min_points:
+        # A silent flat fallback would be rebuilt on every run as "not the requested type"
+        raise ValueError(f"{n_vectors} vectors are too few to train {index_type} (it needs {min_points}); "
+                         f"use a flat or hnsw index")
+
+    nlist = ivf_nlist(n_vectors)
+    quantizer = faiss.IndexFlatL2(dim)
+    if index_type == "ivf":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, PQ_M, PQ_BITS)
+    # Keep the quantizer alive as long as the index that points at it
+    index.own_fields = True
+    quantizer.this.disown()
+
+    sample = training_vectors
+    if n_vectors > TRAIN_SAMPLE:
+        sample = training_vectors[np.random.default_rng(0).choice(n_vectors, TRAIN_SAMPLE, replace=False)]
+    index.train(sample)
+    index.nprobe = min(IVF_NPROBE, nlist)
+    # A hash table from chunk id to list position makes remove_ids and reconstruct(id) work
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def index_type_of(index):
+    """Inverse of new_index: which INDEX_TYPES entry built this index"""
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf"
+    if isinstance(index, faiss.IndexIDMap2):
+        return "hnsw" if isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW) else "flat"
+    return None
+
+
+def _add(vectorstore, docs, embedder, index_type=INDEX_TYPE):
+    ids = list(docs)
+    vectors = np.asarray(embedder.embed([docs[i].page_content for i in ids]), dtype=np.float32)
+    if vectorstore.index is None:
+        vectorstore.index = new_index(vectors.shape[1], index_type, vectors)
+    vectorstore.index.add_with_ids(vectors, np.asarray(ids, dtype=np.int64))
+    vectorstore.docstore.add({str(i): docs[i] for i in ids})
+    vectorstore.index_to_docstore_id.update({i: str(i) for i in ids})
+
+
+def build_vectorstore(docs, embedder, embedding_function, index_type=INDEX_TYPE):
+    """Build a fresh id-mapped FAISS vectorstore of the given INDEX_TYPES kind from {chunk_id: Document}"""
+    vectorstore = FAISS(
+        embedding_function=embedding_function,
+        index=None,
+        docstore=InMemoryDocstore({}),
+        index_to_docstore_id={},
+    )
+    _add(vectorstore, docs, embedder, index_type)
+    return vectorstore
+
+
+def is_incremental(vectorstore):
+    """Stores written before chunk ids existed use positional ids and must be rebuilt"""
+    return index_type_of(vectorstore.index) is not None
+
+
+def update_vectorstore(vectorstore, docs, embedder):
+    """
+    Bring an id-mapped vectorstore in line with {chunk_id: Document}:
+    vectors for chunks that disappeared are removed, new chunks are embedded
+    and added, and unchanged chunks are left alone.
+    Returns (added, removed) counts.
+
+    HNSW graphs cannot drop vectors, so removing chunks from an HNSW store
+    raises ValueError and the caller has to rebuild it.
+    """
+    stored = set(vectorstore.index_to_docstore_id)
+    removed = stored - docs.keys()
+    added = {i: doc for i, doc in docs.items() if i not in stored}
+
+    if removed and index_type_of(vectorstore.index) == "hnsw":
+        raise ValueError(f"{len(removed)} chunks were removed, but an HNSW index cannot delete vectors")
+    if removed:
+        vectorstore.index.remove_ids(np.asarray(sorted(removed), dtype=np.int64))
+        vectorstore.docstore.delete([vectorstore.index_to_docstore_id.pop(i) for i in removed])
+    if added:
+        _add(vectorstore, added, embedder)
+    return len(added), len(removed)
+
+
+def _publish(version_path, db_path):
+    """
+    Point db_path at version_path. db_path is a symlink to the current
+    version directory, replaced with one atomic rename, so readers see the
+    old store or the new one and never a missing path. The previous version
+    is kept for readers still opening it; older ones are deleted.
+
+    A store saved before versioned directories is a plain directory, which
+    a symlink cannot be renamed over: it is moved aside as the previous
+    version first, leaving db_path briefly missing on that one save, and
+    moved back if the link cannot be put in place.
+    """
+    link_path = db_path.with_name(db_path.name + ".link")
+    link_path.unlink(missing_ok=True)
+    os.symlink(version_path.name, link_path, target_is_directory=True)
+    if db_path.is_symlink():
+        previous = db_path.resolve()
+        os.replace(link_path, db_path)
+    elif db_path.exists():
+        previous = db_path.with_name(f"{db_path.name}.v{time.time_ns() - 1}")
+        os.replace(db_path, previous)
+        try:
+            os.replace(link_path, db_path)
+        except OSError:
+            os.replace(previous, db_path)
+            raise
+    else:
+        previous = None
+        os.replace(link_path, db_path)
+
+    for stale in db_path.parent.glob(f"{db_path.name}.v*"):
+        if stale.name not in (version_path.name, previous and previous.name):
+            shutil.rmtree(stale, ignore_errors=True)
+
+
+def save_vectorstore_atomic(vectorstore, db_path, embedding_backend=None):
+    """
+    Write the store to a new version directory next to db_path and swap
+    db_path over to it (see _publish), so a reader never opens a
+    half-written or missing store.
+    The store is index.faiss plus the memory-mapped chunk columns, with no
+    pickled docstore. The BM25 keyword index and the normalised vector
+    matrix for MMR are written alongside, with the embedding backend the
+    vectors came from (kept from the previous store when not given).
+    """
+    db_path = Path(db_path)
+    version_path = db_path.with_name(f"{db_path.name}.v{time.time_ns()}")
+    version_path.mkdir(parents=True)
+    faiss.write_index(vectorstore.index, str(version_path / "index.faiss"))
+    write_mmap_chunks(vectorstore, version_path)
+    write_bm25(version_path / BM25_FILE, docstore_records(vectorstore))
+    write_vector_matrix(vectorstore, version_path)
+    if embedding_backend is not None:
+        write_embedding_info(version_path, embedding_backend)
+    elif (db_path / EMBEDDING_INFO_FILE).exists():
+        shutil.copy(db_path / EMBEDDING_INFO_FILE, version_path / EMBEDDING_INFO_FILE)
+    _publish(version_path, db_path)
+
+
+def load_editable_vectorstore(db_path, embedding_function):
+    """
+    Load a store into memory for update_vectorstore: a writable index and an
+    in-memory docstore built from the chunk columns. Stores from before the
+    chunk columns existed are read from their pickled index.pkl.
+    """
+    db_path = Path(db_path)
+    if not ChunkStore.exists(db_path / CHUNKS_DIR):
+        return FAISS.load_local(str(db_path), embedding_function, allow_dangerous_deserialization=True)
+    docs = {str(label): Document(page_content=text, metadata=metadata)
+            for label, text, metadata in ChunkStore(db_path / CHUNKS_DIR)}
+    return FAISS(
+        embedding_function=embedding_function,
+        index=faiss.read_index(str(db_path / "index.faiss")),
+        docstore=InMemoryDocstore(docs),
+        index_to_docstore_id={int(doc_id): doc_id for doc_id in docs},
+    )
@@ -0,0 +1,87 @@
+import re
+import threading
+from typing import Any
+
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict, Field
+
+from utils.bm25_index import tokenize
+from utils.tracing import span
+
+RRF_K = 60  # Reciprocal rank fusion damping; 60 is the value from the original RRF paper
+FETCH_K = 20  # Candidates taken from each ranking before fusion
+KEYWORD_QUERY_MAX_TERMS = 4
+ACRONYM_PATTERN = re.compile(r"\b[A-Z][A-Z0-9]{1,}\b")
+
+
+def is_keyword_query(query):
+    """
+    Short lookups built around an exact term (a number, an acronym or a
+    quoted phrase), like "Chapter 9" or "GDPR fines", rather than a question
+    whose meaning matters more than its words.
+    """
+    terms = tokenize(query)
+    if not terms or len(terms) > KEYWORD_QUERY_MAX_TERMS:
+        return False
+    return '"' in query or bool(ACRONYM_PATTERN.search(query)) or any(any(c.isdigit() for c in t) for t in terms)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Labels ordered by sum(1 / (k + rank)) over the rankings they appear in"""
+    fused = {}
+    for ranking in rankings:
+        for rank, label in enumerate(ranking):
+            fused[label] = fused.get(label, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused, key=fused.get, reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Fuses BM25 and FAISS rankings with reciprocal rank fusion.
+
+    Keyword lookups whose best BM25 hit contains every query term are
+    answered from BM25 alone, which skips the embeddings round trip.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    bm25: Any
+    k: int = 5
+    fetch_k: int = FETCH_K
+    rrf_k: int = RRF_K
+    stats: dict = Field(default_factory=lambda: {"bm25_only": 0, "hybrid": 0})
+    lock: Any = Field(default_factory=threading.Lock)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+    def _documents(self, labels):
+        docs = []
+        for label in labels:
+            doc_id = self.vectorstore.index_to_docstore_id.get(label)
+            if doc_id is not None:
+                docs.append(self.vectorstore.docstore.search(doc_id))
+        return docs
+
+    def vector_ranking(self, query):
+        vector = np.asarray([self.vectorstore._embed_query(query)], dtype=np.float32)
+        with span("search", index="faiss"):
+            _, labels = self.vectorstore.index.search(vector, self.fetch_k)
+        return [int(label) for label in labels[0] if label != -1]
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        with span("search", index="bm25") as search:
+            keyword_hits = self.bm25.search(query, self.fetch_k)
+            bm25_only = bool(keyword_hits) and is_keyword_query(query) and \
+                self.bm25.matches_all(query, keyword_hits[0][0])
+            search.set(route="bm25_only" if bm25_only else "hybrid")
+        if bm25_only:
+            self._count("bm25_only")
+            return self._documents([label for label, _ in keyword_hits[:self.k]])
+
+        self._count("hybrid")
+        fused = reciprocal_rank_fusion([self.vector_ranking(query), [label for label, _ in keyword_hits]], self.rrf_k)
+        return self._documents(fused[:self.k])
@@ -0,0 +1,170 @@
+"""
+Persistent cache of Quick Planning Form itineraries.
+
+The form has a small, discrete input space, so submissions are normalised
+(canonical city name, preferences in form order, budget rounded down
+to a bucket) and the generated itinerary is stored in SQLite under that key.
+Entries expire after a TTL and the least recently used ones are evicted
+past a size limit.
+
+Pre-generate the most common combinations offline with:
+
+    python utils/itinerary_cache.py --limit 40 --concurrency 4
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import re
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.travel_prompts import TRAVEL_PREFERENCES, TRAVEL_SYSTEM_PROMPT, form_prompt
+
+ITINERARY_CACHE_FILE = Path(__file__).parent.parent / "db" / "itinerary_cache.sqlite"
+ITINERARY_TTL_SECONDS = 30 * 24 * 3600  # Prices and schedules drift; regenerate monthly
+ITINERARY_MAX_ENTRIES = 5000
+BUDGET_BUCKET_MYR = 250
+
+# Combinations the warm-up command generates, most common first
+COMMON_STARTS = ["Kuala Lumpur", "Singapore", "Penang", "Johor Bahru", "Kota Kinabalu"]
+COMMON_DURATIONS = [3, 5, 7, 4]
+COMMON_BUDGETS = [1000, 1500, 2000, 3000]
+COMMON_PREFERENCES = [[], ["Food Tour"], ["Coastal/Beach"], ["Cultural/Heritage"], ["Nature/Wildlife"],
+                      ["Kids Friendly"], ["Cultural/Heritage", "Food Tour"]]
+
+
+def normalize_form(starting_destination, budget_per_pax, duration, preferences, additional_notes=""):
+    """
+    Canonical form fields. Two submissions that normalise to the same fields
+    get the same itinerary, so the prompt is built from these, not the raw input.
+    """
+    start = re.sub(r"\s+", " ", starting_destination or "").strip().title() or "Kuala Lumpur"
+    # Rounded down, never up: the plan must fit the budget the user gave
+    budget = int(budget_per_pax) // BUDGET_BUCKET_MYR * BUDGET_BUCKET_MYR or int(budget_per_pax)
+    order = {name: i for i, name in enumerate(TRAVEL_PREFERENCES)}
+    preferences = sorted(set(preferences or []), key=lambda name: (order.get(name, len(order)), name))
+    notes = re.sub(r"\s+", " ", additional_notes or "").strip()
+    return {"starting_destination": start, "budget_per_pax": budget, "duration": int(duration),
+            "preferences": preferences, "additional_notes": notes}
+
+
+def form_key(fields):
+    canonical = dict(fields, starting_destination=fields["starting_destination"].lower(),
+                     additional_notes=fields["additional_notes"].lower())
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode()).hexdigest()
+
+
+def prompt_for(fields):
+    return form_prompt(fields["starting_destination"], fields["budget_per_pax"], fields["duration"],
+                       fields["preferences"], fields["additional_notes"])
+
+
+class ItineraryCache:
+    """Form key -> generated itinerary, in SQLite, with TTL and LRU eviction"""
+
+    def __init__(self, path=ITINERARY_CACHE_FILE, ttl=ITINERARY_TTL_SECONDS, max_entries=ITINERARY_MAX_ENTRIES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS itineraries ("
+            " key TEXT PRIMARY KEY, fields TEXT NOT NULL, answer TEXT NOT NULL,"
+            " created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS itineraries_last_used ON itineraries (last_used)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT answer, created_at FROM itineraries WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM itineraries WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE itineraries SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT created_at FROM itineraries WHERE key = ?", (key,)).fetchone()
+        return row is not None and time.time() - row[0] <= self.ttl
+
+    def put(self, key, fields, answer):
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO itineraries VALUES (?, ?, ?, ?, ?)",
+                               (key, json.dumps(fields), answer, now, now))
+            self._conn.execute("DELETE FROM itineraries WHERE created_at < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM itineraries WHERE key IN ("
+                " SELECT key FROM itineraries ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM itineraries").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
+
+
+def common_forms():
+    """Warm-up combinations, most common first"""
+    for preferences, duration, budget, start in itertools.product(
+            COMMON_PREFERENCES, COMMON_DURATIONS, COMMON_BUDGETS, COMMON_STARTS):
+        yield normalize_form(start, budget, duration, preferences)
+
+
+def main():
+    import os
+    from dotenv import load_dotenv
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from langchain_openai import ChatOpenAI
+
+    parser = argparse.ArgumentParser(description="Pre-generate itineraries for common Quick Planning Form inputs.")
+    parser.add_argument("--limit", type=int, default=40, help="Number of combinations to make sure are cached")
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    load_dotenv()
+    chat = ChatOpenAI(temperature=0.7, model="gpt-4o-mini", openai_api_key=os.getenv("OPENAI_API_KEY"))
+    cache = ItineraryCache()
+    forms = list(itertools.islice(common_forms(), args.limit))
+    todo = [fields for fields in forms if form_key(fields) not in cache]
+    print(f"🧳 {len(forms) - len(todo)} of {len(forms)} itineraries already cached, generating {len(todo)}")
+
+    started = time.perf_counter()
+    for i in range(0, len(todo), args.concurrency):
+        batch = todo[i:i + args.concurrency]
+        replies = chat.batch(
+            [[SystemMessage(content=TRAVEL_SYSTEM_PROMPT), HumanMessage(content=prompt_for(fields))] for fields in batch],
+            config={"max_concurrency": args.concurrency},
+        )
+        for fields, reply in zip(batch, replies):
+            cache.put(form_key(fields), fields, reply.content)
+        print(f"✅ {min(i + args.concurrency, len(todo))}/{len(todo)} generated")
+    print(f"🎉 Warm-up done in {time.perf_counter() - started:.1f}s, {len(cache)} itineraries cached")
+
+
+if __name__ == "__main__":
+    main()
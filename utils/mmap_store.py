@@ -0,0 +1,110 @@
+"""
+Memory-mapped vectorstore format for serving.
+
+A store directory written by save_vectorstore_atomic holds index.faiss
+and a `chunks/` ChunkStore with every document keyed by its FAISS label,
+in place of LangChain's pickled index.pkl docstore. load_mmap_vectorstore
+maps index.faiss and the chunk columns read-only, so cold start no longer
+grows with the corpus, nothing is unpickled, and several app processes on
+one host share the same pages through the OS page cache.
+
+Convert an old pickled store in place (its index.pkl is dropped) with:
+
+    python utils/mmap_store.py db/vectorstore
+"""
+import sys
+from collections.abc import Mapping
+from pathlib import Path
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.chunk_store import ChunkStore, write_chunk_store
+
+CHUNKS_DIR = "chunks"
+# IO_FLAG_MMAP_IFC maps flat vector codes without copying them (faiss >= 1.10);
+# plain IO_FLAG_MMAP only maps IVF inverted lists
+MMAP_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+
+
+class ChunkStoreDocstore(Docstore):
+    """Read-only docstore that decodes documents from a ChunkStore on demand"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def search(self, search):
+        found = self.store.get(int(search))
+        if found is None:
+            return f"ID {search} not found."
+        text, metadata = found
+        return Document(page_content=text, metadata=metadata)
+
+
+class ChunkIdMapping(Mapping):
+    """
+    Stands in for FAISS.index_to_docstore_id: FAISS labels are the chunk ids
+    and the docstore ids are their decimal strings, so nothing needs to be
+    materialised per vector.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def __getitem__(self, label):
+        if int(label) not in self.store:
+            raise KeyError(label)
+        return str(int(label))
+
+    def __iter__(self):
+        return (int(label) for label in self.store.ids)
+
+    def __len__(self):
+        return len(self.store)
+
+
+def docstore_records(vectorstore):
+    """(label, text, metadata) for every vector of a regular FAISS vectorstore"""
+    for label, doc_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(doc_id)
+        yield int(label), doc.page_content, doc.metadata
+
+
+def write_mmap_chunks(vectorstore, db_path):
+    return write_chunk_store(Path(db_path) / CHUNKS_DIR, docstore_records(vectorstore))
+
+
+def is_mmap_store(db_path):
+    return ChunkStore.exists(Path(db_path) / CHUNKS_DIR)
+
+
+def load_mmap_vectorstore(db_path, embeddings):
+    """Open a store read-only with the index and the documents memory-mapped"""
+    db_path = Path(db_path)
+    store = ChunkStore(db_path / CHUNKS_DIR)
+    return FAISS(
+        embedding_function=embeddings,
+        index=faiss.read_index(str(db_path / "index.faiss"), MMAP_FLAGS),
+        docstore=ChunkStoreDocstore(store),
+        index_to_docstore_id=ChunkIdMapping(store),
+    )
+
+
+def main():
+    from langchain_community.embeddings import FakeEmbeddings
+    from utils.faiss_index import save_vectorstore_atomic
+
+    for db_path in sys.argv[1:]:
+        # Only the stored documents are needed here, so no embedding calls are made
+        vectorstore = FAISS.load_local(db_path, FakeEmbeddings(size=1), allow_dangerous_deserialization=True)
+        save_vectorstore_atomic(vectorstore, db_path)
+        print(f"✅ Converted {db_path} to a memory-mapped chunk store ({vectorstore.index.ntotal} vectors)")
+
+
+if __name__ == "__main__":
+    main()
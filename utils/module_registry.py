@@ -0,0 +1,258 @@
+"""
+Serving every CAIA module from one deployment.
+
+db/modules.json lists the modules, each with its own vectorstore:
+
+    {"modules": [
+        {"name": "module2", "title": "...", "db": "db/vectorstore", "keywords": ["recommender", ...]},
+        ...
+    ]}
+
+Paths are relative to the repo root, and modules whose store has not been
+built yet are skipped. Without the file the app serves the one store at
+db/vectorstore as before.
+
+Stores are opened lazily, on the first question routed to them, and kept in
+an LRU bounded by CAIA_MODULE_CACHE_MB of store files (the memory-mapped
+pages a loaded store can occupy). Each question goes only to the modules a
+cheap router picks:
+
+    keywords    modules with a keyword (or every word of a keyword phrase)
+                in the question
+    centroids   otherwise the module whose k-means centroids (centroids.npy,
+                written with the vector matrix) are most similar to the
+                question vector, plus any within ROUTE_MARGIN of it
+
+Routing costs one small matrix product over all modules' centroids; the
+index searches, which are what grows with a module's size, only run on
+the picked modules. Questions are only embedded for routing when no
+keyword matches, so keyword-routed questions that the hybrid retriever
+answers from BM25 alone still make no embeddings call. Every store must
+use the same embedding model, so a question routed by centroids is
+embedded once for routing and retrieval.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+from utils.bm25_index import tokenize
+from utils.qa_chain import RETRIEVER, build_retriever, load_bm25, load_vector_matrix, load_vectorstore
+from utils.query_embeddings import read_embedding_info
+from utils.semantic_cache import store_fingerprint, vectorstore_version
+from utils.tracing import span
+from utils.vector_matrix import CENTROIDS_FILE, VECTORS_FILE, normalize_rows
+
+ROOT_DIR = Path(__file__).parent.parent
+MODULES_FILE = Path(os.getenv("CAIA_MODULES_FILE", ROOT_DIR / "db" / "modules.json"))
+DEFAULT_DB_DIR = ROOT_DIR / "db" / "vectorstore"
+MODULE_CACHE_BYTES = int(os.getenv("CAIA_MODULE_CACHE_MB", "1024")) * 1024 * 1024
+ROUTE_MARGIN = 0.05  # Modules this close to the best centroid similarity are searched too
+MAX_ROUTED_MODULES = 2
+
+
+class Module:
+    def __init__(self, name, db_path, title="", keywords=()):
+        self.name = name
+        self.db_path = Path(db_path)
+        self.title = title or name
+        self.keywords = [tuple(tokenize(keyword)) for keyword in keywords if tokenize(keyword)]
+
+    def keyword_hits(self, tokens):
+        return sum(all(token in tokens for token in keyword) for keyword in self.keywords)
+
+    def centroids(self):
+        """Routing centroids; stores saved before centroids.npy existed fall back to the mean vector"""
+        path = self.db_path / CENTROIDS_FILE
+        if path.exists():
+            return np.load(path)
+        print(f"⚠️ {self.db_path} has no {CENTROIDS_FILE}; add it with: python utils/vector_matrix.py {self.db_path}")
+        if (self.db_path / VECTORS_FILE).exists():
+            return normalize_rows(np.load(self.db_path / VECTORS_FILE, mmap_mode="r").mean(axis=0, keepdims=True))
+        return None
+
+    def store_bytes(self):
+        return sum(path.stat().st_size for path in self.db_path.rglob("*") if path.is_file())
+
+
+class ModuleRegistry:
+    def __init__(self, modules):
+        self.modules = [module for module in modules if (module.db_path / "index.faiss").exists()]
+        for module in modules:
+            if module not in self.modules:
+                print(f"⚠️ Module {module.name} has no vectorstore at {module.db_path}; skipping it")
+        models = {read_embedding_info(module.db_path) for module in self.modules}
+        if len(models) > 1:
+            raise ValueError(f"Module stores were embedded with different models {sorted(models)}; "
+                             f"rebuild them with one --embedding-backend")
+
+    @classmethod
+    def from_file(cls, path=MODULES_FILE):
+        with open(path) as f:
+            entries = json.load(f)["modules"]
+        return cls([Module(entry["name"], ROOT_DIR / entry["db"], entry.get("title", ""), entry.get("keywords", ()))
+                    for entry in entries])
+
+    @classmethod
+    def single(cls, db_path=DEFAULT_DB_DIR):
+        return cls([Module("default", db_path)])
+
+    def get(self, name):
+        return next(module for module in self.modules if module.name == name)
+
+    def version(self):
+        """Changes when any module store is rebuilt, like vectorstore_version for one store"""
+        return hashlib.sha256("".join(f"{module.name}:{vectorstore_version(module.db_path)}"
+                                      for module in self.modules).encode()).hexdigest()[:16]
+
+    def fingerprint(self):
+        """Like store_fingerprint for one store"""
+        return hashlib.sha256("".join(f"{module.name}:{store_fingerprint(module.db_path)}"
+                                      for module in self.modules).encode()).hexdigest()[:16]
+
+    def __len__(self):
+        return len(self.modules)
+
+    def __iter__(self):
+        return iter(self.modules)
+
+
+def load_registry(modules_file=MODULES_FILE, db_dir=DEFAULT_DB_DIR):
+    """The modules in modules_file, or the single store at db_dir when there is no such file"""
+    if modules_file is not None and Path(modules_file).exists():
+        return ModuleRegistry.from_file(modules_file)
+    return ModuleRegistry.single(db_dir)
+
+
+class ModuleRouter:
+    """Picks the modules to search for a question: keyword matches first, then centroid similarity"""
+
+    def __init__(self, registry, margin=ROUTE_MARGIN, max_modules=MAX_ROUTED_MODULES):
+        self.registry = registry
+        self.margin = margin
+        self.max_modules = max_modules
+        # Every module's centroids in one matrix, with the module each row belongs to
+        centroids, owners = [], []
+        for i, module in enumerate(registry):
+            module_centroids = module.centroids()
+            if module_centroids is not None:
+                centroids.append(np.asarray(module_centroids, dtype=np.float32))
+                owners += [i] * len(module_centroids)
+        self.centroids = np.concatenate(centroids) if centroids else None
+        self.owners = np.asarray(owners, dtype=np.int64)
+
+    def route(self, question, embed_query=None):
+        """
+        (module names, "single", "keywords" or "centroids"). embed_query is
+        only called when no module keyword is in the question.
+        """
+        modules = self.registry.modules
+        if len(modules) == 1:
+            return [modules[0].name], "single"
+
+        tokens = set(tokenize(question))
+        hits = sorted((-module.keyword_hits(tokens), i) for i, module in enumerate(modules))
+        matched = [modules[i].name for count, i in hits if count][:self.max_modules]
+        if matched or embed_query is None or self.centroids is None:
+            return matched or [module.name for module in modules], "keywords"
+
+        similarities = self.centroids @ normalize_rows(embed_query(question))
+        best = np.full(len(modules), -np.inf)
+        np.maximum.at(best, self.owners, similarities)
+        order = np.argsort(-best)
+        return [modules[i].name for i in order[:self.max_modules] if best[i] >= best[order[0]] - self.margin], \
+            "centroids"
+
+
+class ModuleIndexes:
+    """
+    Lazily opened module stores in an LRU bounded by the total size of their
+    files; the module just asked for is never evicted.
+    """
+
+    def __init__(self, registry, embeddings, retriever_type=RETRIEVER, max_bytes=MODULE_CACHE_BYTES, k=5):
+        self.registry = registry
+        self.embeddings = embeddings
+        self.retriever_type = retriever_type
+        self.max_bytes = max_bytes
+        self.k = k
+        self._loaded = OrderedDict()  # name -> (retriever, bytes), least recently used first
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.evictions = 0
+
+    @property
+    def loaded(self):
+        return len(self._loaded)
+
+    @property
+    def loaded_bytes(self):
+        return sum(size for _, size in self._loaded.values())
+
+    def retriever(self, name):
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            # Stores are memory-mapped, so opening one takes milliseconds; holding the lock keeps it to one open
+            module = self.registry.get(name)
+            with span("load_module", module=name):
+                db_path = module.db_path
+                retriever = build_retriever(load_vectorstore(db_path, self.embeddings), load_bm25(db_path),
+                                            load_vector_matrix(db_path), self.retriever_type, self.k)
+            self._loaded[name] = (retriever, module.store_bytes())
+            self.loads += 1
+            while self.loaded_bytes > self.max_bytes and len(self._loaded) > 1:
+                evicted, _ = self._loaded.popitem(last=False)
+                self.evictions += 1
+                print(f"♻️ Unloaded module {evicted} to stay under {self.max_bytes // 2 ** 20} MB")
+            return retriever
+
+    def __str__(self):
+        return (f"{self.loaded}/{len(self.registry)} modules loaded "
+                f"({self.loaded_bytes / 2 ** 20:.0f} of {self.max_bytes // 2 ** 20} MB), "
+                f"{self.loads} loads, {self.evictions} evictions")
+
+
+class RoutedRetriever(BaseRetriever):
+    """
+    Retrieves from the modules the router picks for each question, merging
+    their results rank by rank; documents are tagged with their module.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    indexes: Any
+    router: Any
+    k: int = 5
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        # Centroid routing embeds the question; the module retrievers then get that vector from the query cache
+        with span("route") as current:
+            names, method = self.router.route(query, self.indexes.embeddings.embed_query)
+            current.set(modules=",".join(names), method=method)
+
+        rankings = []
+        for name in names:
+            # Tagged copies: the module retrievers may hand out shared document objects
+            rankings.append([Document(page_content=doc.page_content, metadata={**doc.metadata, "module": name})
+                             for doc in self.indexes.retriever(name).invoke(query)])
+        if len(rankings) == 1:
+            return rankings[0]
+        merged = [doc for rank in zip(*rankings) for doc in rank]
+        merged += [doc for docs in rankings for doc in docs[min(map(len, rankings)):]]
+        return merged[:self.k]
+
+
+def routed_retriever(registry, embeddings, retriever_type=RETRIEVER, max_bytes=MODULE_CACHE_BYTES, k=5):
+    """The retriever create_qa_bot uses for a registry; embeddings must be the shared CachedEmbeddings"""
+    return RoutedRetriever(indexes=ModuleIndexes(registry, embeddings, retriever_type, max_bytes, k),
+                           router=ModuleRouter(registry), k=k)
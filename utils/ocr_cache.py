@@ -0,0 +1,54 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+OCR_CACHE_DIR = Path(__file__).parent.parent / "db" / "ocr_cache"
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hash a file's bytes without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OCRPageCache:
+    """
+    On-disk cache of per-page OCR results.
+
+    Each page is stored as its own JSON file, keyed by a hash of the PDF
+    bytes, the page number, the DPI and the preprocessing settings, so a
+    crashed run can resume from the last page it finished and a changed PDF
+    or setting never reuses stale text.
+    """
+
+    def __init__(self, pdf_file, dpi, settings, cache_dir=OCR_CACHE_DIR):
+        self.pdf_hash = file_sha256(pdf_file)
+        self.settings_key = json.dumps({"dpi": dpi, **settings}, sort_keys=True)
+        self.dir = Path(cache_dir) / self.pdf_hash[:16]
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, page_number):
+        key = hashlib.sha256(f"{self.pdf_hash}|{page_number}|{self.settings_key}".encode()).hexdigest()
+        return self.dir / f"p{page_number:05d}_{key[:16]}.json"
+
+    def has(self, page_number):
+        return self._path(page_number).exists()
+
+    def get(self, page_number):
+        path = self._path(page_number)
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def put(self, page_number, record):
+        # Write to a temp file first so a crash never leaves a truncated page behind
+        path = self._path(page_number)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,153 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+from pdf2image import convert_from_path, pdfinfo_from_path
+from PIL import ImageEnhance
+
+from utils.text_layer import text_layer_pages
+
+DPI = 300
+PAGE_BATCH_SIZE = 4  # Pages rendered per worker task
+OCR_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+OCR_LANG = "en"
+CONTRAST = 2
+
+# Everything that changes OCR output besides the PDF itself and the DPI; part of the cache key
+PREPROCESS_SETTINGS = {"grayscale": True, "contrast": CONTRAST, "lang": OCR_LANG, "use_angle_cls": True}
+
+# One PaddleOCR model per worker process, loaded once by _init_worker
+_ocr = None
+
+
+def preprocess_image(image):
+    """Convert to grayscale and enhance contrast"""
+    image = image.convert("L")  # Convert to grayscale
+    enhancer = ImageEnhance.Contrast(image)
+    return enhancer.enhance(CONTRAST)  # Increase contrast
+
+
+def pil_to_numpy(image):
+    """Convert PIL image to NumPy array for PaddleOCR"""
+    return np.array(image)
+
+
+def page_record(result):
+    """Turn PaddleOCR output for one page into a JSON-friendly dict of text and boxes"""
+    words = result[0] if result and result[0] else []
+    boxes = [
+        {"box": [[float(x), float(y)] for x, y in word[0]], "text": word[1][0], "confidence": float(word[1][1])}
+        for word in words
+    ]
+    return {"text": " ".join(box["text"] for box in boxes), "boxes": boxes}
+
+
+def _init_worker(lang):
+    """Load the OCR model once per worker instead of once per page"""
+    global _ocr
+    # Every worker already runs on its own core, so keep Paddle single-threaded
+    os.environ.setdefault("OMP_NUM_THREADS", "1")
+    from paddleocr import PaddleOCR
+
+    _ocr = PaddleOCR(use_angle_cls=True, lang=lang)  # Ensure English OCR model
+
+
+def _ocr_page_batch(pdf_file, first_page, last_page, dpi):
+    """Render pages first_page..last_page and OCR them one at a time"""
+    images = convert_from_path(pdf_file, fmt="png", dpi=dpi, first_page=first_page, last_page=last_page)
+    pages = []
+    for page_number, image in enumerate(images, start=first_page):
+        result = _ocr.ocr(pil_to_numpy(preprocess_image(image)))
+        pages.append((page_number, page_record(result)))
+        image.close()
+    return pages
+
+
+def count_pages(pdf_file):
+    return pdfinfo_from_path(str(pdf_file))["Pages"]
+
+
+def _missing_page_batches(pages, batch_size):
+    """Group page numbers into runs of consecutive pages, at most batch_size long"""
+    batches = []
+    for page_number in pages:
+        if batches and batches[-1][1] == page_number - 1 and page_number - batches[-1][0] < batch_size:
+            batches[-1] = (batches[-1][0], page_number)
+        else:
+            batches.append((page_number, page_number))
+    return batches
+
+
+def ocr_pdf_pages(pdf_file, dpi=DPI, workers=OCR_WORKERS, batch_size=PAGE_BATCH_SIZE, cache=None,
+                  use_text_layer=True):
+    """
+    Yields (page_number, record, source) for every page of the PDF, in page order.
+
+    `record` holds the page text and word boxes. `source` is "text" when the
+    page's embedded text layer was good enough to skip OCR, "cache" when the
+    page came from the OCRPageCache and "ocr" when it was OCR'd in this run.
+    Fresh pages are written to the cache as they arrive, so an interrupted
+    run picks up where it stopped.
+
+    Pages are rendered in small batches inside the worker processes, so the
+    parent never holds more than a window of page records and no page images.
+    """
+    page_count = count_pages(pdf_file)
+    # Born-digital pages are read straight from the PDF; only the rest go to OCR
+    text_pages = text_layer_pages(pdf_file) if use_text_layer else {}
+    cached_pages = {
+        p for p in range(1, page_count + 1)
+        if p not in text_pages and cache is not None and cache.has(p)
+    }
+    batches = _missing_page_batches(
+        [p for p in range(1, page_count + 1) if p not in text_pages and p not in cached_pages], batch_size
+    )
+    window_pages = workers * 2 * batch_size
+
+    if not batches:
+        for page_number in range(1, page_count + 1):
+            if page_number in text_pages:
+                yield page_number, {"text": text_pages.pop(page_number), "boxes": []}, "text"
+            else:
+                yield page_number, cache.get(page_number), "cache"
+        return
+
+    # spawn gives every worker a clean interpreter instead of a forked copy of Paddle's threads
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=context,
+                             initializer=_init_worker, initargs=(PREPROCESS_SETTINGS["lang"],)) as pool:
+        pending = {}
+        finished_pages = {}
+        next_batch = 0
+        next_page = 1
+
+        while next_page <= page_count:
+            # Keep the pool busy, but never run more than a window of pages ahead of the writer
+            while next_batch < len(batches) and batches[next_batch][0] < next_page + window_pages:
+                first, last = batches[next_batch]
+                pending[pool.submit(_ocr_page_batch, str(pdf_file), first, last, dpi)] = (first, last)
+                next_batch += 1
+
+            if next_page in text_pages:
+                yield next_page, {"text": text_pages.pop(next_page), "boxes": []}, "text"
+                next_page += 1
+                continue
+            if next_page in cached_pages:
+                yield next_page, cache.get(next_page), "cache"
+                next_page += 1
+                continue
+            if next_page in finished_pages:
+                yield next_page, finished_pages.pop(next_page), "ocr"
+                next_page += 1
+                continue
+
+            if not pending:
+                raise RuntimeError(f"OCR returned no result for page {next_page} of {pdf_file}")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                for page_number, record in future.result():
+                    if cache is not None:
+                        cache.put(page_number, record)
+                    finished_pages[page_number] = record
@@ -1,11 +1,10 @@
 
-from pdf2image import convert_from_path
+import argparse
+import getpass
 import os
-import re
+import sys
+from itertools import islice
 from pathlib import Path
-import numpy as np
-from paddleocr import PaddleOCR
-from PIL import Image, ImageEnhance
 from dotenv import load_dotenv
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings.openai import OpenAIEmbeddings
@@ -13,20 +12,30 @@ from langchain.vectorstores import FAISS
 from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.schema import Document
 import faiss
-import pickle
 
 
 CURRENT_DIR = Path(__file__).parent
 PDF_FILE = CURRENT_DIR.parent / "input_files" / "module4.pdf"
 DB_PATH = CURRENT_DIR.parent/"db"/"module4_vectorstore" 
 
-CHUNKS_FILE = CURRENT_DIR.parent / "db" /"chunks"/ "processed_chunks.pkl"
+CHUNKS_DIR = CURRENT_DIR.parent / "db" / "chunks" / "processed"
+OCR_TEXT_FILE = CURRENT_DIR.parent / "db" / "chunks" / "ocr_text.txt"
 
-# Save structured chunks
+sys.path.append(str(CURRENT_DIR.parent))
+from utils.chunk_store import read_chunks, write_chunks
+from utils.chunker import CHUNK_TOKENS, OVERLAP_TOKENS, chunk_pages
+from utils.faiss_index import save_vectorstore_atomic
+from utils.ocr_cache import OCRPageCache
+from utils.ocr_pipeline import DPI, OCR_WORKERS, PAGE_BATCH_SIZE, PREPROCESS_SETTINGS, ocr_pdf_pages
+
+load_dotenv()
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+
+# Save structured chunks as they are produced, without holding them all in memory
 def save_chunks(structured_chunks):
-    with open(CHUNKS_FILE, "wb") as f:
-        pickle.dump(structured_chunks, f)
-    print(f"✅ Stored processed chunks at: {CHUNKS_FILE}")
+    n_chunks = write_chunks(CHUNKS_DIR, structured_chunks)
+    print(f"✅ Stored {n_chunks} processed chunks at: {CHUNKS_DIR}")
+    return n_chunks
 
 
 def index_text_with_faiss(structured_chunks):
@@ -36,7 +45,7 @@ def index_text_with_faiss(structured_chunks):
     embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
 
     # Convert structured chunks to LangChain Document objects
-    docs = [Document(page_content=content, metadata={"section": title}) for title, content in structured_chunks]
+    docs = [Document(page_content=content, metadata={"section": title}) for title, content, *_ in structured_chunks]
 
     # Initialize FAISS index and metadata storage
     index = faiss.IndexFlatL2(1536)  # 1536 is the OpenAI embedding size
@@ -55,8 +64,7 @@ def index_text_with_faiss(structured_chunks):
     vectorstore.add_documents(docs)
 
     # Save FAISS Index with metadata
-    DB_PATH.mkdir(parents=True, exist_ok=True)
-    vectorstore.save_local(str(DB_PATH))
+    save_vectorstore_atomic(vectorstore, DB_PATH)
 
     print(f"✅ FAISS vectorstore saved at: {DB_PATH}")
 
@@ -64,52 +72,6 @@ def index_text_with_faiss(structured_chunks):
 
 
 
-def preprocess_image(image):
-    """Convert to grayscale and enhance contrast"""
-    image = image.convert("L")  # Convert to grayscale
-    enhancer = ImageEnhance.Contrast(image)
-    return enhancer.enhance(2)  # Increase contrast
-
-def pil_to_numpy(image):
-    """Convert PIL image to NumPy array for PaddleOCR"""
-    return np.array(image)
-
-
-def split_text_smartly(ocr_text):
-    """
-    Splits OCR text into meaningful chunks using:
-    1. Chapter & section headings
-    2. Paragraph-based chunking with overlap
-    """
-
-    # Step 1: Detect chapters and section headings (case-insensitive)
-    chapter_pattern = r"(chapter\s+\d+|section\s+\d+\.\d+)"
-    matches = list(re.finditer(chapter_pattern, ocr_text, re.IGNORECASE))
-
-    chunks = []
-    for i in range(len(matches)):
-        start_idx = matches[i].start()
-        end_idx = matches[i+1].start() if i + 1 < len(matches) else len(ocr_text)
-        
-        section_title = matches[i].group(0)
-        section_content = ocr_text[start_idx:end_idx].strip()
-
-        # Step 2: Further split into paragraph-sized chunks (500 chars per chunk, 100 overlap)
-        paragraph_chunks = []
-        words = section_content.split()
-        chunk_size = 80  # Adjust word count per chunk
-        overlap = 20
-
-        for j in range(0, len(words), chunk_size - overlap):
-            paragraph = " ".join(words[j:j + chunk_size]).strip()
-            if paragraph:
-                paragraph_chunks.append((section_title, paragraph))
-
-        chunks.extend(paragraph_chunks)
-
-    return chunks
-
-
 # def index_text_with_faiss(structured_chunks):
 #     """
 #     Converts structured text chunks into FAISS embeddings for retrieval.
@@ -117,7 +79,7 @@ def split_text_smartly(ocr_text):
 #     embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
     
 #     # Convert structured chunks to LangChain Document objects
-#     docs = [Document(page_content=content, metadata={"section": title}) for title, content in structured_chunks]
+#     docs = [Document(page_content=content, metadata={"section": title}) for title, content, *_ in structured_chunks]
 
 #     # Create FAISS vectorstore
 #     vectorstore = FAISS.from_documents(docs, embeddings)
@@ -128,42 +90,67 @@ def split_text_smartly(ocr_text):
 
 #     print(f"✅ FAISS vectorstore saved at: {DB_PATH}")
 
-load_dotenv()
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not os.getenv("OPENAI_API_KEY"):
-        os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
-
-
-# Convert PDF pages to images
-images = convert_from_path(PDF_FILE, fmt='png', dpi=300)
-images = [preprocess_image(img) for img in images]  # Preprocess images
-
-# Convert images from PIL to NumPy (Required for PaddleOCR)
-numpy_images = [pil_to_numpy(img) for img in images]
-
-# Initialize PaddleOCR
-ocr = PaddleOCR(use_angle_cls=True, lang="en")  # Ensure English OCR model
-
-# Run OCR on NumPy images
-results = [ocr.ocr(img) for img in numpy_images]
-
-# Convert OCR output into readable text
-ocr_text = "\n".join([" ".join([word[1][0] for word in line[0]]) for line in results if line])
-
-# Check if OCR extracted anything
-if not ocr_text.strip():
-    print("❌ OCR extracted empty text. Try increasing DPI or using PaddleOCR with another language model.")
-    exit()
-
-# Clean text
-cleaned_ocr_text = re.sub(r'\s+', ' ', ocr_text).strip()
-
-structured_chunks = split_text_smartly(cleaned_ocr_text)
-
-for title, content in structured_chunks[:5]:  # Print first 5 chunks
-    print(f"\n📝 {title} (First 300 chars):")
-    print(content[:300])
-
-save_chunks(structured_chunks)
-
-# index_text_with_faiss(structured_chunks)
\ No newline at end of file
+def ocr_pdf(pdf_file, dpi, workers, batch_size, use_cache=True, use_text_layer=True):
+    """
+    Streams the PDF through the OCR worker pool, writing each page's text
+    to OCR_TEXT_FILE and yielding (page_number, text) in page order as soon
+    as it is available.
+    Pages with a usable text layer skip OCR entirely, and pages already in
+    the OCR cache are read from disk instead of re-OCR'd.
+    """
+    cache = OCRPageCache(pdf_file, dpi, PREPROCESS_SETTINGS) if use_cache else None
+    OCR_TEXT_FILE.parent.mkdir(parents=True, exist_ok=True)
+    counts = {"text": 0, "cache": 0, "ocr": 0}
+    labels = {"text": "text layer", "cache": "OCR cache", "ocr": "OCR"}
+    with open(OCR_TEXT_FILE, "w", encoding="utf-8") as out:
+        for page_number, record, source in ocr_pdf_pages(pdf_file, dpi=dpi, workers=workers,
+                                                         batch_size=batch_size, cache=cache,
+                                                         use_text_layer=use_text_layer):
+            out.write(f"--- page {page_number} ---\n{record['text']}\n")
+            out.flush()
+            counts[source] += 1
+            print(f"📄 Page {page_number}: {labels[source]}")
+            yield page_number, record["text"]
+    print(f"✅ Stored OCR text at: {OCR_TEXT_FILE}")
+    print(f"🗂️ Pages from text layer: {counts['text']}, from cache: {counts['cache']}, OCR'd fresh: {counts['ocr']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OCR the module PDF and split it into chunks.")
+    parser.add_argument("--pdf", type=Path, default=PDF_FILE)
+    parser.add_argument("--dpi", type=int, default=DPI)
+    parser.add_argument("--workers", type=int, default=OCR_WORKERS, help="OCR worker processes (one model each)")
+    parser.add_argument("--batch-size", type=int, default=PAGE_BATCH_SIZE, help="Pages rendered per worker task")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore the OCR page cache and OCR every page")
+    parser.add_argument("--force-ocr", action="store_true", help="OCR every page even if it has a text layer")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="Maximum tokens per chunk")
+    parser.add_argument("--overlap-tokens", type=int, default=OVERLAP_TOKENS, help="Tokens shared by consecutive chunks")
+    args = parser.parse_args()
+
+    global OPENAI_API_KEY
+    if not OPENAI_API_KEY:
+        OPENAI_API_KEY = os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
+
+    # Read born-digital pages directly; render, preprocess and OCR the rest in parallel
+    pages = ocr_pdf(args.pdf, args.dpi, args.workers, args.batch_size, use_cache=not args.no_cache,
+                    use_text_layer=not args.force_ocr)
+
+    # Chunk pages as they arrive, by token count, with page numbers and character spans,
+    # and write each chunk to the chunk store as soon as it is cut
+    n_chunks = save_chunks(chunk_pages(pages, args.chunk_tokens, args.overlap_tokens))
+
+    # Check if OCR extracted anything
+    if not n_chunks:
+        print("❌ No chunks: OCR extracted no text or no chapter headings. Try increasing DPI or using PaddleOCR with another language model.")
+        sys.exit(1)
+
+    for title, content, metadata in islice(read_chunks(CHUNKS_DIR), 5):  # Print first 5 chunks
+        print(f"\n📝 {title}, pages {metadata['page_start']}-{metadata['page_end']}, {metadata['tokens']} tokens (First 300 chars):")
+        print(content[:300])
+
+    # index_text_with_faiss(list(read_chunks(CHUNKS_DIR)))
+
+
+# Worker processes re-import this script under spawn, so keep the pipeline behind the main guard
+if __name__ == "__main__":
+    main()
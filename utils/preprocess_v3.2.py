@@ -1,7 +1,10 @@
 
 from pdf2image import convert_from_path
+import argparse
+import getpass
 import os
 import re
+import sys
 from pathlib import Path
 import numpy as np
 from paddleocr import PaddleOCR
@@ -13,14 +16,23 @@ from langchain.vectorstores import FAISS
 from langchain.docstore.in_memory import InMemoryDocstore
 from langchain.schema import Document
 import faiss
-import pickle
 
 
 CURRENT_DIR = Path(__file__).parent
 PDF_FILE = CURRENT_DIR.parent / "input_files" / "module4.pdf"
 DB_PATH = CURRENT_DIR.parent/"db"/"module4_vectorstore" 
 
-CHUNKS_FILE = CURRENT_DIR.parent / "db" /"chunks"/ "processed_chunks.pkl"
+CHUNKS_DIR = CURRENT_DIR.parent / "db" / "chunks" / "processed"
+LEGACY_CHUNKS_FILE = CURRENT_DIR.parent / "db" / "chunks" / "processed_chunks.pkl"
+
+sys.path.append(str(CURRENT_DIR.parent))
+from utils.chunk_store import load_chunks
+from utils.embedding_cache import EmbeddingCache
+from utils.faiss_index import (INDEX_TYPE, INDEX_TYPES, build_vectorstore, docs_by_id, index_type_of,
+                               is_incremental, load_editable_vectorstore, save_vectorstore_atomic,
+                               update_vectorstore)
+from utils.query_embeddings import (EMBEDDING_BACKEND, EMBEDDING_BACKENDS, document_embedder, embedding_model,
+                                    read_embedding_info)
 
 def debug_faiss(vectorstore):
     print(f"🛠 FAISS Index Size: {vectorstore.index.ntotal}")
@@ -32,51 +44,83 @@ def debug_faiss(vectorstore):
         for key, value in list(vectorstore.docstore._dict.items())[:3]:
             print(f"📜 {key}: {value}")
 
-def index_text_with_faiss(structured_chunks):
-
-    embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-
-    # Convert structured chunks to LangChain Document objects
-    docs = [Document(page_content=content, metadata={"section": title}) for title, content in structured_chunks]
-
-    # Initialize FAISS index and metadata storage
-    index = faiss.IndexFlatL2(1536)  # 1536 is the OpenAI embedding size
-    docstore = InMemoryDocstore({})
-    index_to_docstore_id = {}
-
-    # Create FAISS vectorstore manually
-    vectorstore = FAISS(
-        index=index,
-        docstore=docstore,
-        index_to_docstore_id=index_to_docstore_id,
-        embedding_function=embeddings.embed_query
-    )
+def index_text_with_faiss(structured_chunks, rebuild=False, index_type=INDEX_TYPE,
+                          embedding_backend=EMBEDDING_BACKEND):
+    """
+    Brings the FAISS store at DB_PATH in line with structured_chunks.
+    Existing stores are updated in place: only new chunks are embedded and
+    added, and chunks that disappeared are removed. The result is written
+    to a temp directory and swapped in, so the served index is never half-written.
+    """
+    # Convert structured chunks to LangChain Documents keyed by stable chunk id
+    docs = docs_by_id(structured_chunks)
+
+    # Embed in batches with several requests in flight instead of one request per chunk
+    # (or on the CPU with the local model); chunks embedded by an earlier run come from the local cache
+    embedder = document_embedder(embedding_backend, OPENAI_API_KEY, cache=EmbeddingCache())
+    embeddings = embedder if embedding_backend == "local" else OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+
+    vectorstore = None
+    if not rebuild and (DB_PATH / "index.faiss").exists():
+        vectorstore = load_editable_vectorstore(DB_PATH, embeddings)
+        _, stored_model = read_embedding_info(DB_PATH)
+        if stored_model != embedding_model(embedding_backend):
+            print(f"⚠️ Stored index was embedded with {stored_model}, "
+                  f"rebuilding it with {embedding_model(embedding_backend)}")
+            vectorstore = None
+        elif not is_incremental(vectorstore):
+            print("⚠️ Stored index has no chunk ids, rebuilding it from scratch")
+            vectorstore = None
+        elif index_type_of(vectorstore.index) != index_type:
+            print(f"⚠️ Stored index is {index_type_of(vectorstore.index)}, rebuilding it as {index_type}")
+            vectorstore = None
+
+    if vectorstore is not None:
+        try:
+            added, removed = update_vectorstore(vectorstore, docs, embedder)
+            print(f"🔄 Updated index: {added} chunks added, {removed} removed, {len(docs) - added} unchanged")
+        except ValueError as e:
+            print(f"⚠️ {e}, rebuilding it from scratch")
+            vectorstore = None
+
+    if vectorstore is None:
+        try:
+            vectorstore = build_vectorstore(docs, embedder, embeddings.embed_query, index_type)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        print(f"🆕 Built {index_type} index with {len(docs)} chunks")
+    print(f"⚡ Embedding: {embedder.stats}")
 
-    # Add documents to FAISS
-    vectorstore.add_documents(docs)
     debug_faiss(vectorstore)
     # Save FAISS Index with metadata
-    DB_PATH.mkdir(parents=True, exist_ok=True)
-    vectorstore.save_local(str(DB_PATH))
+    save_vectorstore_atomic(vectorstore, DB_PATH, embedding_backend)
 
     print(f"✅ FAISS vectorstore saved at: {DB_PATH}")
 
-def load_chunks():
-    if CHUNKS_FILE.exists():
-        with open(CHUNKS_FILE, "rb") as f:
-            return pickle.load(f)
-    return None
+parser = argparse.ArgumentParser(description="Embed the processed chunks into the FAISS vectorstore.")
+parser.add_argument("--rebuild", action="store_true", help="Rebuild the index instead of updating it in place")
+parser.add_argument("--index-type", choices=INDEX_TYPES, default=INDEX_TYPE,
+                    help="FAISS index to build (default from CAIA_INDEX_TYPE, else flat)")
+parser.add_argument("--embedding-backend", choices=EMBEDDING_BACKENDS, default=EMBEDDING_BACKEND,
+                    help="openai, or local for a sentence-transformers model on the CPU "
+                         "(default from CAIA_EMBEDDING_BACKEND, else openai)")
+args = parser.parse_args()
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not os.getenv("OPENAI_API_KEY"):
-        os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
+if not os.getenv("OPENAI_API_KEY") and args.embedding_backend == "openai":
+        OPENAI_API_KEY = os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
 
 
-structured_chunks = load_chunks()
+structured_chunks = load_chunks(CHUNKS_DIR, legacy_pickle=LEGACY_CHUNKS_FILE)
+if structured_chunks is None:
+    print(f"❌ No processed chunks at {CHUNKS_DIR}; run preprocess_v3.1.py first")
+    sys.exit(1)
 
 print(f"📝 Total chunks to index: {len(structured_chunks)}")
-for title, content in structured_chunks[:5]:  # Print first 5 chunks
+for title, content, *_ in structured_chunks[:5]:  # Print first 5 chunks
     print(f"\n🔹 {title} (First 200 chars): {content[:200]}")
 
-index_text_with_faiss(structured_chunks)    
+index_text_with_faiss(structured_chunks, rebuild=args.rebuild, index_type=args.index_type,
+                      embedding_backend=args.embedding_backend)
@@ -0,0 +1,44 @@
+import threading
+
+
+def usage_counts(usage_metadata):
+    """(input, cached input, output) tokens from a LangChain AIMessage usage_metadata dict"""
+    if not usage_metadata:
+        return 0, 0, 0
+    details = usage_metadata.get("input_token_details") or {}
+    return (usage_metadata.get("input_tokens", 0), details.get("cache_read", 0) or 0,
+            usage_metadata.get("output_tokens", 0))
+
+
+class PromptUsage:
+    """
+    Running totals of prompt tokens and how many of them the provider served
+    from its prompt cache, fed with the usage metadata of each response.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.last = (0, 0, 0)
+
+    def record(self, usage_metadata):
+        counts = usage_counts(usage_metadata)
+        with self._lock:
+            self.requests += 1
+            self.input_tokens += counts[0]
+            self.cached_tokens += counts[1]
+            self.output_tokens += counts[2]
+            self.last = counts
+        return counts
+
+    @property
+    def cache_hit_rate(self):
+        return self.cached_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def __str__(self):
+        input_tokens, cached, output = self.last
+        return (f"{input_tokens} input tokens ({cached} cached), {output} output; "
+                f"session {self.cache_hit_rate:.0%} of {self.input_tokens} input tokens cached")
@@ -0,0 +1,119 @@
+import os
+from pathlib import Path
+
+from langchain_community.vectorstores import FAISS
+from langchain_openai import ChatOpenAI
+try:
+    from langchain.chains.retrieval import create_retrieval_chain
+    from langchain.chains.combine_documents.stuff import create_stuff_documents_chain
+except ImportError:  # langchain >= 1.0 moved the classic chains to langchain-classic
+    from langchain_classic.chains.retrieval import create_retrieval_chain
+    from langchain_classic.chains.combine_documents.stuff import create_stuff_documents_chain
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from utils.bm25_index import BM25_FILE, BM25Index, has_bm25
+from utils.hybrid_retriever import HybridRetriever
+from utils.mmap_store import is_mmap_store, load_mmap_vectorstore
+from utils.query_rewriter import QueryRewriter
+from utils.tracing import callback_handler
+from utils.vector_matrix import MatrixMMRRetriever, VectorMatrix, has_vector_matrix
+
+RETRIEVERS = ("hybrid", "mmr")
+RETRIEVER = os.getenv("CAIA_RETRIEVER", "hybrid")
+
+MODULE_2_INDEX = """
+📖 **Module 2: Advanced AI Applications and Ethics**
+- **Chapter 7**: Learning Recommender Systems
+- **Chapter 8**: Principles of Computer Vision
+- **Chapter 9**: Responsible and Ethical AI
+- **Chapter 10**: Data Strategies in Machine Learning
+"""
+
+
+# Shared by the chat chain and the batch QA CLI
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an AI tutor specializing in CAIA(Certified Artificial Intelligence Accelerator) Module 2: Advanced AI Applications and Ethics.
+        You are NOT related to finance, investments, or portfolio management.
+        Your goal is to help users understand AI concepts, machine learning strategies, recommender systems,
+        computer vision, responsible AI, and data strategies.
+
+        Use the following pieces of retrieved context to answer the question. If you don't know the answer, just say that you don't know. Use three sentences maximum and keep the answer concise."""),
+    MessagesPlaceholder("chat_history"),
+    ("human", "Context: {context}\n\nQuestion: {input}")
+])
+
+
+def create_answer_chain(llm):
+    """Answers {input} from already retrieved {context} documents and {chat_history}"""
+    return create_stuff_documents_chain(llm, QA_PROMPT)
+
+
+def capabilities_answer(prompt):
+    """Canned reply for questions about the bot itself, or None"""
+    if any(keyword in prompt.lower() for keyword in ["what can you do"]):
+        return f"I can help you with \n{MODULE_2_INDEX}"
+    return None
+
+
+def load_vectorstore(db_dir, embeddings):
+    # Memory-mapped stores start in constant time and share pages across app processes
+    if is_mmap_store(db_dir):
+        return load_mmap_vectorstore(db_dir, embeddings)
+    print(f"⚠️ {db_dir} is an old pickled store; convert it with: python utils/mmap_store.py {db_dir}")
+    return FAISS.load_local(str(db_dir), embeddings, allow_dangerous_deserialization=True)
+
+
+def load_bm25(db_dir):
+    """The store's BM25 keyword index, or None for stores saved before it existed"""
+    return BM25Index(Path(db_dir) / BM25_FILE) if has_bm25(db_dir) else None
+
+
+def load_vector_matrix(db_dir):
+    """The store's normalised vector matrix, or None for stores saved before it existed"""
+    return VectorMatrix(db_dir) if has_vector_matrix(db_dir) else None
+
+
+def build_retriever(vectorstore, bm25=None, matrix=None, retriever_type=RETRIEVER, k=5):
+    """The best retriever a store supports: hybrid, vectorised MMR, or LangChain's MMR"""
+    if bm25 is not None and retriever_type == "hybrid":
+        # Keyword and vector rankings fused; exact-term lookups skip the embeddings call
+        return HybridRetriever(vectorstore=vectorstore, bm25=bm25, k=k)
+    if matrix is not None:
+        # MMR as a few NumPy matrix operations instead of per-candidate reconstruction in Python
+        return MatrixMMRRetriever(vectorstore=vectorstore, matrix=matrix, k=k)
+    return vectorstore.as_retriever(
+        search_type="mmr",
+        search_kwargs={"k": k}
+    )
+
+
+def create_qa_bot(vectorstore, openai_api_key=None, bm25=None, matrix=None, retriever_type=RETRIEVER,
+                  retriever=None):
+    """QA chain over one store, or over `retriever` (the multi-module RoutedRetriever) when given"""
+    # Token usage of every call (streamed ones too) goes to the request's tracing spans
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, openai_api_key=openai_api_key, stream_usage=True,
+                     callbacks=[callback_handler])
+    if retriever is None:
+        retriever = build_retriever(vectorstore, bm25, matrix, retriever_type)
+
+    # Create history-aware retriever prompt
+    contextualize_q_prompt = ChatPromptTemplate.from_messages([
+        ("system", "Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question, in its original language."),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}")
+    ])
+
+
+    # Rephrase follow-ups into standalone questions, skipping the LLM call when the question already is one
+    query_rewriter = QueryRewriter(llm, contextualize_q_prompt)
+    history_aware_retriever = query_rewriter.as_runnable() | retriever
+
+    # Create the question answering chain
+    question_answer_chain = create_answer_chain(llm)
+
+    # Create the retrieval chain
+    # Traced: retrieval, prompt stuffing and the answer call get a span each
+    qa_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain).with_config(
+        callbacks=[callback_handler])
+
+    return qa_chain, query_rewriter
@@ -0,0 +1,253 @@
+"""
+Query-time embeddings and the choice of embedding backend.
+
+Every turn embeds the (rephrased) question at least once: the semantic
+answer cache and the retriever both need it. CachedEmbeddings keeps recent
+question vectors in memory and every vector on disk (the same SQLite
+EmbeddingCache the indexer uses), keyed by the normalised question, so a
+repeated or re-asked question costs no embeddings round trip.
+
+Two backends are available, picked with CAIA_EMBEDDING_BACKEND or
+--embedding-backend when indexing:
+
+    openai   text-embedding-ada-002 over the API (default)
+    local    a sentence-transformers model on the CPU, no network needed
+
+Vectors from different backends are not comparable, so the backend and model
+a store was built with are recorded in its embedding.json and used again
+when the store is queried.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from langchain_core.embeddings import Embeddings
+
+from utils.embedding_builder import EMBEDDING_MODEL, BatchEmbedder, EmbeddingStats
+from utils.embedding_cache import EMBEDDING_CACHE_FILE, EmbeddingCache, text_hash
+from utils.semantic_cache import normalize_text
+from utils.tracing import span
+
+EMBEDDING_BACKENDS = ["openai", "local"]
+EMBEDDING_BACKEND = os.getenv("CAIA_EMBEDDING_BACKEND", "openai")
+LOCAL_EMBEDDING_MODEL = os.getenv("CAIA_LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_BATCH_SIZE = 64
+EMBEDDING_INFO_FILE = "embedding.json"
+QUERY_CACHE_SIZE = 2048  # Question vectors kept in memory
+QUERY_CACHE_FILE = Path(os.getenv("CAIA_QUERY_EMBEDDING_CACHE") or EMBEDDING_CACHE_FILE)
+
+
+class LocalEmbedder(Embeddings):
+    """
+    sentence-transformers model on the CPU. Usable both as the indexer's
+    embedder (embed, stats, optional EmbeddingCache) and as the store's
+    query embeddings.
+    """
+
+    def __init__(self, model=LOCAL_EMBEDDING_MODEL, batch_size=LOCAL_BATCH_SIZE, cache=None):
+        try:
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("The local embedding backend needs sentence-transformers: "
+                              "pip install sentence-transformers")
+        self.model = model
+        self.batch_size = batch_size
+        self.cache = cache
+        self.stats = EmbeddingStats()
+        self._model = SentenceTransformer(model, device="cpu")
+        self._lock = threading.Lock()  # encode() is not safe to call from several threads at once
+
+    def _embed_uncached(self, texts):
+        started = time.perf_counter()
+        with self._lock:
+            vectors = self._model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+        self.stats.requests += 1
+        self.stats.seconds += time.perf_counter() - started
+        return [vector.tolist() for vector in vectors]
+
+    def embed(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._embed_uncached(texts)
+
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model, set(hashes))
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        self.stats.cache_hits += sum(1 for key in hashes if key not in missing)
+        self.stats.cache_misses += sum(1 for key in hashes if key in missing)
+        if missing:
+            fresh = self._embed_uncached(list(missing.values()))
+            self.cache.put_many(self.model, missing.keys(), fresh)
+            vectors.update(zip(missing.keys(), fresh))
+        return [list(map(float, vectors[key])) for key in hashes]
+
+    def embed_documents(self, texts):
+        return self.embed(texts)
+
+    def embed_query(self, text):
+        return self.embed([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Query embeddings behind an in-process LRU and a persistent SQLite cache,
+    both keyed by the lowercased, whitespace-collapsed question, so
+    "What is MMR?" and "what is  mmr?" share one vector while "C++" and
+    "C#" do not. Documents pass straight through.
+    """
+
+    def __init__(self, embeddings, model, store=None, max_entries=QUERY_CACHE_SIZE):
+        self.embeddings = embeddings
+        # Kept apart from the indexer's exact-text entries for the same model, and from the
+        # ":query" entries keyed with punctuation stripped, under which "C++" and "C#" collided
+        self.cache_model = f"{model}:query2"
+        self.store = store
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._recent = OrderedDict()  # text hash -> vector, least recently used first
+        self._lock = threading.Lock()
+
+    def _key(self, text):
+        return text_hash(normalize_text(text) or text)
+
+    def _cached(self, key):
+        """(vector, "memory" or "disk"), or (None, "miss")"""
+        with self._lock:
+            vector = self._recent.get(key)
+            if vector is not None:
+                self._recent.move_to_end(key)
+                self.memory_hits += 1
+                return vector, "memory"
+        if self.store is not None:
+            found = self.store.get_many(self.cache_model, [key])
+            if key in found:
+                vector = [float(value) for value in found[key]]
+                self._remember(key, vector)
+                with self._lock:
+                    self.disk_hits += 1
+                return vector, "disk"
+        return None, "miss"
+
+    def _remember(self, key, vector, persist=False):
+        with self._lock:
+            self._recent[key] = vector
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+        if persist and self.store is not None:
+            self.store.put_many(self.cache_model, [key], [vector])
+
+    def embed_query(self, text):
+        key = self._key(text)
+        with span("embed_query") as current:
+            vector, source = self._cached(key)
+            current.set(cache=source)
+            if vector is None:
+                with self._lock:
+                    self.misses += 1
+                vector = self.embeddings.embed_query(text)
+                self._remember(key, vector, persist=True)
+        return vector
+
+    async def aembed_query(self, text):
+        key = self._key(text)
+        with span("embed_query") as current:
+            vector, source = self._cached(key)
+            current.set(cache=source)
+            if vector is None:
+                with self._lock:
+                    self.misses += 1
+                vector = await self.embeddings.aembed_query(text)
+                self._remember(key, vector, persist=True)
+        return vector
+
+    def embed_queries(self, texts):
+        """Many questions at once: cached ones are reused, the rest embedded in one batched call"""
+        keys = [self._key(text) for text in texts]
+        vectors = {}
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                vector, _ = self._cached(key)
+                if vector is None:
+                    missing[key] = text
+                else:
+                    vectors[key] = vector
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            fresh = self.embeddings.embed_documents(list(missing.values()))
+            for key, vector in zip(missing, fresh):
+                self._remember(key, vector)
+                vectors[key] = vector
+            if self.store is not None:
+                self.store.put_many(self.cache_model, missing.keys(), fresh)
+        return [vectors[key] for key in keys]
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def __str__(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        hit_rate = (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+        return (f"query embeddings: {self.memory_hits} memory hits, {self.disk_hits} disk hits, "
+                f"{self.misses} misses ({hit_rate:.0%} hit rate)")
+
+
+def embedding_model(backend):
+    return LOCAL_EMBEDDING_MODEL if backend == "local" else EMBEDDING_MODEL
+
+
+def write_embedding_info(db_path, backend):
+    with open(Path(db_path) / EMBEDDING_INFO_FILE, "w") as f:
+        json.dump({"backend": backend, "model": embedding_model(backend)}, f)
+
+
+def read_embedding_info(db_path):
+    """(backend, model) a store was built with; stores from before embedding.json used OpenAI"""
+    path = Path(db_path) / EMBEDDING_INFO_FILE
+    if not path.exists():
+        return "openai", EMBEDDING_MODEL
+    with open(path) as f:
+        info = json.load(f)
+    return info["backend"], info["model"]
+
+
+def document_embedder(backend=EMBEDDING_BACKEND, openai_api_key=None, cache=None, base_url=None):
+    """Embedder for indexing: BatchEmbedder for OpenAI, LocalEmbedder for the local model"""
+    if backend == "local":
+        return LocalEmbedder(cache=cache)
+    return BatchEmbedder(api_key=openai_api_key, cache=cache, base_url=base_url)
+
+
+def query_embeddings(db_path=None, openai_api_key=None, backend=None, cache_path=QUERY_CACHE_FILE):
+    """
+    Cached query embeddings for the store at db_path, with the backend and
+    model it was built with. An explicit backend that disagrees with the
+    store is an error rather than silently wrong retrieval.
+    """
+    stored_backend, model = read_embedding_info(db_path) if db_path is not None else (None, None)
+    backend = backend or stored_backend or EMBEDDING_BACKEND
+    if stored_backend is not None and backend != stored_backend:
+        raise ValueError(f"The store at {db_path} was built with the {stored_backend} embedding backend, "
+                         f"not {backend}; rebuild it with --embedding-backend {backend}")
+
+    if backend == "local":
+        embeddings = LocalEmbedder(model or LOCAL_EMBEDDING_MODEL)
+    else:
+        from langchain_openai import OpenAIEmbeddings
+
+        # Only short questions are embedded here, so skip the client-side tokenisation of each one
+        embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key, check_embedding_ctx_length=False)
+    store = EmbeddingCache(cache_path) if cache_path else None
+    return CachedEmbeddings(embeddings, model or embedding_model(backend), store)
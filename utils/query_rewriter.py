@@ -0,0 +1,137 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda
+
+from utils.tracing import span
+
+# Words that only make sense with an earlier turn to resolve them
+REFERRING_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their", "theirs",
+    "he", "she", "him", "her", "his", "former", "latter", "above", "previous", "earlier",
+    "same", "such", "ones", "again", "else",
+}
+FOLLOW_UP_OPENERS = (
+    "and ", "also ", "so ", "but ", "or ", "what about", "how about", "why", "more", "tell me more",
+    "elaborate", "explain further", "explain more", "give me an example", "another", "any other", "continue",
+)
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "of", "to", "in", "on", "for", "with", "and",
+    "or", "what", "which", "who", "whom", "how", "when", "where", "do", "does", "did", "can", "could",
+    "would", "should", "will", "i", "me", "my", "you", "your", "we", "us", "please", "explain", "describe",
+    "define", "tell", "about", "give", "some", "between", "difference", "example", "examples", "mean", "means",
+}
+MIN_CONTENT_WORDS = 2  # Fewer topic words than this is usually an elliptical follow-up
+HISTORY_TURNS = 3  # Messages the rewrite cache key and the overlap check look at
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def content_words(text):
+    return {word for word in WORD_PATTERN.findall(text.lower()) if word not in STOPWORDS}
+
+
+def needs_rewrite(question, history):
+    """
+    Cheap local check for whether a question depends on earlier turns.
+    Only questions that fail it pay for the history-rephrase LLM call.
+    """
+    if not history:
+        return False
+    lowered = question.lower().strip()
+    words = WORD_PATTERN.findall(lowered)
+    if any(word in REFERRING_WORDS for word in words):
+        return True
+    if lowered.startswith(FOLLOW_UP_OPENERS):
+        return True
+
+    topic = content_words(question)
+    if len(topic) < MIN_CONTENT_WORDS:
+        return True
+    # A short question built only from words the last turns used is picking up their thread
+    recent = set().union(*(content_words(message.content) for message in history[-HISTORY_TURNS:]))
+    return len(words) <= 6 and topic <= recent
+
+
+class QueryRewriter:
+    """
+    Turns follow-up questions into standalone ones for retrieval, but only
+    when needs_rewrite says the question depends on the conversation; every
+    other question goes to the retriever untouched. Rewrites are kept in an
+    LRU keyed by the question and the recent history they were made from.
+    """
+
+    def __init__(self, llm, prompt, cache_size=512):
+        self.chain = prompt | llm | StrOutputParser()
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.rewrites = 0
+        self.skipped = 0
+        self.cache_hits = 0
+        self.rewrite_seconds = 0.0
+
+    def _cache_key(self, question, history):
+        recent = "\x00".join(message.content for message in history[-HISTORY_TURNS:])
+        return hashlib.sha256(f"{question.strip().lower()}\x01{recent}".encode()).hexdigest()
+
+    def rewrite(self, question, history):
+        """Standalone version of question, calling the LLM only when it has to"""
+        with span("rewrite") as current:
+            if not history:
+                current.set(outcome="no_history")
+                return question
+            if not needs_rewrite(question, history):
+                with self._lock:
+                    self.skipped += 1
+                current.set(outcome="skipped", seconds_saved=self.average_rewrite_seconds)
+                return question
+
+            key = self._cache_key(question, history)
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.cache_hits += 1
+                    current.set(outcome="cache_hit", cache="hit", seconds_saved=self.average_rewrite_seconds)
+                    return self._cache[key]
+
+            current.set(outcome="rewritten", cache="miss")
+            started = time.perf_counter()
+            standalone = self.chain.invoke({"input": question, "chat_history": history})
+            with self._lock:
+                self.rewrites += 1
+                self.rewrite_seconds += time.perf_counter() - started
+                self._cache[key] = standalone
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return standalone
+
+    def as_runnable(self):
+        """
+        Runnable for create_retrieval_chain's retriever slot. Callers that
+        already rewrote the question pass it as "standalone_input".
+        """
+        return RunnableLambda(
+            lambda inputs: inputs.get("standalone_input") or self.rewrite(inputs["input"], inputs["chat_history"])
+        )
+
+    @property
+    def average_rewrite_seconds(self):
+        """What one skipped or cached rewrite is estimated to save"""
+        return self.rewrite_seconds / self.rewrites if self.rewrites else 0.0
+
+    @property
+    def seconds_saved(self):
+        """Estimated from the average latency of the rewrites that did run"""
+        return (self.skipped + self.cache_hits) * self.average_rewrite_seconds
+
+    def stats(self):
+        return {"rewrites": self.rewrites, "rewrites_skipped": self.skipped, "rewrite_cache_hits": self.cache_hits,
+                "rewrite_seconds_saved": round(self.seconds_saved, 3)}
+
+    def __str__(self):
+        return (f"{self.rewrites} rewrites run, {self.skipped} skipped, {self.cache_hits} from cache, "
+                f"~{self.seconds_saved:.1f}s saved")
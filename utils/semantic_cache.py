@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+from utils.tracing import span
+
+SIMILARITY_THRESHOLD = 0.95  # Cosine similarity above which two questions share an answer
+CACHE_TTL_SECONDS = 24 * 3600
+CACHE_MAX_ENTRIES = 2000
+# Answers precomputed by utils/batch_qa.py --fill-cache, loaded by the apps at startup
+ANSWER_CACHE_FILE = Path(__file__).parent.parent / "db" / "answer_cache.npz"
+# Small files whose contents identify a store: the chunk ids, the embedding model, and legacy pickled docstores
+FINGERPRINT_CONTENT_FILES = ("ids.npy", "embedding.json", "index.pkl")
+
+
+def normalize_text(text):
+    """Lowercased with whitespace collapsed; every other character is kept"""
+    return re.sub(r"\s+", " ", text.lower()).strip()
+
+
+def normalize_question(question):
+    """
+    normalize_text with trailing ?.! trimmed. Other symbols are kept:
+    "What is C++?" and "What is C#?" are different questions.
+    """
+    return normalize_text(question).rstrip("?.!").rstrip()
+
+
+def vectorstore_version(db_path):
+    """
+    Fingerprint of a store directory from file names, sizes and mtimes.
+    Any rebuild changes it, which invalidates answers built on the old index.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(db_path).rglob("*")):
+        if path.is_file():
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def store_fingerprint(db_path):
+    """
+    Like vectorstore_version but from file names, sizes and the contents of
+    FINGERPRINT_CONTENT_FILES instead of mtimes, so it survives a git
+    checkout or a copy to another host; used to tell whether a saved answer
+    cache was built on this store. Chunk ids are content hashes, so a
+    rebuild that edits a chunk changes the fingerprint even when no file
+    changes size.
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(db_path).rglob("*")):
+        if path.is_file():
+            digest.update(f"{path.relative_to(db_path)}:{path.stat().st_size}".encode())
+            if path.name in FINGERPRINT_CONTENT_FILES:
+                digest.update(hashlib.sha256(path.read_bytes()).digest())
+    return digest.hexdigest()[:16]
+
+
+class SemanticCache:
+    """
+    Answer cache looked up by question meaning rather than exact text.
+
+    Questions are embedded and compared by cosine similarity against one
+    contiguous matrix of past questions; the best match above `threshold`
+    returns its stored answer. Entries expire after `ttl` seconds, the least
+    recently used entry is evicted when the cache is full, and the cache is
+    tied to one vectorstore `version` so a rebuilt index starts empty.
+    """
+
+    def __init__(self, embed_query, version, threshold=SIMILARITY_THRESHOLD, ttl=CACHE_TTL_SECONDS,
+                 max_entries=CACHE_MAX_ENTRIES):
+        self.embed_query = embed_query
+        self.version = version
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._matrix = None  # (max_entries, dim) unit vectors, allocated on first store
+        self._used = np.zeros(self.max_entries, dtype=bool)
+        self._slots = OrderedDict()  # slot -> (question, answer, created_at), oldest use first
+        self._exact = {}  # normalized question -> slot
+        self._pending_vectors = OrderedDict()  # normalized question -> vector embedded by lookup
+
+    def _embed(self, question):
+        vector = np.asarray(self.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _expire(self, slot):
+        question, _, _ = self._slots.pop(slot)
+        self._exact.pop(normalize_question(question), None)
+        self._used[slot] = False
+
+    def _alive(self, slot):
+        if time.time() - self._slots[slot][2] > self.ttl:
+            self._expire(slot)
+            return False
+        self._slots.move_to_end(slot)
+        return True
+
+    def set_version(self, version):
+        """Drop every answer if the vectorstore has changed since they were cached"""
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._clear()
+
+    def lookup(self, question):
+        """Returns a cached answer for question, or None"""
+        with span("answer_cache") as current:
+            answer = self._lookup(question)
+            current.set(cache="miss" if answer is None else "hit")
+            return answer
+
+    def _lookup(self, question):
+        key = normalize_question(question)
+        with self._lock:
+            slot = self._exact.get(key)
+            if slot is not None and self._alive(slot):
+                self.hits += 1
+                return self._slots[slot][1]
+
+        # Embed outside the lock; it is a network call
+        vector = self._embed(question)
+        with self._lock:
+            if self._matrix is not None and self._used.any():
+                similarities = np.where(self._used, self._matrix @ vector, -1.0)
+                slot = int(np.argmax(similarities))
+                if similarities[slot] >= self.threshold and self._alive(slot):
+                    self.hits += 1
+                    return self._slots[slot][1]
+            self.misses += 1
+            # Keep the vector so store() does not embed the same question again
+            self._pending_vectors[key] = vector
+            while len(self._pending_vectors) > 64:
+                self._pending_vectors.popitem(last=False)
+        return None
+
+    def store(self, question, answer):
+        key = normalize_question(question)
+        with self._lock:
+            vector = self._pending_vectors.pop(key, None)
+        if vector is None:
+            vector = self._embed(question)
+        with self._lock:
+            self._put(key, question, answer, vector, time.time())
+
+    def _put(self, key, question, answer, vector, created_at):
+        if self._matrix is None:
+            self._matrix = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+        if key in self._exact:
+            slot = self._exact[key]
+            self._slots.pop(slot)
+        elif self._used.all():
+            slot = next(iter(self._slots))  # Least recently used
+            self._expire(slot)
+        else:
+            slot = int(np.argmin(self._used))
+        self._matrix[slot] = vector
+        self._used[slot] = True
+        self._slots[slot] = (question, answer, created_at)
+        self._exact[key] = slot
+
+    def save(self, path, fingerprint):
+        """
+        Write every live entry, with its question vector, to an .npz file
+        tagged with the store fingerprint. The file is replaced atomically.
+        """
+        path = Path(path)
+        with self._lock:
+            now = time.time()
+            slots = [slot for slot, (_, _, created_at) in self._slots.items() if now - created_at <= self.ttl]
+            entries = [list(self._slots[slot]) for slot in slots]
+            vectors = self._matrix[slots] if slots else np.zeros((0, 0), dtype=np.float32)
+        meta = json.dumps({"fingerprint": fingerprint, "entries": entries}).encode("utf-8")
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez(tmp_path, meta=np.frombuffer(meta, dtype=np.uint8), vectors=vectors)
+        os.replace(tmp_path, path)
+        return len(entries)
+
+    def load(self, path, fingerprint):
+        """Add the entries of a file written by save(); files from another store are ignored"""
+        if not Path(path).exists():
+            return 0
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            vectors = data["vectors"]
+        if meta["fingerprint"] != fingerprint:
+            print(f"⚠️ {path} was built on a different vectorstore, not loading it")
+            return 0
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            # Oldest first, so the newest answers survive if the file holds more than max_entries
+            for (question, answer, created_at), vector in sorted(zip(meta["entries"], vectors), key=lambda e: e[0][2]):
+                if now - created_at <= self.ttl:
+                    self._put(normalize_question(question), question, answer, vector, created_at)
+                    loaded += 1
+        return loaded
+
+    def __len__(self):
+        return int(self._used.sum())
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,155 @@
+"""
+Single-flight deduplication of identical in-flight questions.
+
+When many users ask the same thing at once, only the first request starts
+an upstream call; the others join it and receive the same answer, token by
+token, as it streams. The upstream stream runs on its own worker (a thread,
+or an asyncio task for the backend) and every caller, the first one
+included, reads from a shared buffer, so one client going away never stalls
+the others.
+"""
+import asyncio
+import contextvars
+import hashlib
+import threading
+
+from utils.semantic_cache import normalize_text
+
+
+def flight_key(question, history=()):
+    """Requests only share a flight when the question and the conversation before it are equivalent"""
+    digest = hashlib.sha256(normalize_text(question).encode())
+    for message in history:
+        digest.update(b"\x00" + normalize_text(message.content).encode())
+    return digest.hexdigest()
+
+
+class _Flight:
+    def __init__(self, condition):
+        self.tokens = []
+        self.done = False
+        self.error = None
+        self.condition = condition
+        self.worker = None
+
+
+class _Counters:
+    def __init__(self):
+        self.calls = 0  # Upstream calls started
+        self.coalesced = 0  # Requests that joined a call already in flight
+        self.errors = 0
+
+    @property
+    def in_flight(self):
+        return len(self._flights)
+
+    def __str__(self):
+        return f"{self.calls} upstream calls, {self.coalesced} coalesced, {self.errors} failed"
+
+
+class SingleFlight(_Counters):
+    """Thread-based single flight for the Streamlit apps"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def stream(self, key, make_stream):
+        """
+        Yields the tokens of make_stream(), started at most once for all
+        concurrent callers with the same key.
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight(threading.Condition())
+                self.calls += 1
+                # The call runs in the first caller's context, so its tracing spans belong to that request
+                flight.worker = threading.Thread(target=contextvars.copy_context().run,
+                                                 args=(self._run, key, flight, make_stream), daemon=True)
+                flight.worker.start()
+            else:
+                self.coalesced += 1
+        return self._follow(flight)
+
+    def _run(self, key, flight, make_stream):
+        try:
+            for token in make_stream():
+                with flight.condition:
+                    flight.tokens.append(token)
+                    flight.condition.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Later requests start a fresh call; by then the answer is usually in the answer cache
+            with self._lock:
+                self._flights.pop(key, None)
+                self.errors += flight.error is not None
+            with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    @staticmethod
+    def _follow(flight):
+        seen = 0
+        while True:
+            with flight.condition:
+                flight.condition.wait_for(lambda: flight.done or len(flight.tokens) > seen)
+                new_tokens = flight.tokens[seen:]
+                done, error = flight.done, flight.error
+            seen += len(new_tokens)
+            yield from new_tokens
+            if done:
+                if error is not None:
+                    raise error
+                return
+
+
+class AsyncSingleFlight(_Counters):
+    """Asyncio single flight for backend.py; make_stream returns an async iterator"""
+
+    def __init__(self):
+        super().__init__()
+        self._flights = {}
+
+    def stream(self, key, make_stream):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.Condition())
+            self.calls += 1
+            flight.worker = asyncio.create_task(self._run(key, flight, make_stream))
+        else:
+            self.coalesced += 1
+        return self._follow(flight)
+
+    async def _run(self, key, flight, make_stream):
+        try:
+            async for token in make_stream():
+                async with flight.condition:
+                    flight.tokens.append(token)
+                    flight.condition.notify_all()
+        except Exception as e:
+            flight.error = e
+            self.errors += 1
+        finally:
+            self._flights.pop(key, None)
+            async with flight.condition:
+                flight.done = True
+                flight.condition.notify_all()
+
+    @staticmethod
+    async def _follow(flight):
+        seen = 0
+        while True:
+            async with flight.condition:
+                await flight.condition.wait_for(lambda: flight.done or len(flight.tokens) > seen)
+                new_tokens = flight.tokens[seen:]
+                done, error = flight.done, flight.error
+            seen += len(new_tokens)
+            for token in new_tokens:
+                yield token
+            if done:
+                if error is not None:
+                    raise error
+                return
@@ -1,12 +1,16 @@
-from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import OpenAIEmbeddings
+import getpass
 import os
+import sys
 from pathlib import Path
 from dotenv import load_dotenv
 # Define the DB path
 CURRENT_DIR = Path(__file__).parent
 DB_PATH = CURRENT_DIR.parent / "db" / "module4_vectorstore"
 
+sys.path.append(str(CURRENT_DIR.parent))
+from utils.qa_chain import load_vectorstore
+
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -14,9 +18,8 @@ if not os.getenv("OPENAI_API_KEY"):
         os.environ["OPENAI_API_KEY"] = getpass.getpass("Enter your OpenAI API key: ")
 
 
-# Load FAISS
-vectorstore = FAISS.load_local(str(DB_PATH), OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY),
-allow_dangerous_deserialization=True)
+# Load FAISS the same way the app does
+vectorstore = load_vectorstore(DB_PATH, OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY))
 
 # Test similarity search
 query = "What is filtering?"
@@ -0,0 +1,52 @@
+import re
+
+from pypdf import PdfReader
+
+MIN_TEXT_CHARS = 100  # Fewer characters than this usually means a scanned or image-only page
+MIN_LETTER_RATIO = 0.6  # Share of letters and spaces among non-blank characters
+MIN_WORD_RATIO = 0.5  # Share of whitespace-separated tokens that look like real words
+MAX_REPLACEMENT_RATIO = 0.01  # "�" marks glyphs pypdf could not map back to text
+
+WORD_PATTERN = re.compile(r"^[A-Za-z][A-Za-z'\-]{0,24}[.,;:!?)]*$")
+
+
+def is_usable_text(text):
+    """
+    Decide whether a page's embedded text layer can stand in for OCR.
+
+    Born-digital pages extract as plain prose; scanned pages extract as
+    nothing, and badly encoded fonts extract as symbols or glued-together
+    runs of characters, which all fail one of these checks.
+    """
+    stripped = text.strip()
+    if len(stripped) < MIN_TEXT_CHARS:
+        return False
+
+    if stripped.count("�") / len(stripped) > MAX_REPLACEMENT_RATIO:
+        return False
+
+    letters = sum(1 for ch in stripped if ch.isalpha() or ch.isspace())
+    if letters / len(stripped) < MIN_LETTER_RATIO:
+        return False
+
+    tokens = stripped.split()
+    words = sum(1 for token in tokens if WORD_PATTERN.match(token))
+    return words / len(tokens) >= MIN_WORD_RATIO
+
+
+def text_layer_pages(pdf_file):
+    """
+    Returns {page_number: text} for every page whose text layer passes
+    is_usable_text. Pages missing from the result need OCR.
+    """
+    reader = PdfReader(str(pdf_file))
+    pages = {}
+    for page_number, page in enumerate(reader.pages, start=1):
+        try:
+            text = page.extract_text() or ""
+        except Exception as e:
+            print(f"⚠️ Could not read the text layer of page {page_number}: {e}")
+            continue
+        if is_usable_text(text):
+            pages[page_number] = text
+    return pages
@@ -0,0 +1,29 @@
+"""
+Token counts for chat memory and the chunker.
+
+Uses tiktoken's encoding for TOKENIZER_MODEL; without tiktoken or its
+vocabulary (it is downloaded on first use) counts fall back to a
+characters / 4 estimate.
+"""
+TOKENIZER_MODEL = "gpt-4o-mini"
+
+
+def _load_encoding():
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # tiktoken missing or its vocabulary cannot be downloaded; fall back to an estimate
+        return None
+
+
+_ENCODING = _load_encoding()
+
+
+def count_tokens(text):
+    if _ENCODING is None:
+        return len(text) // 4 + 1
+    return len(_ENCODING.encode(text, disallowed_special=()))
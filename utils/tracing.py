@@ -0,0 +1,462 @@
+"""
+Per-request tracing of where the time of an answer goes.
+
+Every turn is one trace: a root span opened by the app or the backend
+around the request, with a child span per stage
+
+    rewrite        follow-up rephrasing (outcome: no_history, skipped, cache_hit, rewritten)
+    answer_cache   semantic answer cache lookup (cache: hit or miss)
+    embed_query    question embedding (cache: memory, disk or miss)
+    retrieve       the retriever, with the number of documents returned
+    search         the FAISS, BM25 or MMR search inside it
+    stuff_prompt   formatting the retrieved chunks into the QA prompt
+    answer         the answer chain: prompt stuffing plus the LLM call
+    llm            one chat model call: input, cached and output tokens, time to first token;
+                   named after the stage that made it (rewrite_llm, answer_llm) inside one
+
+Streamed chains start every step at once and feed it as input arrives, so
+there answer and stuff_prompt also cover the wait for retrieval; the LLM
+span starts once the prompt is complete.
+
+Stages in this repo's code open spans with span(). The LangChain stages
+(retrievers, the stuff-documents chain, chat model calls) are reported by
+TracingCallbackHandler, attached to the chains and chat models. The current
+span is a context variable, so spans follow a request into asyncio tasks,
+to_thread workers and single-flight worker threads.
+
+Finished traces are
+
+    counted   into Prometheus-style histograms and counters: the backend's
+              GET /metrics, or a small HTTP server on CAIA_METRICS_PORT for
+              the Streamlit apps
+    written   as one JSON line each to CAIA_TRACE_FILE, when it is set
+    printed   as a one-line stage summary when CAIA_TRACE_PRINT=1, for local debugging
+    profiled  when CAIA_PROFILE_SLOW_MS is set: the threads a trace runs on
+              are stack-sampled while it is open, and traces slower than
+              that write collapsed stacks (flamegraph.pl / speedscope input)
+              to CAIA_PROFILE_DIR. On the backend the event loop thread is
+              shared, so a profile can include other requests' work.
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from utils.prompt_usage import usage_counts
+
+TRACE_FILE = os.getenv("CAIA_TRACE_FILE")
+TRACE_PRINT = os.getenv("CAIA_TRACE_PRINT") == "1"
+METRICS_PORT = int(os.getenv("CAIA_METRICS_PORT") or 0)
+PROFILE_SLOW_MS = float(os.getenv("CAIA_PROFILE_SLOW_MS") or 0)  # 0 leaves the profiler off
+PROFILE_DIR = Path(os.getenv("CAIA_PROFILE_DIR", "profiles"))
+PROFILE_INTERVAL = 0.005  # Seconds between stack samples
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+TOKEN_KINDS = ("input", "cached", "output")
+# LangChain chain runs that are stages, by run name
+CHAIN_STAGES = {"format_inputs": "stuff_prompt", "stuff_documents_chain": "answer"}
+
+_current = contextvars.ContextVar("caia_span", default=None)
+
+
+class Span:
+    def __init__(self, trace, span_id, name, parent, attributes):
+        self.trace = trace
+        self.id = span_id
+        self.name = name
+        self.parent = parent.id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.thread = threading.get_ident()
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return (self.end or time.perf_counter()) - self.start
+
+
+class Trace:
+    def __init__(self, name, attributes):
+        self.id = uuid.uuid4().hex[:16]
+        self.started_at = time.time()
+        self.spans = []
+        self.threads = set()  # Threads any span ran on, for the profiler
+        self._lock = threading.Lock()
+        self.root = self.new_span(name, None, attributes)
+
+    def new_span(self, name, parent, attributes):
+        with self._lock:
+            span = Span(self, len(self.spans), name, parent, attributes)
+            self.spans.append(span)
+            self.threads.add(span.thread)
+        return span
+
+    def stages(self):
+        """[(stage, seconds, attributes summed over its spans)] in first-start order"""
+        stages = {}
+        for span in self.spans[1:]:
+            seconds, attributes = stages.get(span.name, (0.0, Counter()))
+            attributes.update({key: value for key, value in span.attributes.items()
+                               if key.endswith("_tokens") and isinstance(value, int)})
+            stages[span.name] = (seconds + span.seconds, attributes)
+        return [(name, seconds, attributes) for name, (seconds, attributes) in stages.items()]
+
+    def to_dict(self):
+        origin = self.root.start
+        return {
+            "trace_id": self.id,
+            "name": self.root.name,
+            "time": self.started_at,
+            "duration_ms": round(self.root.seconds * 1000, 2),
+            "attributes": self.root.attributes,
+            "spans": [{
+                "id": span.id,
+                "parent": span.parent,
+                "name": span.name,
+                "start_ms": round((span.start - origin) * 1000, 2),
+                "duration_ms": round(span.seconds * 1000, 2),
+                "attributes": span.attributes,
+            } for span in self.spans[1:]],
+        }
+
+    def __str__(self):
+        parts = []
+        for name, seconds, attributes in self.stages():
+            tokens = "/".join(str(attributes.get(f"{kind}_tokens", 0)) for kind in TOKEN_KINDS)
+            parts.append(f"{name} {seconds * 1000:.0f} ms" + (f" ({tokens} in/cached/out tokens)"
+                                                              if attributes else ""))
+        return f"{self.root.name} {self.root.seconds:.2f}s: " + ", ".join(parts)
+
+
+class Metrics:
+    """Prometheus-style stage latency histograms, token and cache counters, fed with finished traces"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self.latency = {}  # (trace, stage) -> [count per bucket..., +Inf count, sum]
+        self.tokens = Counter()  # (trace, stage, kind) -> tokens
+        self.cache = Counter()  # (trace, stage, result) -> lookups
+        self.errors = Counter()  # trace -> failed requests
+        self.rewrites = Counter()  # (trace, outcome) -> follow-up rewrite decisions
+        self.rewrite_seconds_saved = Counter()  # trace -> estimated seconds of skipped or cached rewrites
+        self.answers = Counter()  # (trace, coalesced) -> generated answers, own call or joined another's
+
+    def observe(self, trace):
+        name = trace.root.name
+        with self._lock:
+            for span in trace.spans:
+                stage = "total" if span is trace.root else span.name
+                row = self.latency.setdefault((name, stage), [0] * (len(self.buckets) + 2))
+                seconds = span.seconds
+                for i, bound in enumerate(self.buckets):
+                    row[i] += seconds <= bound
+                row[-2] += 1
+                row[-1] += seconds
+                for kind in TOKEN_KINDS:
+                    self.tokens[(name, stage, kind)] += span.attributes.get(f"{kind}_tokens", 0)
+                if "cache" in span.attributes:
+                    self.cache[(name, stage, span.attributes["cache"])] += 1
+                if span.name == "rewrite" and "outcome" in span.attributes:
+                    self.rewrites[(name, span.attributes["outcome"])] += 1
+                    self.rewrite_seconds_saved[name] += span.attributes.get("seconds_saved", 0.0)
+            self.errors[name] += "error" in trace.root.attributes
+            if "coalesced" in trace.root.attributes:
+                self.answers[(name, str(bool(trace.root.attributes["coalesced"])).lower())] += 1
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = ["# HELP caia_stage_seconds Time spent in each request stage",
+                 "# TYPE caia_stage_seconds histogram"]
+        with self._lock:
+            for (name, stage), row in sorted(self.latency.items()):
+                labels = f'trace="{name}",stage="{stage}"'
+                for bound, count in zip(self.buckets, row):
+                    lines.append(f'caia_stage_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'caia_stage_seconds_bucket{{{labels},le="+Inf"}} {row[-2]}')
+                lines.append(f"caia_stage_seconds_sum{{{labels}}} {row[-1]:.6f}")
+                lines.append(f"caia_stage_seconds_count{{{labels}}} {row[-2]}")
+            lines += ["# HELP caia_tokens_total LLM tokens by stage and kind (input, cached input, output)",
+                      "# TYPE caia_tokens_total counter"]
+            lines += [f'caia_tokens_total{{trace="{name}",stage="{stage}",kind="{kind}"}} {count}'
+                      for (name, stage, kind), count in sorted(self.tokens.items()) if count]
+            lines += ["# HELP caia_cache_lookups_total Cache lookups by stage and result",
+                      "# TYPE caia_cache_lookups_total counter"]
+            lines += [f'caia_cache_lookups_total{{trace="{name}",stage="{stage}",result="{result}"}} {count}'
+                      for (name, stage, result), count in sorted(self.cache.items())]
+            lines += ["# HELP caia_rewrites_total Follow-up rewrite decisions by outcome "
+                      "(no_history, skipped, cache_hit, rewritten)",
+                      "# TYPE caia_rewrites_total counter"]
+            lines += [f'caia_rewrites_total{{trace="{name}",outcome="{outcome}"}} {count}'
+                      for (name, outcome), count in sorted(self.rewrites.items())]
+            lines += ["# HELP caia_rewrite_seconds_saved_total Estimated LLM time saved by skipped and cached rewrites",
+                      "# TYPE caia_rewrite_seconds_saved_total counter"]
+            lines += [f'caia_rewrite_seconds_saved_total{{trace="{name}"}} {seconds:.6f}'
+                      for name, seconds in sorted(self.rewrite_seconds_saved.items())]
+            lines += ["# HELP caia_answers_total Generated answers, by whether they joined an identical call in flight",
+                      "# TYPE caia_answers_total counter"]
+            lines += [f'caia_answers_total{{trace="{name}",coalesced="{coalesced}"}} {count}'
+                      for (name, coalesced), count in sorted(self.answers.items())]
+            lines += ["# HELP caia_request_errors_total Requests that raised",
+                      "# TYPE caia_request_errors_total counter"]
+            lines += [f'caia_request_errors_total{{trace="{name}"}} {count}' for name, count in sorted(self.errors.items())]
+        return "\n".join(lines) + "\n"
+
+
+def collapse(frame):
+    """One stack as a flamegraph line: outermost frame first, frames separated by ;"""
+    names = []
+    while frame is not None:
+        names.append(f"{frame.f_code.co_name} ({Path(frame.f_code.co_filename).name})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stacks of the threads an open trace runs on every
+    `interval` seconds. One sampling thread serves every open trace, and
+    only runs while at least one is open.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._active = {}  # trace -> Counter of collapsed stacks
+        self._thread = None
+
+    def start(self, trace):
+        with self._lock:
+            self._active[trace] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self, trace):
+        with self._lock:
+            return self._active.pop(trace, None)
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                active = list(self._active.items())
+            frames = sys._current_frames()
+            for trace, stacks in active:
+                for thread in list(trace.threads):
+                    if thread != me and thread in frames:
+                        stacks[collapse(frames[thread])] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class Tracer:
+    def __init__(self, trace_file=TRACE_FILE, profile_slow_ms=PROFILE_SLOW_MS, profile_dir=PROFILE_DIR,
+                 print_summary=TRACE_PRINT):
+        self.metrics = Metrics()
+        self.trace_file = Path(trace_file) if trace_file else None
+        self.print_summary = print_summary
+        self.profile_slow_ms = profile_slow_ms
+        self.profile_dir = Path(profile_dir)
+        self.profiler = SamplingProfiler() if profile_slow_ms else None
+        self._file_lock = threading.Lock()
+
+    @contextmanager
+    def trace(self, name, **attributes):
+        """
+        Root span of one request. Inside another trace (a form request that
+        reuses the chat path, say) it is a child span of that trace instead.
+        """
+        if _current.get() is not None and _current.get().trace is not None:
+            with span(name, **attributes) as child:
+                yield child
+            return
+
+        trace = Trace(name, attributes)
+        token = _current.set(trace.root)
+        if self.profiler is not None:
+            self.profiler.start(trace)
+        try:
+            yield trace.root
+        except Exception as e:
+            trace.root.set(error=type(e).__name__)
+            raise
+        finally:
+            trace.root.finish()
+            _restore(token, None)
+            stacks = self.profiler.stop(trace) if self.profiler is not None else None
+            self._export(trace, stacks)
+
+    def _export(self, trace, stacks):
+        if stacks and trace.root.seconds * 1000 >= self.profile_slow_ms:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            path = self.profile_dir / f"{trace.root.name}-{trace.id}.folded"
+            path.write_text("".join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+            trace.root.set(profile=str(path))
+            print(f"🐢 {trace.root.name} took {trace.root.seconds:.2f}s; profile written to {path}")
+        self.metrics.observe(trace)
+        if self.print_summary:
+            print(f"⏱️ {trace}")
+        if self.trace_file is not None:
+            line = json.dumps(trace.to_dict(), default=str) + "\n"
+            with self._file_lock:
+                self.trace_file.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.trace_file, "a") as f:
+                    f.write(line)
+
+
+def _restore(token, previous):
+    # A generator finished from another context cannot reset its token; it only has to stop being current
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(previous)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Child span of the current span; outside any trace it records nothing"""
+    parent = _current.get()
+    if parent is None or parent.trace is None:
+        yield Span(None, 0, name, None, attributes)
+        return
+    current = parent.trace.new_span(name, parent, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        current.finish()
+        _restore(token, parent)
+
+
+def current_span():
+    return _current.get()
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """
+    Spans for the LangChain runs of the current trace: retrievers, the
+    prompt-stuffing and answer steps of the stuff-documents chain, and chat
+    model calls with their token usage and time to first token.
+    """
+
+    run_inline = True  # Called in the run's own thread and context, in order, from async chains too
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._spans = {}  # run id -> open span
+        self._parents = {}  # run id -> parent run id, for runs without a span of their own
+
+    def _start(self, name, run_id, parent_run_id, per_stage=False, **attributes):
+        with self._lock:
+            parent, run = None, parent_run_id
+            while parent is None and run is not None:
+                parent = self._spans.get(run)
+                run = self._parents.get(run)
+        parent = parent or _current.get()
+        if parent is None or parent.trace is None:
+            return
+        if per_stage and parent is not parent.trace.root:
+            name = f"{parent.name}_{name}"
+        current = parent.trace.new_span(name, parent, attributes)
+        with self._lock:
+            self._spans[run_id] = current
+
+    def _end(self, run_id, **attributes):
+        with self._lock:
+            current = self._spans.pop(run_id, None)
+            self._parents.pop(run_id, None)
+        if current is not None:
+            current.set(**attributes)
+            current.finish()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        stage = CHAIN_STAGES.get(kwargs.get("name"))
+        if stage is not None:
+            self._start(stage, run_id, parent_run_id)
+        else:
+            with self._lock:
+                self._parents[run_id] = parent_run_id
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_retriever_start(self, serialized, query, *, run_id, parent_run_id=None, **kwargs):
+        self._start("retrieve", run_id, parent_run_id, retriever=kwargs.get("name"))
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        self._end(run_id, documents=len(documents))
+
+    def on_retriever_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start("llm", run_id, parent_run_id, per_stage=True, model=(metadata or {}).get("ls_model_name"))
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        with self._lock:
+            current = self._spans.get(run_id)
+        if current is not None and "first_token_ms" not in current.attributes:
+            current.set(first_token_ms=round(current.seconds * 1000, 1))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = None
+        if response.generations and response.generations[0]:
+            usage = getattr(getattr(response.generations[0][0], "message", None), "usage_metadata", None)
+        input_tokens, cached_tokens, output_tokens = usage_counts(usage)
+        self._end(run_id, input_tokens=input_tokens, cached_tokens=cached_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=type(error).__name__)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = tracer.metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host="127.0.0.1"):
+    """GET /metrics on a background thread, for processes without the aiohttp backend"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📈 Metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+tracer = Tracer()
+callback_handler = TracingCallbackHandler()
@@ -0,0 +1,163 @@
+"""
+Pre-normalised embedding matrix for MMR retrieval.
+
+LangChain's FAISS MMR searches the index, reconstructs every candidate
+vector one at a time, normalises them and runs the MMR loop in Python on
+each query. Here the corpus is stored once, L2-normalised, as one contiguous
+float32 matrix (vectors.npy, memory-mapped, with the FAISS label of each row
+in vector_labels.npy). A query is one matrix-vector product for the
+candidate search, one (fetch_k x fetch_k) product for the candidate
+similarities, and k vectorised argmax steps for the diversity selection.
+
+A few k-means centroids of the same vectors (centroids.npy) summarise the
+store's topics for utils/module_registry.py, which compares questions
+against them to pick which module stores to search.
+
+Written by save_vectorstore_atomic; add them to an existing store with:
+
+    python utils/vector_matrix.py db/vectorstore
+"""
+import sys
+from pathlib import Path
+from typing import Any
+
+import faiss
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+if __name__ == "__main__":
+    sys.path.append(str(Path(__file__).parent.parent))
+
+from utils.tracing import span
+
+VECTORS_FILE = "vectors.npy"
+LABELS_FILE = "vector_labels.npy"
+MMR_FETCH_K = 20  # Same defaults as LangChain's max_marginal_relevance_search
+MMR_LAMBDA = 0.5  # 1 ranks by relevance only, 0 by diversity only
+CENTROIDS_FILE = "centroids.npy"
+ROUTING_CENTROIDS = 8  # Per store
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def write_vector_matrix(vectorstore, db_path):
+    """Save the normalised vectors of every stored chunk, in index_to_docstore_id order"""
+    labels = np.fromiter((int(label) for label in vectorstore.index_to_docstore_id), dtype=np.int64)
+    vectors = vectorstore.index.reconstruct_batch(labels) if len(labels) else np.zeros((0, vectorstore.index.d))
+    vectors = normalize_rows(vectors)
+    np.save(Path(db_path) / VECTORS_FILE, vectors)
+    np.save(Path(db_path) / LABELS_FILE, labels)
+    write_centroids(db_path, vectors)
+    return len(labels)
+
+
+def write_centroids(db_path, vectors, n_centroids=ROUTING_CENTROIDS):
+    """Save normalised spherical k-means centroids of the store's (normalised) vectors"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) <= n_centroids:
+        centroids = vectors
+    else:
+        kmeans = faiss.Kmeans(vectors.shape[1], n_centroids, niter=20, seed=0, spherical=True)
+        kmeans.cp.min_points_per_centroid = 1  # Small stores are fine; do not warn about them
+        kmeans.train(vectors)
+        centroids = kmeans.centroids
+    np.save(Path(db_path) / CENTROIDS_FILE, normalize_rows(centroids))
+
+
+def has_vector_matrix(db_path):
+    return (Path(db_path) / VECTORS_FILE).exists() and (Path(db_path) / LABELS_FILE).exists()
+
+
+class VectorMatrix:
+    """Cosine search and MMR selection over the memory-mapped matrix"""
+
+    def __init__(self, db_path):
+        self.vectors = np.load(Path(db_path) / VECTORS_FILE, mmap_mode="r")
+        self.labels = np.load(Path(db_path) / LABELS_FILE)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, query_vectors, k):
+        """
+        Top-k rows by cosine similarity for one query (dim,) or a batch
+        (n, dim): (positions, scores), best first.
+        """
+        queries = normalize_rows(query_vectors)
+        scores = queries @ self.vectors.T if queries.ndim == 2 else self.vectors @ queries
+        k = min(k, len(self.labels))
+        top = np.argpartition(scores, -k, axis=-1)[..., -k:]
+        top_scores = np.take_along_axis(scores, top, axis=-1)
+        order = np.argsort(-top_scores, axis=-1)
+        return np.take_along_axis(top, order, axis=-1), np.take_along_axis(top_scores, order, axis=-1)
+
+    def mmr(self, query_vector, k=5, fetch_k=MMR_FETCH_K, lambda_mult=MMR_LAMBDA):
+        """Labels of k rows picked by maximal marginal relevance among the fetch_k most similar"""
+        if not len(self.labels):
+            return []
+        positions, relevance = self.search(query_vector, max(k, fetch_k))
+        candidates = np.asarray(self.vectors[positions])
+        similarity = candidates @ candidates.T  # Candidate-to-candidate cosine, computed once
+
+        # The most relevant candidate always comes first
+        picked = [0]
+        redundancy = similarity[0].copy()  # Max similarity of each candidate to anything picked
+        available = np.ones(len(positions), dtype=bool)
+        available[0] = False
+        for _ in range(1, min(k, len(positions))):
+            scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+            scores[~available] = -np.inf
+            best = int(np.argmax(scores))
+            picked.append(best)
+            available[best] = False
+            np.maximum(redundancy, similarity[best], out=redundancy)
+        return self.labels[positions[picked]].tolist()
+
+
+class MatrixMMRRetriever(BaseRetriever):
+    """MMR retriever over a VectorMatrix, with documents from the store's docstore"""
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: Any
+    matrix: Any
+    k: int = 5
+    fetch_k: int = MMR_FETCH_K
+    lambda_mult: float = MMR_LAMBDA
+
+    def _documents(self, labels):
+        docs = []
+        for label in labels:
+            doc_id = self.vectorstore.index_to_docstore_id.get(label)
+            if doc_id is not None:
+                docs.append(self.vectorstore.docstore.search(doc_id))
+        return docs
+
+    def _search(self, vector):
+        with span("search", index="mmr"):
+            return self._documents(self.matrix.mmr(vector, self.k, self.fetch_k, self.lambda_mult))
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        return self._search(self.vectorstore._embed_query(query))
+
+    async def _aget_relevant_documents(self, query, *, run_manager=None):
+        return self._search(await self.vectorstore._aembed_query(query))
+
+
+def main():
+    from langchain_community.embeddings import FakeEmbeddings
+    from utils.qa_chain import load_vectorstore
+
+    for db_path in sys.argv[1:]:
+        # Vectors come straight from the index, so no embedding calls are made
+        n_vectors = write_vector_matrix(load_vectorstore(db_path, FakeEmbeddings(size=1)), db_path)
+        print(f"✅ Wrote normalised vector matrix and routing centroids for {n_vectors} chunks to {db_path}")
+
+
+if __name__ == "__main__":
+    main()